@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+from kpis import AMMORTAMENTI, calculate_kpis_grouped
+
+# Driver di ripartizione delle spese comuni: colonna dei KPI per appartamento usata come peso
+DRIVER_RIPARTIZIONE = {
+    'notti': 'notti_occupate',
+    'ricavi': 'ricavi_totali',
+    'quote_uguali': None,
+}
+
+# Colonne del conto economico, per immobile e per proprietario
+COLONNE_CONTO_ECONOMICO = [
+    'ricavi_totali', 'costi_variabili', 'spese_dirette', 'spese_ripartite', 'costi_fissi',
+    'costi_totali', 'EBITDA', 'ammortamenti', 'MOL',
+]
+
+
+def conto_economico_immobili(prenotazioni, notti_disponibili_filtrate, spese_nette, driver='notti',
+                             ammortamenti=AMMORTAMENTI):
+    """
+    Ripartisce le spese sugli immobili e calcola il conto economico (EBITDA e MOL) di ogni
+    immobile e di ogni proprietario, con le stesse formule di kpis.elabora_spese_ricavi.
+
+    Le spese con 'Immobile associato alla spesa' sono attribuite direttamente a quell'immobile;
+    le spese comuni (senza immobile) e gli ammortamenti sono ripartiti con il driver scelto:
+    notti occupate, ricavi totali o quote uguali tra gli immobili con prenotazioni. Se il
+    driver è nullo per tutti gli immobili la ripartizione avviene in quote uguali; senza
+    prenotazioni nel periodo le spese comuni restano non ripartite.
+
+    Tutti gli immobili sono calcolati insieme: una matrice immobili × settori per le spese
+    dirette e il prodotto esterno dei pesi per le spese comuni di ogni settore.
+
+    Parametri:
+        prenotazioni (DataFrame): prenotazioni filtrate.
+        notti_disponibili_filtrate (DataFrame): notti disponibili per appartamento.
+        spese_nette (DataFrame): spese filtrate dalla tabella netta (DatiWorkbook.spese_nette).
+        driver (str): chiave di DRIVER_RIPARTIZIONE.
+        ammortamenti (float): ammortamenti totali del periodo.
+
+    Ritorna:
+        tuple: (per_immobile, per_proprietario, per_settore)
+            - per_immobile: DataFrame con 'Nome Appartamento', 'Nome Proprietario' e COLONNE_CONTO_ECONOMICO.
+            - per_proprietario: DataFrame con 'Nome Proprietario' e COLONNE_CONTO_ECONOMICO.
+            - per_settore: DataFrame immobili × settori con le spese nette attribuite (dirette + ripartite).
+    """
+    if driver not in DRIVER_RIPARTIZIONE:
+        raise ValueError(f"Driver di ripartizione non valido: {driver}")
+
+    kpi = calculate_kpis_grouped(prenotazioni, notti_disponibili_filtrate, 'Nome Appartamento')
+    kpi['Nome Appartamento'] = kpi['Nome Appartamento'].astype(str)
+    kpi = kpi.set_index('Nome Appartamento')
+
+    immobile = spese_nette['Immobile associato alla spesa'].astype(object)
+    diretta = immobile.notna().to_numpy()
+    settore = spese_nette['Settore di spesa'].astype(object).fillna('NON CLASSIFICATO')
+    netto = spese_nette['netto'].fillna(0)
+
+    # Immobili con prenotazioni nel periodo, poi quelli che hanno solo spese dirette
+    immobili = kpi.index.union(pd.Index(immobile[diretta].astype(str).unique()), sort=False)
+    settori = pd.Index(settore.unique())
+
+    dirette = netto[diretta].groupby([immobile[diretta].astype(str), settore[diretta]]).sum()
+    dirette = dirette.unstack(fill_value=0).reindex(index=immobili, columns=settori, fill_value=0)
+    comuni = netto[~diretta].groupby(settore[~diretta]).sum().reindex(settori, fill_value=0)
+
+    pesi = _pesi(kpi, immobili, DRIVER_RIPARTIZIONE[driver])
+    ripartite = np.outer(pesi, comuni.to_numpy())
+
+    per_settore = pd.DataFrame(dirette.to_numpy() + ripartite, index=immobili, columns=settori)
+    per_settore.index.name = 'Nome Appartamento'
+
+    ricavi = kpi['ricavi_totali'].reindex(immobili, fill_value=0).to_numpy()
+    costi_variabili = kpi['totale_commissioni'].reindex(immobili, fill_value=0).to_numpy()
+    spese_dirette = dirette.to_numpy().sum(axis=1)
+    spese_ripartite = ripartite.sum(axis=1)
+    costi_fissi = spese_dirette + spese_ripartite
+    costi_totali = costi_variabili + costi_fissi
+    ebitda = ricavi - costi_totali
+    quota_ammortamenti = pesi * ammortamenti
+
+    # Proprietario dell'immobile: quello dell'ultima prenotazione del periodo
+    proprietari = prenotazioni.drop_duplicates('Nome Appartamento', keep='last')
+    proprietari = proprietari.set_index(proprietari['Nome Appartamento'].astype(str))['Nome Proprietario']
+
+    per_immobile = pd.DataFrame({
+        'Nome Appartamento': immobili,
+        'Nome Proprietario': proprietari.reindex(immobili).to_numpy(),
+        'ricavi_totali': ricavi,
+        'costi_variabili': costi_variabili,
+        'spese_dirette': spese_dirette,
+        'spese_ripartite': spese_ripartite,
+        'costi_fissi': costi_fissi,
+        'costi_totali': costi_totali,
+        'EBITDA': ebitda,
+        'ammortamenti': quota_ammortamenti,
+        'MOL': ebitda - quota_ammortamenti,
+    })
+    per_proprietario = per_immobile.groupby('Nome Proprietario', dropna=False)[COLONNE_CONTO_ECONOMICO].sum().reset_index()
+
+    return per_immobile, per_proprietario, per_settore.reset_index()
+
+
+def _pesi(kpi, immobili, colonna):
+    """
+    Quote di ripartizione degli immobili (somma 1 sugli immobili con prenotazioni, 0 per gli altri).
+    """
+    con_prenotazioni = immobili.isin(kpi.index)
+    if colonna is None:
+        pesi = con_prenotazioni.astype('float64')
+    else:
+        pesi = kpi[colonna].reindex(immobili, fill_value=0).fillna(0).clip(lower=0).to_numpy(dtype='float64')
+        if pesi.sum() == 0:
+            pesi = con_prenotazioni.astype('float64')
+
+    totale = pesi.sum()
+    return pesi / totale if totale else pesi
@@ -0,0 +1,164 @@
+import functools
+import hashlib
+import inspect
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Figure tenute in memoria (modificabile da variabile d'ambiente)
+MAX_GRAFICI = int(os.environ.get("PROPERTIZE_MAX_GRAFICI", "128"))
+
+
+@dataclass
+class StatisticheCache:
+    """
+    Contatori della cache dei grafici.
+    """
+    colpi: int
+    mancati: int
+    voci: int
+    max_voci: int
+
+
+class CacheGrafici:
+    """
+    Cache LRU delle figure Plotly, condivisa da tutte le sessioni del processo Streamlit.
+    """
+
+    def __init__(self, max_voci=MAX_GRAFICI):
+        self.max_voci = max_voci
+        self._voci = OrderedDict()
+        self._lock = threading.Lock()
+        self.colpi = 0
+        self.mancati = 0
+
+    def ottieni(self, chiave, costruisci):
+        """
+        Ritorna la figura della chiave; se assente la costruisce con costruisci() e la salva,
+        eliminando la voce usata meno di recente oltre max_voci. I risultati None (grafico
+        non disponibile) non vengono salvati, così eventuali avvisi vengono ripetuti.
+        """
+        with self._lock:
+            if chiave in self._voci:
+                self._voci.move_to_end(chiave)
+                self.colpi += 1
+                return self._voci[chiave]
+            self.mancati += 1
+
+        figura = costruisci()
+        if figura is not None:
+            with self._lock:
+                self._voci[chiave] = figura
+                self._voci.move_to_end(chiave)
+                while len(self._voci) > self.max_voci:
+                    self._voci.popitem(last=False)
+        return figura
+
+    def statistiche(self):
+        with self._lock:
+            return StatisticheCache(self.colpi, self.mancati, len(self._voci), self.max_voci)
+
+    def svuota(self):
+        with self._lock:
+            self._voci.clear()
+            self.colpi = self.mancati = 0
+
+
+CACHE_GRAFICI = CacheGrafici()
+
+
+def memorizza_grafico(costruttore=None, *, selezioni=()):
+    """
+    Decoratore dei costruttori di draw_charts: a parità di costruttore e di argomenti
+    (scalari per valore, DataFrame e array per impronta) ritorna la figura già costruita.
+
+    Gli argomenti in `selezioni` sono righe di DatiWorkbook.prenotazioni che il costruttore
+    usa solo tramite l'indice (es. con DatiWorkbook.notti): sono identificati dalle etichette
+    delle righe (vedi impronta_selezione), perché il contenuto è già coperto dall'impronta
+    per workbook dell'argomento `notti`, calcolata una volta.
+
+    Ogni chiamata riceve una copia della figura in cache: modificarla non altera le altre sessioni.
+    """
+    if costruttore is None:
+        return functools.partial(memorizza_grafico, selezioni=selezioni)
+    firma = inspect.signature(costruttore)
+
+    @functools.wraps(costruttore)
+    def costruttore_memorizzato(*args, **kwargs):
+        argomenti = firma.bind(*args, **kwargs)
+        argomenti.apply_defaults()
+        chiave = (costruttore.__qualname__, tuple(
+            (nome, impronta_selezione(valore) if nome in selezioni else impronta(valore))
+            for nome, valore in argomenti.arguments.items()
+        ))
+        figura = CACHE_GRAFICI.ottieni(chiave, lambda: costruttore(*args, **kwargs))
+        return None if figura is None else go.Figure(figura)
+
+    return costruttore_memorizzato
+
+
+def impronta_selezione(dati):
+    """
+    Impronta di una selezione di righe di DatiWorkbook.prenotazioni: numero e etichette delle
+    righe (estremi per un RangeIndex, SHA-256 delle etichette altrimenti), senza leggere le colonne.
+    """
+    indice = dati.index
+    if isinstance(indice, pd.RangeIndex):
+        return ('RangeIndex', indice.start, indice.stop, indice.step)
+    etichette = np.ascontiguousarray(indice.to_numpy())
+    if etichette.dtype == object:
+        etichette = pd.util.hash_array(etichette)
+    return ('righe', len(indice), str(etichette.dtype), hashlib.sha256(etichette.tobytes()).hexdigest())
+
+
+def impronta(valore):
+    """
+    Impronta economica e confrontabile di un argomento di un costruttore di grafici.
+
+    - DataFrame e Series: forma, colonne, tipi e SHA-256 degli hash di riga di pandas
+      (hash_pandas_object, indice compreso): conta il contenuto di ogni colonna, date,
+      categorie e testo inclusi, e l'ordine delle righe;
+    - array NumPy numerici: forma, tipo e SHA-256 di tutti i byte (gli argomenti array sono
+      piccoli: griglie degli scenari e istogrammi);
+    - liste, tuple e dict: impronta degli elementi;
+    - scalari e date: il valore (NaN normalizzato);
+    - oggetti con un'impronta del contenuto (DatiWorkbook.notti e disponibilita_giornaliera,
+      costruiti una volta per workbook): tipo e attributo `impronta`.
+
+    Gli altri oggetti sollevano TypeError: identificarli con id() darebbe figure sbagliate
+    quando Python riusa l'identità di un oggetto eliminato.
+    """
+    if isinstance(valore, pd.Series):
+        valore = valore.to_frame()
+    if isinstance(valore, pd.DataFrame):
+        righe = pd.util.hash_pandas_object(valore, index=True).to_numpy()
+        return (
+            'DataFrame',
+            valore.shape,
+            tuple(valore.columns),
+            tuple(str(tipo) for tipo in valore.dtypes),
+            hashlib.sha256(righe.tobytes()).hexdigest(),
+        )
+    if isinstance(valore, np.ndarray) and valore.dtype.kind in 'biufcmM':
+        contenuto = np.ascontiguousarray(valore).tobytes()
+        return ('ndarray', valore.shape, str(valore.dtype), hashlib.sha256(contenuto).hexdigest())
+    if isinstance(valore, (list, tuple)):
+        return (type(valore).__name__, tuple(impronta(elemento) for elemento in valore))
+    if isinstance(valore, dict):
+        return ('dict', tuple(sorted((chiave, impronta(elemento)) for chiave, elemento in valore.items())))
+    if isinstance(valore, np.generic):
+        valore = valore.item()
+    if isinstance(valore, float) and math.isnan(valore):
+        return ('nan',)
+    if valore is None or isinstance(valore, (str, int, float, bool, pd.Timestamp)) or hasattr(valore, 'isoformat'):
+        return valore
+    if isinstance(getattr(valore, 'impronta', None), str):
+        return (type(valore).__name__, valore.impronta)
+    raise TypeError(f"Argomento non memorizzabile nella cache dei grafici: {type(valore).__name__}")
+
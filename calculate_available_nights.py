@@ -1,39 +1,215 @@
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
 import pandas as pd
 
-def calculate_available_nigths(file_path, start_date, end_date):
+from locale_parsing import parse_date
+from motori_lettura import motore_pandas
+
+
+def elabora_disponibilita(disponibilita):
+    """
+    Converte in date le colonne dei periodi del Foglio 2 (tutte tranne la prima, l'appartamento).
+
+    Le celle già in formato data restano invariate; il testo degli export CSV viene convertito
+    con il formato giorno/mese/anno riconosciuto da parse_date.
+    """
+    disponibilita = disponibilita.copy()
+    for col in disponibilita.columns[1:]:
+        disponibilita[col], _ = parse_date(disponibilita[col])
+    return disponibilita
+
+
+@dataclass(frozen=True)
+class IntervalliDisponibilita:
+    """
+    Periodi di disponibilità del Foglio 2 in formato lungo, costruiti una volta al caricamento.
+    """
+    appartamenti: np.ndarray  # appartamento di ogni riga del Foglio 2 (prima colonna)
+    tabella: pd.DataFrame     # un periodo per riga: appartamento, data_inizio, data_fine (NaT se mancanti)
+    riga: np.ndarray          # riga del Foglio 2 di ogni periodo completo
+    inizio: np.ndarray        # giorno di inizio dei periodi completi (giorni dal 1970, int64)
+    fine: np.ndarray          # giorno di fine dei periodi completi (giorni dal 1970, int64)
+
+
+def costruisci_intervalli(disponibilita):
+    """
+    Trasforma il Foglio 2 (appartamento seguito da coppie Data inizio/Data fine) nella tabella
+    lunga dei periodi, con una sola conversione vettoriale per colonna.
+
+    Parametri:
+        disponibilita (DataFrame): Foglio 2 già letto (vedi elabora_disponibilita).
+
+    Ritorna:
+        IntervalliDisponibilita con la tabella dei periodi e gli array dei periodi completi.
+    """
+    periodi = disponibilita.iloc[:, 1:].apply(pd.to_datetime, errors='coerce')
+    if periodi.shape[1] % 2:
+        # Ultima coppia senza data di fine
+        periodi[len(periodi.columns)] = pd.NaT
+    inizio = periodi.iloc[:, 0::2].to_numpy(dtype='datetime64[ns]')
+    fine = periodi.iloc[:, 1::2].to_numpy(dtype='datetime64[ns]')
+
+    appartamenti = disponibilita.iloc[:, 0].to_numpy(dtype=object) if disponibilita.shape[1] else np.empty(0, dtype=object)
+    coppie = inizio.shape[1]
+    tabella = pd.DataFrame({
+        'appartamento': np.repeat(appartamenti, coppie),
+        'data_inizio': inizio.ravel(),
+        'data_fine': fine.ravel(),
+    })
+
+    # Solo i periodi con entrambe le date contribuiscono alle notti
+    validi = ~(np.isnat(inizio) | np.isnat(fine))
+    riga = np.broadcast_to(np.arange(len(appartamenti))[:, None], inizio.shape)[validi]
+    return IntervalliDisponibilita(
+        appartamenti=appartamenti,
+        tabella=tabella,
+        riga=riga,
+        inizio=inizio[validi].astype('datetime64[D]').astype('int64'),
+        fine=fine[validi].astype('datetime64[D]').astype('int64'),
+    )
+
+
+def calculate_available_nigths(disponibilita, start_date, end_date):
     """
     Calcola il numero totale di notti disponibili per ogni appartamento
     nel periodo specificato dai filtri.
+
+    Ogni periodo viene limitato a [start_date, end_date] (estremi inclusi) con operazioni
+    vettoriali su tutti i periodi insieme, poi sommato per riga del Foglio 2.
+
+    Parametri:
+        disponibilita: DisponibilitaGiornaliera (DatiWorkbook.disponibilita_giornaliera, differenza
+                       di due colonne delle somme cumulate), IntervalliDisponibilita
+                       (DatiWorkbook.intervalli), il Foglio 2 già letto oppure il file Excel.
+        start_date, end_date: estremi del periodo selezionato.
+
+    Ritorna:
+        DataFrame con le colonne 'Appartamento' e 'Notti Disponibili', una riga per riga del Foglio 2.
+    """
+    if isinstance(disponibilita, DisponibilitaGiornaliera):
+        return pd.DataFrame({
+            'Appartamento': disponibilita.appartamenti,
+            'Notti Disponibili': notti_disponibili_per_riga(disponibilita, start_date, end_date).astype('int64'),
+        })
+
+    if not isinstance(disponibilita, IntervalliDisponibilita):
+        if not isinstance(disponibilita, pd.DataFrame):
+            # Legge il Foglio 2 del file Excel
+            disponibilita = pd.read_excel(disponibilita, sheet_name=1, engine=motore_pandas(disponibilita))
+        disponibilita = costruisci_intervalli(disponibilita)
+
+    inizio, fine = _giorno(start_date), _giorno(end_date)
+    notti = np.minimum(disponibilita.fine, fine) - np.maximum(disponibilita.inizio, inizio) + 1
+    np.clip(notti, 0, None, out=notti)
+
+    totali = np.bincount(disponibilita.riga, weights=notti, minlength=len(disponibilita.appartamenti))
+    return pd.DataFrame({
+        'Appartamento': disponibilita.appartamenti,
+        'Notti Disponibili': totali.astype('int64'),
+    })
+
+
+@dataclass(frozen=True)
+class DisponibilitaGiornaliera:
+    """
+    Disponibilità giornaliera per riga del Foglio 2 con le somme cumulate lungo i giorni.
+
+    Le notti disponibili di un intervallo [inizio, fine] sono cumulata[:, fine + 1] - cumulata[:, inizio]
+    (giorni contati da primo_giorno), per qualsiasi insieme di appartamenti.
+    """
+    appartamenti: np.ndarray  # appartamento di ogni riga del Foglio 2
+    primo_giorno: int         # giorno della prima colonna (giorni dal 1970)
+    matrice: np.ndarray       # uint8 righe × giorni: periodi che coprono il giorno (0 o 1 senza sovrapposizioni)
+    cumulata: np.ndarray      # int32 righe × (giorni + 1): notti disponibili prima di ogni giorno
+
+    @cached_property
+    def impronta(self):
+        """
+        SHA-256 del contenuto (appartamenti, primo giorno e matrice; la cumulata ne deriva),
+        calcolato alla prima richiesta e usato come chiave della cache dei grafici.
+        """
+        impronta = hashlib.sha256(pd.util.hash_array(np.asarray(self.appartamenti, dtype=object)).tobytes())
+        impronta.update(str((self.primo_giorno, self.matrice.shape)).encode())
+        impronta.update(np.ascontiguousarray(self.matrice).tobytes())
+        return impronta.hexdigest()
+
+
+def costruisci_disponibilita_giornaliera(intervalli):
+    """
+    Costruisce la matrice appartamenti × giorni sull'arco di date del Foglio 2 e le sue somme cumulate.
+
+    I giorni coperti da più periodi contano una volta per periodo, come in calculate_available_nigths.
+
+    Parametri:
+        intervalli (IntervalliDisponibilita): periodi costruiti da costruisci_intervalli.
+
+    Ritorna:
+        DisponibilitaGiornaliera.
     """
-    # Legge il Foglio 2 del file Excel
-    disponibilita = pd.read_excel(file_path, sheet_name=1)
+    righe = len(intervalli.appartamenti)
+    # I periodi con fine precedente all'inizio non hanno notti
+    validi = intervalli.fine >= intervalli.inizio
+    riga, inizio, fine = intervalli.riga[validi], intervalli.inizio[validi], intervalli.fine[validi]
+    primo_giorno = int(inizio.min()) if len(inizio) else 0
+    giorni = int(fine.max()) - primo_giorno + 1 if len(fine) else 0
 
-    # Dizionario per salvare le notti disponibili per ogni appartamento
-    notti_disponibili = []
+    # Differenze: +1 il giorno di inizio, -1 il giorno dopo la fine, poi somma lungo i giorni
+    differenze = np.zeros((righe, giorni + 1), dtype='int16')
+    np.add.at(differenze, (riga, inizio - primo_giorno), 1)
+    np.add.at(differenze, (riga, fine - primo_giorno + 1), -1)
+    matrice = differenze[:, :-1].cumsum(axis=1).astype('uint8')
 
-    for index, row in disponibilita.iterrows():
-        appartamento = row[0]  # Nome dell'appartamento nella prima colonna
-        totale_notti = 0
+    cumulata = np.zeros((righe, giorni + 1), dtype='int32')
+    np.cumsum(matrice, axis=1, out=cumulata[:, 1:])
+    return DisponibilitaGiornaliera(intervalli.appartamenti, primo_giorno, matrice, cumulata)
 
-        # Itera sulle colonne in coppie (Data inizio, Data fine)
-        for i in range(1, len(row), 2):  # Parte dalla seconda colonna e salta di 2
-            data_inizio = row[i]
-            data_fine = row[i + 1] if i + 1 < len(row) else None
 
-            # Controlla se entrambe le date sono valide
-            if pd.notnull(data_inizio) and pd.notnull(data_fine):
-                data_inizio = pd.to_datetime(data_inizio, errors='coerce')
-                data_fine = pd.to_datetime(data_fine, errors='coerce')
+def notti_disponibili_per_riga(disponibilita, start_date, end_date):
+    """
+    Notti disponibili di ogni riga del Foglio 2 in [start_date, end_date], da due colonne delle somme cumulate.
+    """
+    inizio, fine = _colonne_intervallo(disponibilita, _giorno(start_date), _giorno(end_date))
+    return disponibilita.cumulata[:, fine] - disponibilita.cumulata[:, inizio]
 
-                # Filtra le date che rientrano nell'intervallo selezionato
-                if data_inizio and data_fine:
-                    intervallo_inizio = max(data_inizio, pd.Timestamp(start_date))
-                    intervallo_fine = min(data_fine, pd.Timestamp(end_date))
-                    notti = (intervallo_fine - intervallo_inizio).days + 1
-                    totale_notti += max(notti, 0)  # Solo notti positive
 
-        # Salva il risultato per l'appartamento
-        notti_disponibili.append({"Appartamento": appartamento, "Notti Disponibili": totale_notti})
+def notti_per_periodo(disponibilita, inizi, fini, appartamenti=None):
+    """
+    Notti disponibili complessive per ogni periodo [inizi[i], fini[i]] (estremi inclusi).
+
+    Parametri:
+        disponibilita (DisponibilitaGiornaliera): disponibilità del workbook.
+        inizi, fini: date di inizio e fine dei periodi (es. mesi o settimane).
+        appartamenti (list): appartamenti da includere (None = tutti).
+
+    Ritorna:
+        array int64 con le notti disponibili di ogni periodo.
+    """
+    cumulata = disponibilita.cumulata
+    if appartamenti is not None:
+        cumulata = cumulata[np.isin(disponibilita.appartamenti, list(appartamenti))]
+    totale = cumulata.sum(axis=0, dtype='int64')
+    inizio, fine = _colonne_intervallo(disponibilita, _giorno(inizi), _giorno(fini))
+    return totale[fine] - totale[inizio]
+
 
-    # Converti il risultato in un DataFrame
-    return pd.DataFrame(notti_disponibili)
+def _giorno(date):
+    """
+    Converte una data o una sequenza di date in giorni dal 1970 (int64).
+    """
+    if np.ndim(date) == 0:
+        return np.datetime64(pd.Timestamp(date), 'D').astype('int64')
+    return np.asarray(pd.to_datetime(date)).astype('datetime64[D]').astype('int64')
+
+
+def _colonne_intervallo(disponibilita, inizi, fini):
+    """
+    Converte i giorni (vedi _giorno) in colonne delle somme cumulate, limitate all'arco di date della matrice.
+    """
+    giorni = disponibilita.cumulata.shape[1] - 1
+    inizio = np.clip(inizi - disponibilita.primo_giorno, 0, giorni)
+    fine = np.clip(fini - disponibilita.primo_giorno + 1, 0, giorni)
+    # Periodi vuoti o invertiti: nessuna notte
+    return inizio, np.maximum(fine, inizio)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+# Pixel orizzontali per punto disegnato: il budget di punti di una serie è larghezza / PIXEL_PER_PUNTO
+PIXEL_PER_PUNTO = 3
+
+# Oltre questo numero di punti dei dati di una figura (prima del sottocampionamento)
+# le tracce passano a WebGL (Scattergl)
+SOGLIA_WEBGL = 1500
+
+
+def punti_per_larghezza(larghezza, pixel_per_punto=PIXEL_PER_PUNTO):
+    """
+    Budget di punti per serie di un grafico largo `larghezza` pixel (almeno 3, primo, ultimo e un punto interno).
+    """
+    return max(3, int(larghezza) // pixel_per_punto)
+
+
+def lttb(x, y, punti):
+    """
+    Sottocampionamento Largest-Triangle-Three-Buckets: sceglie `punti` indici della serie
+    che ne conservano la forma (picchi e valli inclusi).
+
+    Primo e ultimo punto sono sempre tenuti; i punti interni sono divisi in punti - 2 gruppi
+    consecutivi e da ogni gruppo si tiene il punto che forma il triangolo di area massima con
+    il punto scelto nel gruppo precedente e con la media del gruppo successivo. Il ciclo è sui
+    gruppi (al più `punti`), le aree di ogni gruppo sono calcolate insieme con NumPy.
+
+    Parametri:
+        x (array): ascisse crescenti, numeriche.
+        y (array): valori finiti.
+        punti (int): punti da tenere.
+
+    Ritorna:
+        array int degli indici scelti, crescenti (tutti gli indici se la serie ha al più `punti` punti).
+    """
+    n = len(x)
+    if punti >= n or punti < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # Confini dei gruppi dei punti interni [1, n - 1); l'ultimo "gruppo successivo" è l'ultimo punto
+    bordi = np.append(np.linspace(1, n - 1, punti - 1).astype('int64'), n)
+
+    indici = np.empty(punti, dtype='int64')
+    indici[0], indici[-1] = 0, n - 1
+    scelto = 0
+    for gruppo in range(punti - 2):
+        inizio, fine = bordi[gruppo], bordi[gruppo + 1]
+        media_x = x[fine:bordi[gruppo + 2]].mean()
+        media_y = y[fine:bordi[gruppo + 2]].mean()
+
+        # Doppio dell'area dei triangoli (punto scelto, candidato, media del gruppo successivo)
+        aree = np.abs(
+            (x[scelto] - media_x) * (y[inizio:fine] - y[scelto])
+            - (x[scelto] - x[inizio:fine]) * (media_y - y[scelto])
+        )
+        scelto = inizio + int(aree.argmax())
+        indici[gruppo + 1] = scelto
+
+    return indici
+
+
+def campiona_serie(x, y, punti):
+    """
+    Applica lttb a una serie temporale o numerica e ritorna i punti scelti.
+
+    Le date sono convertite in nanosecondi per il calcolo delle aree. Se la serie va ridotta,
+    i valori mancanti sono esclusi prima del campionamento; altrimenti la serie è ritornata intera.
+
+    Parametri:
+        x (array o Series): ascisse (date o numeri) crescenti.
+        y (array o Series): valori.
+        punti (int): budget di punti (vedi punti_per_larghezza).
+
+    Ritorna:
+        tuple: (x, y) come array NumPy con al più `punti` elementi.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype='float64')
+    if len(x) <= punti:
+        return x, y
+
+    validi = np.flatnonzero(np.isfinite(y))
+    ascisse = x[validi]
+    if np.issubdtype(ascisse.dtype, np.datetime64):
+        ascisse = ascisse.astype('datetime64[ns]').astype('int64')
+    elif ascisse.dtype == object:
+        ascisse = pd.to_datetime(ascisse).to_numpy('datetime64[ns]').astype('int64')
+
+    scelti = validi[lttb(ascisse, y[validi], punti)]
+    return x[scelti], y[scelti]
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+from kpis import COLONNE_BLOCCO, COLONNE_KPI, KPI, blocco_kpi, deriva_kpi
+
+# Aliquota IVA (%) usata negli scorpori, come il fattore 1.22 di kpis.deriva_kpi
+ALIQUOTA_IVA = 22
+
+# Importi delle prenotazioni convertiti in centesimi: colonne dei KPI e dell'estratto proprietari
+COLONNE_CENTESIMI = COLONNE_KPI + ['Cedolare secca', 'Commissioni Proprietari Nette']
+
+# Colonne dell'estratto conto per proprietario
+COLONNE_PROPRIETARI = ['Commissioni Proprietari Lorde', 'Cedolare secca', 'Commissioni Proprietari Nette']
+
+
+def in_centesimi(valori):
+    """
+    Converte importi in euro (float) in centesimi int64, arrotondando al centesimo più vicino.
+    I valori mancanti valgono 0, come nelle somme dei KPI.
+    """
+    return np.rint(np.nan_to_num(np.asarray(valori, dtype='float64')) * 100).astype('int64')
+
+
+def dividi_arrotondando(numeratore, denominatore):
+    """
+    Divisione intera arrotondata al più vicino, con le metà lontano dallo zero (arrotondamento
+    commerciale). Funziona su interi Python (senza limiti) e su array int64; denominatore positivo.
+    """
+    quoziente = (2 * abs(numeratore) + denominatore) // (2 * denominatore)
+    if isinstance(numeratore, np.ndarray):
+        return np.where(numeratore < 0, -quoziente, quoziente)
+    return -quoziente if numeratore < 0 else quoziente
+
+
+def scorpora_iva(lordo, aliquota=ALIQUOTA_IVA):
+    """
+    Imponibile in centesimi di un importo lordo IVA inclusa; l'IVA è la differenza, così
+    imponibile e IVA sommano sempre al lordo.
+    """
+    return dividi_arrotondando(lordo * 100, 100 + aliquota)
+
+
+def blocco_centesimi(data):
+    """
+    Blocco di kpis.blocco_kpi in int64, con gli importi di COLONNE_KPI in centesimi: le somme
+    (anche come differenze di somme cumulate) sono esatte per qualsiasi numero di prenotazioni.
+    """
+    blocco = blocco_kpi(data)
+    blocco[:, :len(COLONNE_KPI)] *= 100
+    return np.rint(blocco).astype('int64')
+
+
+def somme_in_euro(somme):
+    """
+    Somme di un blocco in centesimi (vedi blocco_centesimi) come dict di COLONNE_BLOCCO per
+    kpis.deriva_kpi, con gli importi riportati in euro.
+    """
+    return {col: euro(valore) if col in COLONNE_KPI else valore for col, valore in zip(COLONNE_BLOCCO, somme)}
+
+
+def costruisci_centesimi(prenotazioni):
+    """
+    Converte gli importi delle prenotazioni in centesimi int64 ed esegue gli scorpori IVA
+    riga per riga (una prenotazione = un documento), con arrotondamento commerciale.
+
+    Parametri:
+        prenotazioni (DataFrame): prenotazioni elaborate (DatiWorkbook.prenotazioni).
+
+    Ritorna:
+        DataFrame int64 con l'indice delle prenotazioni: le colonne di COLONNE_CENTESIMI presenti,
+        'Ricavi Pulizie imponibile', 'Commissioni OTA imponibile' e 'IVA Commissioni OTA'.
+    """
+    tabella = pd.DataFrame(
+        {col: in_centesimi(prenotazioni[col]) for col in COLONNE_CENTESIMI if col in prenotazioni.columns},
+        index=prenotazioni.index,
+    )
+    tabella['Ricavi Pulizie imponibile'] = scorpora_iva(tabella['Ricavi Pulizie'].to_numpy())
+    tabella['Commissioni OTA imponibile'] = scorpora_iva(tabella['Commissioni OTA'].to_numpy())
+    # IVA a credito sulle commissioni OTA, calcolata sul lordo come in deriva_kpi
+    tabella['IVA Commissioni OTA'] = dividi_arrotondando(tabella['Commissioni OTA'].to_numpy() * ALIQUOTA_IVA, 100)
+    return tabella
+
+
+def calculate_kpis_centesimi(centesimi, data, notti_disponibili_filtrate):
+    """
+    Calcola i KPI di calculate_kpis con gli importi esatti al centesimo.
+
+    Gli importi delle prenotazioni filtrate sono sommati in int64; ricavi, commissioni,
+    marginalità e IVA sono derivati con aritmetica intera (interi Python, senza overflow)
+    e convertiti in euro solo alla fine. Notti, conteggi e medie sono quelli di calculate_kpis.
+
+    Parametri:
+        centesimi (DataFrame): importi in centesimi del workbook (DatiWorkbook.centesimi).
+        data (DataFrame): prenotazioni filtrate, con l'indice di DatiWorkbook.prenotazioni.
+        notti_disponibili_filtrate (DataFrame): notti disponibili per appartamento.
+
+    Ritorna:
+        KPI con gli importi esatti.
+    """
+    somme = {col: int(valore) for col, valore in centesimi.loc[data.index].sum(axis=0).items()}
+
+    totale_ricavi_locazione = somme['Ricavi Locazione'] - somme['IVA Provvigioni PM']
+    totale_ricavi_pulizie = somme['Ricavi Pulizie imponibile']
+    commissioni_ota = somme['Commissioni OTA imponibile']
+    commissioni_itw = somme['Commissioni ITW Nette']
+    commissioni_proprietari = somme['Commissioni Proprietari Lorde']
+
+    # Quota delle commissioni OTA sulle locazioni, ripartita in proporzione ai ricavi lordi
+    ricavi_lordi = somme['Ricavi Locazione'] + somme['Ricavi Pulizie']
+    commissioni_ota_locazioni = (
+        dividi_arrotondando(commissioni_ota * somme['Ricavi Locazione'], ricavi_lordi) if ricavi_lordi > 0 else 0
+    )
+    marginalità_locazioni = totale_ricavi_locazione - commissioni_ota_locazioni - commissioni_proprietari
+    marginalità_pulizie = totale_ricavi_pulizie - (commissioni_ota - commissioni_ota_locazioni)
+
+    IVA_Totale_credito = somme['IVA Commissioni ITW'] + somme['IVA Commissioni OTA']
+    IVA_Totale_Debito = somme['IVA Provvigioni PM']
+    altri_costi = somme['costo_scorte_ps'] + somme['costo_manutenzioni_ps']
+
+    esatti = dict(
+        totale_ricavi_locazione=totale_ricavi_locazione,
+        totale_ricavi_pulizie=totale_ricavi_pulizie,
+        ricavi_totali=totale_ricavi_locazione + totale_ricavi_pulizie,
+        commissioni_ota=commissioni_ota,
+        commissioni_itw=commissioni_itw,
+        commissioni_proprietari=commissioni_proprietari,
+        totale_commissioni=commissioni_ota + commissioni_itw + commissioni_proprietari,
+        marginalità_locazioni=marginalità_locazioni,
+        marginalità_pulizie=marginalità_pulizie,
+        marginalità_totale=marginalità_locazioni + marginalità_pulizie,
+        IVA_Totale_credito=IVA_Totale_credito,
+        IVA_Totale_Debito=IVA_Totale_Debito,
+        Saldo_IVA=IVA_Totale_Debito - IVA_Totale_credito,
+        costo_pulizie_ps_totali=somme['costo_pulizie_ps'],
+        costo_scorte_ps_totali=somme['costo_scorte_ps'],
+        costo_manutenzioni_ps_totali=somme['costo_manutenzioni_ps'],
+        altri_costi=altri_costi,
+        marginalità_immobile=(
+            marginalità_locazioni + marginalità_pulizie - somme['costo_pulizie_ps'] - altri_costi
+        ),
+    )
+
+    somme_blocco = dict(zip(COLONNE_BLOCCO, blocco_kpi(data).sum(axis=0)))
+    kpi = deriva_kpi(somme_blocco, notti_disponibili_filtrate['Notti Disponibili'].sum())
+    kpi.update({campo: euro(valore) for campo, valore in esatti.items()})
+    return KPI(**kpi)
+
+
+def totali_proprietari_centesimi(centesimi, data):
+    """
+    Estratto conto per proprietario: somme in centesimi delle commissioni lorde, della
+    cedolare secca e delle commissioni nette delle prenotazioni filtrate.
+
+    Ritorna:
+        DataFrame con 'Nome Proprietario' e le colonne di COLONNE_PROPRIETARI presenti (int64, centesimi).
+    """
+    colonne = [col for col in COLONNE_PROPRIETARI if col in centesimi.columns]
+    return centesimi.loc[data.index, colonne].groupby(data['Nome Proprietario'], observed=True).sum().reset_index()
+
+
+def euro(centesimi):
+    """
+    Converte centesimi in euro per la visualizzazione.
+    """
+    return centesimi / 100
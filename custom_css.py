@@ -37,6 +37,38 @@ def inject_custom_css():
             margin-bottom: 20px; /* Spazio tra colonne */
         }
 
+        /* Anelli dei KPI disegnati in SVG (draw_charts.create_anelli_kpi) */
+        .anelli-kpi {
+            display: flex;
+            gap: 12px;
+            margin-bottom: 12px;
+        }
+        .anelli-colonna {
+            flex-direction: column;
+        }
+        .anelli-riga {
+            flex-direction: row;
+            justify-content: space-around;
+        }
+        .anello-kpi {
+            display: flex;
+            align-items: center;
+            gap: 16px;
+        }
+        .anelli-riga .anello-kpi {
+            flex-direction: column;
+            text-align: center;
+            gap: 4px;
+        }
+        .anello-etichetta {
+            font-size: 14px;
+            color: rgba(49, 51, 63, 0.8);
+        }
+        .anello-valore {
+            font-size: 1.75rem;
+            line-height: 1.2;
+        }
+
         /* Stile per l'icona info */
         .info-icon {
             font-size: 12px;
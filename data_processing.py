@@ -1,5 +1,47 @@
+import numpy as np
 import pandas as pd
 
+from locale_parsing import parse_date, parse_numeri
+from motori_lettura import motore_pandas
+
+# Nomi delle colonne B,C,D,G,H,I,J,O,P,Q,R,U,V,W,X,AA,AB,AC,AJ,AK,AL del Foglio 1
+COLONNE_PRENOTAZIONI = [
+    'ID Appartamento',
+    'Nome Appartamento',
+    'Nome Proprietario',
+    'Data Check-In',
+    'Data Check-Out',
+    'Ricavi Locazione',
+    'Ricavi Pulizie',
+    'Tassa di Soggiorno',
+    'OTA',
+    'OTA Lordo/Netta',
+    'Commissioni OTA',
+    'Commissioni ITW Nette',
+    'IVA Commissioni ITW',
+    'Commissioni ITW Lorde',
+    'Costi di incasso',
+    'Provvigioni PM Nette',
+    'IVA Provvigioni PM',
+    'Provvigioni PM Lorde',
+    'Commissioni Proprietari Lorde',
+    'Cedolare secca',
+    'Commissioni Proprietari Nette'
+]
+
+COLONNE_NUMERICHE = [
+    'Ricavi Locazione', 'Ricavi Pulizie', 'Tassa di Soggiorno',
+    'Commissioni OTA', 'Commissioni ITW Nette', 'IVA Commissioni ITW',
+    'Commissioni ITW Lorde', 'Costi di incasso', 'Provvigioni PM Nette',
+    'IVA Provvigioni PM', 'Provvigioni PM Lorde', 'Commissioni Proprietari Lorde',
+    'Cedolare secca', 'Commissioni Proprietari Nette'
+]
+
+COLONNE_DATA = ['Data Check-In', 'Data Check-Out']
+
+# Durata massima di un soggiorno (notti): durate oltre questo limite o negative sono date errate
+MAX_NOTTI_SOGGIORNO = 366
+
 
 def load_and_preprocess_data(uploaded_file):
     data = pd.read_excel(
@@ -7,56 +49,69 @@ def load_and_preprocess_data(uploaded_file):
         sheet_name=0,
         usecols="B,C,D,G,H,I,J,O,P,Q,R,U,V,W,X,AA,AB,AC,AJ,AK,AL",
         dtype=str,
-        engine="openpyxl"
+        engine=motore_pandas(uploaded_file)
     )
+    return preprocess_data(data)
 
-    data.columns = [
-        'ID Appartamento',
-        'Nome Appartamento',
-        'Nome Proprietario',
-        'Data Check-In',
-        'Data Check-Out',
-        'Ricavi Locazione',
-        'Ricavi Pulizie',
-        'Tassa di Soggiorno',
-        'OTA',
-        'OTA Lordo/Netta',
-        'Commissioni OTA',
-        'Commissioni ITW Nette',
-        'IVA Commissioni ITW',
-        'Commissioni ITW Lorde',
-        'Costi di incasso',
-        'Provvigioni PM Nette',
-        'IVA Provvigioni PM',
-        'Provvigioni PM Lorde',
-        'Commissioni Proprietari Lorde',
-        'Cedolare secca',
-        'Commissioni Proprietari Nette'
-    ]
+
+def preprocess_data(data, anomalie=None):
+    """
+    Rinomina e converte le colonne del Foglio 1 (prenotazioni) e calcola le colonne derivate.
+
+    Parametri:
+        data (DataFrame): colonne B,C,D,G,H,I,J,O,P,Q,R,U,V,W,X,AA,AB,AC,AJ,AK,AL del Foglio 1, lette come testo.
+        anomalie (dict): se passato, raccoglie per colonna le righe Excel non convertibili.
+
+    Ritorna:
+        DataFrame delle prenotazioni pronto per il calcolo dei KPI.
+    """
+    # Le colonne sono rinominate su una copia: il DataFrame letto dal chiamante resta invariato
+    data = data.copy()
+    data.columns = COLONNE_PRENOTAZIONI
 
     data = data.dropna(subset=['ID Appartamento'])
+    data = converti_colonne_prenotazioni(data, anomalie)
 
+    return calcola_colonne_derivate(data, anomalie)
 
-    # Conversione delle date con il formato DD/MM/YYYY
-    data['Data Check-In'] = pd.to_datetime(data['Data Check-In'], errors='coerce', dayfirst=True)
-    data['Data Check-Out'] = pd.to_datetime(data['Data Check-Out'], errors='coerce', dayfirst=True)
 
+def converti_colonne_prenotazioni(data, anomalie=None):
+    """
+    Converte date (formato DD/MM/YYYY) e importi (formato italiano) delle prenotazioni,
+    con una sola conversione vettoriale per colonna.
+    """
+    data = data.copy()
+    for col in COLONNE_DATA:
+        data[col], non_valide = parse_date(data[col])
+        registra_anomalie(anomalie, col, non_valide)
+
+    for col in COLONNE_NUMERICHE:
+        data[col], non_valide = parse_numeri(data[col])
+        registra_anomalie(anomalie, col, non_valide)
+    return data
 
-    data = data.dropna(subset=['Data Check-In'])
-    data['Durata Soggiorno'] = (data['Data Check-Out'] - data['Data Check-In']).dt.days
-
-    numeric_columns = [
-        'Ricavi Locazione', 'Ricavi Pulizie', 'Tassa di Soggiorno',
-        'Commissioni OTA', 'Commissioni ITW Nette', 'IVA Commissioni ITW',
-        'Commissioni ITW Lorde', 'Costi di incasso', 'Provvigioni PM Nette',
-        'IVA Provvigioni PM', 'Provvigioni PM Lorde', 'Commissioni Proprietari Lorde',
-        'Cedolare secca', 'Commissioni Proprietari Nette'
-    ]
 
-    for col in numeric_columns:
-        data[col] = data[col].str.replace(',', '.', regex=False)
-        data[col] = pd.to_numeric(data[col], errors='coerce')
+def registra_anomalie(anomalie, colonna, righe):
+    """
+    Aggiunge ad anomalie[colonna] i numeri di riga Excel (l'intestazione è la riga 1) non convertibili.
+    """
+    if anomalie is not None and len(righe):
+        anomalie.setdefault(colonna, []).extend((righe + 2).tolist())
+
 
+def calcola_colonne_derivate(data, anomalie=None):
+    """
+    Calcola durata del soggiorno, ricavi, commissioni, marginalità e mese delle prenotazioni
+    a partire dalle colonne già convertite in date e numeri.
+
+    Le durate negative o oltre MAX_NOTTI_SOGGIORNO (date di check-in o check-out errate) sono
+    segnalate in anomalie['Durata Soggiorno'] e azzerate: la prenotazione resta, senza notti.
+    """
+    data = data.dropna(subset=['Data Check-In'])
+    durata = (data['Data Check-Out'] - data['Data Check-In']).dt.days
+    non_valide = ((durata < 0) | (durata > MAX_NOTTI_SOGGIORNO)).to_numpy()
+    registra_anomalie(anomalie, 'Durata Soggiorno', data.index.to_numpy()[non_valide])
+    data['Durata Soggiorno'] = durata.mask(non_valide)
 
     data['ricavi_totali'] = data['Ricavi Locazione'] - data['IVA Provvigioni PM'] + data['Ricavi Pulizie'] / 1.22
     data['commissioni_totali'] = data['Commissioni OTA'] / 1.22 + data['Commissioni ITW Nette'] + data['Commissioni Proprietari Lorde']
@@ -66,7 +121,8 @@ def load_and_preprocess_data(uploaded_file):
     data['marginalità_pulizie'] = data['Ricavi Pulizie']/1.22 - (data['Commissioni OTA'] - data['marginalità_locazioni'])
 
 
-    data = data.fillna(0)
+    # Le date mancanti restano NaT, così le colonne data mantengono il tipo datetime
+    data = data.fillna({col: 0 for col in data.columns if col not in COLONNE_DATA})
 
     data['Mese'] = data['Data Check-In'].dt.to_period('M').astype(str)
     return data
@@ -78,7 +134,7 @@ def load_and_preprocess_input_data(uploaded_file):
         sheet_name=0,
         usecols="A,B,C,D,E",
         dtype=str,
-        engine="openpyxl"
+        engine=motore_pandas(uploaded_file)
     )
 
     data.columns = [
@@ -99,33 +155,40 @@ def localizzatore(file_path, data):
     Associa a ogni immobile la posizione e i costi per ogni soggiorno.
     """
     # Legge il Foglio 2 del file Excel
-    file_posizioni = pd.read_excel(file_path, sheet_name=2)
-
-    # Lista per salvare le informazioni di ogni immobile
-    lista_posizione = []
-
-    # Itera sulle righe del file e crea un dizionario per ogni riga
-    for index, row in file_posizioni.iterrows():
-        d = {
-            'nome_immobile': row[0],            # Nome dell'appartamento nella prima colonna
-            'id_immobile': row[1],              # ID dell'appartamento nella seconda colonna
-            'zona': row[2],                     # Zona nella terza colonna
-            'coordinate_zona': row[3],          # Coordinate della zona nella quarta colonna
-            'indirizzo': row[4],                # Indirizzo nella quinta colonna
-            'coordinate_indirizzo': row[5],     # Coordinate dell'indirizzo nella sesta colonna
-            'costo_pulizie_ps': row[6],         # Coordinate dell'indirizzo nella sesta colonna
-            'costo_scorte_ps': row[7],          # Coordinate dell'indirizzo nella sesta colonna
-            'costo_manutenzioni_ps': row[8]     # Coordinate dell'indirizzo nella sesta colonna
-        }
-        lista_posizione.append(d)
-
-    # Converti l'elenco di dizionari in un DataFrame
-    df_posizione = pd.DataFrame(lista_posizione)
+    file_posizioni = pd.read_excel(file_path, sheet_name=2, engine=motore_pandas(file_path))
 
-    # Unisci i DataFrame specificando le colonne chiave diverse
-    data = data.merge(df_posizione, left_on='ID Appartamento', right_on='id_immobile', how='left')
+    return unisci_posizioni(data, elabora_posizioni(file_posizioni))
 
-    return data
+
+def elabora_posizioni(file_posizioni):
+    """
+    Estrae dal Foglio 3 la posizione e i costi per soggiorno di ogni immobile.
+    """
+    # Le colonne sono lette per posizione, l'intestazione del foglio non viene usata
+    df_posizione = file_posizioni.iloc[:, :9].copy()
+    df_posizione.columns = [
+        'nome_immobile',            # Nome dell'appartamento nella prima colonna
+        'id_immobile',              # ID dell'appartamento nella seconda colonna
+        'zona',                     # Zona nella terza colonna
+        'coordinate_zona',          # Coordinate della zona nella quarta colonna
+        'indirizzo',                # Indirizzo nella quinta colonna
+        'coordinate_indirizzo',     # Coordinate dell'indirizzo nella sesta colonna
+        'costo_pulizie_ps',         # Costo pulizie per soggiorno
+        'costo_scorte_ps',          # Costo scorte per soggiorno
+        'costo_manutenzioni_ps'     # Costo manutenzioni per soggiorno
+    ]
+    # Negli export CSV i costi arrivano come testo in formato italiano
+    for col in ['costo_pulizie_ps', 'costo_scorte_ps', 'costo_manutenzioni_ps']:
+        df_posizione[col], _ = parse_numeri(df_posizione[col])
+    return df_posizione.reset_index(drop=True)
+
+
+def unisci_posizioni(data, df_posizione):
+    """
+    Unisce alle prenotazioni le posizioni e i costi calcolati da elabora_posizioni.
+    """
+    # Unisci i DataFrame specificando le colonne chiave diverse
+    return data.merge(df_posizione, left_on='ID Appartamento', right_on='id_immobile', how='left')
 
 
 def carica_elaboara_spese(file_path):
@@ -136,8 +199,22 @@ def carica_elaboara_spese(file_path):
         sheet_name=3,
         usecols="B,D,E,F,I,J,K",
         dtype=str,
-        engine="openpyxl"
+        engine=motore_pandas(file_path)
     )
+    return elabora_spese(file_spese).reset_index(drop=True)
+
+
+def elabora_spese(file_spese, anomalie=None):
+    """
+    Rinomina e converte le colonne del Foglio 4 (spese) e assegna data e settore alle righe IVA.
+
+    Parametri:
+        file_spese (DataFrame): colonne B,D,E,F,I,J,K del Foglio 4, lette come testo.
+        anomalie (dict): se passato, raccoglie per colonna le righe Excel non convertibili.
+
+    Ritorna:
+        DataFrame delle spese, con l'indice delle righe di file_spese.
+    """
     file_spese.columns = [
         'Codice',
         'Descrizione',
@@ -148,22 +225,37 @@ def carica_elaboara_spese(file_path):
         'Immobile associato alla spesa'
     ]
 
-    # Trasforma la colonna "data" in formato datetime
-    file_spese['data'] = pd.to_datetime(file_spese['data'], errors='coerce')
+    # Converte importi (formato italiano) e date (DD/MM/YYYY), una conversione per colonna
+    for col in ['Importo', 'Importo Totale']:
+        file_spese[col], non_valide = parse_numeri(file_spese[col])
+        registra_anomalie(anomalie, col, non_valide)
+    file_spese['data'], non_valide = parse_date(file_spese['data'])
+    registra_anomalie(anomalie, 'data', non_valide)
 
     # Elimina le righe in cui:
     # - la colonna "Importo Totale" è nulla
     # - e la colonna "Codice" ha un valore diverso da "59.01.01"
     file_spese = file_spese[~(file_spese['Importo Totale'].isnull() & (file_spese['Codice'] != '59.01.01'))]
 
-    # Resetta l'indice per garantire che le righe siano consecutive
-    file_spese.reset_index(drop=True, inplace=True)
-
-    # Per le righe IVA (Codice "59.01.01") che non hanno una data, assegna la data della riga precedente
-    iva_mask = (file_spese['Codice'] == '59.01.01') & (file_spese['data'].isnull())
-    file_spese.loc[iva_mask, 'data'] = file_spese['data'].shift(1)
-
-    # Per le righe IVA (Codice "59.01.01"), assegna il Settore di spesa della riga precedente
-    file_spese.loc[file_spese['Codice'] == '59.01.01', 'Settore di spesa'] = file_spese['Settore di spesa'].shift(1)
-
-    return pd.DataFrame(file_spese)
+    # Ogni riga IVA (Codice "59.01.01") appartiene all'ultima spesa che la precede, anche se
+    # le righe IVA della stessa spesa sono più di una: posizione della spesa di ogni riga
+    # (-1 per le righe IVA prima di qualsiasi spesa). L'indice del foglio viene mantenuto
+    # (serve all'aggiornamento incrementale), quindi si lavora per posizione.
+    iva = (file_spese['Codice'] == '59.01.01').to_numpy()
+    posizione_spesa = np.maximum.accumulate(np.where(~iva, np.arange(len(file_spese)), -1))
+    con_spesa = iva & (posizione_spesa >= 0)
+    righe_iva = np.flatnonzero(con_spesa)
+    righe_spesa = posizione_spesa[con_spesa]
+    file_spese = file_spese.copy()
+
+    # Le righe IVA senza data prendono la data della spesa
+    senza_data = file_spese['data'].iloc[righe_iva].isnull().to_numpy()
+    colonna = file_spese.columns.get_loc('data')
+    file_spese.iloc[righe_iva[senza_data], colonna] = file_spese['data'].iloc[righe_spesa[senza_data]].to_numpy()
+
+    # Le righe IVA prendono sempre il Settore di spesa della spesa
+    colonna = file_spese.columns.get_loc('Settore di spesa')
+    file_spese.iloc[np.flatnonzero(iva), colonna] = None
+    file_spese.iloc[righe_iva, colonna] = file_spese['Settore di spesa'].iloc[righe_spesa].to_numpy()
+
+    return file_spese
@@ -1,218 +1,133 @@
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import math
+import html
 import streamlit as st
+from dataclasses import dataclass
 
-def create_donut_chart(totale, kpi):
-    """
-    Crea un grafico ad anello compatto che mostra la percentuale del kpi passato sul totale
-
-
-    """
-    # Calcola la percentuale rispetto al totale
-    percentuale = (kpi / totale) * 100
-
-    # Dati per il grafico
-    labels = ['Kpi', 'Altro']
-    values = [kpi, totale - kpi]
-
-    # Creazione del grafico
-    fig = go.Figure(
-        data=[go.Pie(
-            labels=labels,
-            values=values,
-            hole=0.6,
-            textinfo='none',  # Rimuove le etichette standard
-            marker=dict(colors=['#1f77b4', '#d3d3d3'])  # Colori del grafico
-        )]
-    )
+from cache_grafici import memorizza_grafico
+from campionamento import SOGLIA_WEBGL, campiona_serie, punti_per_larghezza
+from calculate_available_nights import notti_per_periodo
+from notti_prenotazioni import somma_notti_per_periodo
+from periodi import scegli_granularita
 
-    # Personalizzazione del layout
-    fig.update_layout(
-        annotations=[
-            {
-                "font": {"size": 20},
-                "showarrow": False,
-                "text": f"{float(percentuale):.0f}%",  # Converte percentuale in float prima della formattazione
-                "x": 0.1,
-                "y": 0.5
-            }
-        ],
-        showlegend=False,  # Nasconde la legenda
-        margin=dict(t=0, b=0, l=0, r=0),  # Rimuove i margini
-        height=40,  # Altezza compatta
-        width=40,   # Larghezza compatta
-    )
+# Barre mostrate da create_horizontal_bar_chart: le categorie successive sono sommate in "Altri"
+MAX_BARRE = 25
 
 
-    return fig
+@dataclass(frozen=True)
+class AnelloKPI:
+    """
+    Un KPI da disegnare come anello: quota di `valore` su `totale`, con etichetta e valore formattato.
+    """
+    etichetta: str
+    valore: object
+    totale: object
+    info: str = None
+    formato: str = ",.2f"
 
 
-def create_donut_chart1(totale, kpi):
+def anello_svg(totale, kpi, dimensione=44, colore='#1f77b4'):
     """
-    Crea un grafico ad anello compatto che mostra la percentuale del kpi passato sul totale
+    Disegna in SVG un anello con la percentuale del kpi sul totale, senza figura Plotly:
+    poche centinaia di byte di HTML.
     """
-    # Assicuriamoci che 'totale' e 'kpi' siano numeri scalari
-    totale_scalar = float(totale) if not isinstance(totale, (int, float)) else totale
-    kpi_scalar = float(kpi) if not isinstance(kpi, (int, float)) else kpi
-
-    # Calcola la percentuale rispetto al totale
-    percentuale = (kpi_scalar / totale_scalar) * 100
-
-    # Dati per il grafico
-    labels = ['Kpi', 'Altro']
-    values = [kpi_scalar, totale_scalar - kpi_scalar]
-
-    # Creazione del grafico
-    fig = go.Figure(
-        data=[go.Pie(
-            labels=labels,
-            values=values,
-            hole=0.6,
-            textinfo='none',  # Rimuove le etichette standard
-            marker=dict(colors=['#1f77b4', '#d3d3d3'])  # Colori del grafico
-        )]
+    totale, kpi = _scalare(totale), _scalare(kpi)
+    percentuale = kpi / totale * 100 if totale else float('nan')
+    arco = min(max(percentuale, 0), 100) if math.isfinite(percentuale) else 0
+    testo = f"{percentuale:.0f}%" if math.isfinite(percentuale) else "–"
+
+    # Raggio 15.9155: circonferenza 100, l'arco si esprime direttamente in percentuale
+    return (
+        f'<svg width="{dimensione}" height="{dimensione}" viewBox="0 0 36 36">'
+        f'<circle cx="18" cy="18" r="15.9155" fill="none" stroke="#d3d3d3" stroke-width="5"/>'
+        f'<circle cx="18" cy="18" r="15.9155" fill="none" stroke="{colore}" stroke-width="5" '
+        f'stroke-dasharray="{arco:.2f} 100" transform="rotate(-90 18 18)"/>'
+        f'<text x="18" y="20.5" text-anchor="middle" font-size="8">{testo}</text>'
+        f'</svg>'
     )
 
-    # Personalizzazione del layout
-    fig.update_layout(
-        annotations=[
-            {
-                "font": {"size": 20},
-                "showarrow": False,
-                "text": f"{percentuale:.0f}%",  # Mostra la percentuale al centro
-                "x": 0.5,
-                "y": 0.5
-            }
-        ],
-        showlegend=False,  # Nasconde la legenda
-        margin=dict(t=0, b=0, l=0, r=0),  # Rimuove i margini
-        height=120,  # Altezza compatta
-        width=120,   # Larghezza compatta
-    )
-
-    return fig
-
-
-def create_donut_chart2(totale, kpi):
-
-
 
+def create_anelli_kpi(voci, disposizione='colonna', dimensione=None):
     """
-    Crea un grafico ad anello compatto che mostra la percentuale del kpi passato sul totale
-
+    Crea un unico blocco HTML con gli anelli e i valori di più KPI, da mostrare con una sola
+    chiamata st.markdown al posto di una figura Plotly e di una metrica per KPI.
 
+    Parametri:
+        voci (list): AnelloKPI da disegnare, nell'ordine.
+        disposizione (str): 'colonna' (anello a sinistra del valore, una voce per riga) oppure
+                            'riga' (voci affiancate, anello sopra il valore).
+        dimensione (int): lato degli anelli in pixel (predefinito 44 in colonna e 96 in riga).
     """
+    dimensione = dimensione or (44 if disposizione == 'colonna' else 96)
+    blocchi = []
+    for voce in voci:
+        info = (f' <span class="info-icon" title="{html.escape(voce.info)}">ℹ️</span>' if voce.info else '')
+        blocchi.append(
+            f'<div class="anello-kpi">{anello_svg(voce.totale, voce.valore, dimensione)}'
+            f'<div><div class="anello-etichetta">{html.escape(voce.etichetta)}{info}</div>'
+            f'<div class="anello-valore">{_scalare(voce.valore):{voce.formato}}</div></div></div>'
+        )
+    return f'<div class="anelli-kpi anelli-{disposizione}">{"".join(blocchi)}</div>'
 
 
-    # Calcola la percentuale rispetto al totale
-    percentuale = (kpi / totale) * 100
-
-    # Dati per il grafico
-    labels = ['Kpi', 'Altro']
-    values = [kpi, totale - kpi]
-
-    # Creazione del grafico
-    fig = go.Figure(
-        data=[go.Pie(
-            labels=labels,
-            values=values,
-            hole=0.6,
-            textinfo='none',  # Rimuove le etichette standard
-            marker=dict(colors=['#1f77b4', '#d3d3d3'])  # Colori del grafico
-        )]
-    )
-
-    # Personalizzazione del layout
-    fig.update_layout(
-        annotations=[
-            {
-                "font": {"size": 15},
-                "showarrow": False,
-                "text": f"{percentuale:.0f}%",  # Mostra la percentuale al centro
-                "x": 0.5,
-                "y": 0.5
-            }
-        ],
-        showlegend=False,  # Nasconde la legenda
-        margin=dict(t=0, b=0, l=0, r=0),  # Rimuove i margini
-        height=50,  # Altezza compatta
-        width=50,   # Larghezza compatta
-    )
-
-    return fig
+def _scalare(valore):
+    """
+    Valore float di uno scalare o di una Series/array di un elemento (es. le colonne di elabora_spese_ricavi).
+    """
+    return float(np.asarray(valore, dtype='float64').reshape(-1)[0])
 
 
-def visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, start_date, end_date):
+@memorizza_grafico(selezioni=('dati_filtrati',))
+def visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, disponibilita, notti,
+                                  larghezza=800):
     """
     Crea un grafico a linee curve che confronta il tasso di occupazione,
     il valore medio prenotazione, il prezzo medio a notte, il margine medio a notte,
     e il margine medio per prenotazione.
 
+    Notti e importi sono attribuiti al periodo in cui cade ogni notte del soggiorno,
+    non al periodo del check-in.
+
     Parametri:
         dati_filtrati (DataFrame): Un DataFrame contenente i dati filtrati,
                                    con colonne necessarie per il calcolo delle metriche.
+        notti_disponibili_filtrate (DataFrame): notti disponibili degli appartamenti selezionati.
         start_date (datetime.date): Data di inizio filtro.
         end_date (datetime.date): Data di fine filtro.
+        disponibilita (DisponibilitaGiornaliera): disponibilità del workbook, da cui si ricavano
+                                                  le notti disponibili di ogni periodo del grafico.
+        notti (NottiPrenotazioni): notti delle prenotazioni del workbook (DatiWorkbook.notti).
+        larghezza (int): larghezza del grafico in pixel, da cui dipende il numero di punti disegnati.
 
     Output:
         Ritorna una figura Plotly che rappresenta l'andamento delle metriche nel tempo.
     """
-
-
-    # Calcola metriche richieste
-    dati_filtrati['Tasso di Occupazione'] = dati_filtrati['Notti Occupate'] / notti_disponibili_filtrate['Notti Disponibili'] * 100
-
-    dati_filtrati['Prezzo Medio Notte'] = dati_filtrati['ricavi_totali'] / dati_filtrati['Notti Occupate']
-    dati_filtrati['Margine Medio Notte'] = dati_filtrati['marginalità_totale'] / dati_filtrati['Notti Occupate']
-
-
     # Determina la scala temporale
-    delta = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days
-    if delta > 60:
-        freq = 'M'  # Mensile
-        label = 'Mese'
-    elif delta > 15:
-        freq = '2W'  # Ogni 15 giorni
-        label = 'Quindicina'
-    else:
-        freq = '3D'  # Ogni 3 giorni
-        label = 'Ogni 3 giorni'
-
-    # Raggruppa i dati
-    dati_filtrati['Periodo'] = dati_filtrati['Data Check-In'].dt.to_period(freq).dt.start_time
-    grouped_data = dati_filtrati.groupby('Periodo').agg({
-        'Tasso di Occupazione': 'mean',
-        'Prezzo Medio Notte': 'mean',
-        'Margine Medio Notte': 'mean',
-
-    }).reset_index()
-
-    # Trasforma i dati in formato lungo
-    dati_melted = grouped_data.melt(
-        id_vars=['Periodo'],
-        value_vars=[
-            'Tasso di Occupazione',
-            'Prezzo Medio Notte',
-            'Margine Medio Notte',
-
-        ],
-        var_name='Metrica',
-        value_name='Valore'
-    )
+    freq, _ = scegli_granularita(start_date, end_date)
 
-    # Crea il grafico
-    fig = px.line(
-        dati_melted,
-        x='Periodo',
-        y='Valore',
-        color='Metrica',
-        markers=True,
-        line_shape='spline',
-        title="",
-        labels={'Periodo': label, 'Valore': 'Valore', 'Metrica': 'Metrica'}
+    # Notti occupate e importi ripartiti per periodo, limitati al filtro date
+    grouped_data = somma_notti_per_periodo(
+        notti, dati_filtrati, freq, ['ricavi_totali', 'marginalità_totale'], start_date, end_date
     )
+    notti_occupate = grouped_data['Notti Occupate'].where(grouped_data['Notti Occupate'] > 0)
+    grouped_data['Prezzo Medio Notte'] = grouped_data['ricavi_totali'] / notti_occupate
+    grouped_data['Margine Medio Notte'] = grouped_data['marginalità_totale'] / notti_occupate
+
+    # Notti disponibili di ogni periodo (fino al giorno prima del periodo successivo),
+    # limitate al filtro date e agli appartamenti selezionati
+    inizi = grouped_data['Periodo'].clip(lower=pd.Timestamp(start_date))
+    fini = grouped_data['Fine Periodo'].clip(upper=pd.Timestamp(end_date))
+    successivi = grouped_data['Periodo'].shift(-1)
+    fini = fini.mask(fini >= successivi, successivi - pd.Timedelta(days=1))
+    notti_disponibili = notti_per_periodo(disponibilita, inizi, fini, notti_disponibili_filtrate['Appartamento'])
+    grouped_data['Tasso di Occupazione'] = grouped_data['Notti Occupate'] / np.where(notti_disponibili > 0, notti_disponibili, np.nan) * 100
+
+    # Una linea per metrica, sottocampionata sulla larghezza del grafico
+    metriche = ['Tasso di Occupazione', 'Prezzo Medio Notte', 'Margine Medio Notte']
+    fig = go.Figure(_linee_andamento(grouped_data['Periodo'], grouped_data[metriche], larghezza))
 
     fig.update_layout(
         xaxis_title="",
@@ -220,21 +135,30 @@ def visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, sta
         hovermode="x unified",
         showlegend=False,  # Nasconde la legenda
         height=400,
-        width=800,
+        width=larghezza,
         margin=dict(l=10, r=10, t=40, b=20)
     )
 
     return fig
 
 
-def visualizza_andamento_ricavi(dati_filtrati, colonne_da_visualizzare):
+@memorizza_grafico(selezioni=('dati_filtrati',))
+def visualizza_andamento_ricavi(dati_filtrati, colonne_da_visualizzare, notti, start_date=None, end_date=None,
+                                larghezza=300):
     """
     Crea un grafico a linee per visualizzare l'andamento di diverse metriche nel tempo.
 
+    Gli importi sono sommati per mese della notte (vedi notti_prenotazioni): un soggiorno
+    a cavallo di due mesi contribuisce a entrambi in proporzione alle notti.
+
     Parametri:
         dati_filtrati (DataFrame): Un DataFrame contenente i dati filtrati,
-                                   con una colonna 'Data Check-In' e altre colonne numeriche da visualizzare.
-        colonne_da_visualizzare (list): Lista delle colonne da mostrare nel grafico.
+                                   con l'indice di DatiWorkbook.prenotazioni.
+        colonne_da_visualizzare (list): Lista delle colonne da mostrare nel grafico
+                                        (tra notti_prenotazioni.COLONNE_RIPARTITE).
+        notti (NottiPrenotazioni): notti delle prenotazioni del workbook (DatiWorkbook.notti).
+        start_date, end_date (datetime.date): se indicate, il grafico conta solo le notti del periodo.
+        larghezza (int): larghezza del grafico in pixel, da cui dipende il numero di punti disegnati.
 
     Output:
         Ritorna una figura Plotly che rappresenta l'andamento delle metriche nel tempo.
@@ -243,28 +167,13 @@ def visualizza_andamento_ricavi(dati_filtrati, colonne_da_visualizzare):
         st.warning("Nessun dato disponibile per creare il grafico.")
         return None
 
-    # Assicura che 'Data Check-In' sia in formato datetime
-    dati_filtrati['Data Check-In'] = pd.to_datetime(dati_filtrati['Data Check-In'], errors='coerce')
-    dati_filtrati = dati_filtrati.dropna(subset=['Data Check-In'])
-
-    # Raggruppa per mese, sommando le colonne selezionate
-    dati_gruppati = dati_filtrati.groupby(dati_filtrati['Data Check-In'].dt.to_period('M')).agg({
-        col: 'sum' for col in colonne_da_visualizzare
-    }).reset_index()
-
-    # Converti il periodo in datetime per il grafico
-    dati_gruppati['Data'] = dati_gruppati['Data Check-In'].dt.to_timestamp()
+    # Somma per mese delle quote per notte delle colonne selezionate
+    dati_gruppati = somma_notti_per_periodo(
+        notti, dati_filtrati, 'M', colonne_da_visualizzare, start_date, end_date
+    ).rename(columns={'Periodo': 'Data'})
 
-    # Crea il grafico con le colonne specificate
-    fig = px.line(
-        dati_gruppati,
-        x='Data',
-        y=colonne_da_visualizzare,
-        title="",
-        labels={'value': 'Ricavi (€)', 'Data': 'Mese'},
-        markers=True,
-        line_shape="spline"  # Smussatura linee
-    )
+    # Crea il grafico con le colonne specificate, sottocampionate sulla larghezza del grafico
+    fig = go.Figure(_linee_andamento(dati_gruppati['Data'], dati_gruppati[colonne_da_visualizzare], larghezza))
 
     # Personalizzazione del layout
     fig.update_layout(
@@ -272,53 +181,67 @@ def visualizza_andamento_ricavi(dati_filtrati, colonne_da_visualizzare):
         yaxis_title="",
         showlegend=False,
         height=400,  # Altezza compatta
-        width=300,   # Larghezza compatta
+        width=larghezza,
         hovermode="x unified"
     )
 
     return fig
 
 
-def crea_grafico_barre(df, ricavi_colonna, commissioni_colonna, marginalita_colonna, start_date, end_date):
+def _linee_andamento(x, serie, larghezza):
+    """
+    Tracce a linee delle colonne di `serie` sull'asse x, dopo il sottocampionamento LTTB
+    (vedi campionamento) a punti_per_larghezza(larghezza) punti per colonna.
+
+    Come px.line con markers e line_shape='spline', finché i punti dei dati (len(x) per numero
+    di colonne, prima del sottocampionamento) restano entro SOGLIA_WEBGL; oltre, tracce
+    Scattergl (WebGL) a linee semplici, che non supportano le spline. Il conteggio è fatto
+    prima di LTTB perché dopo i punti sono al più punti_per_larghezza(larghezza) per colonna.
+    """
+    punti = punti_per_larghezza(larghezza)
+    webgl = len(x) * len(serie.columns) > SOGLIA_WEBGL
+    campioni = {colonna: campiona_serie(x, serie[colonna], punti) for colonna in serie.columns}
+
+    colori = px.colors.qualitative.Plotly
+    tracce = []
+    for i, (colonna, (ascisse, valori)) in enumerate(campioni.items()):
+        colore = colori[i % len(colori)]
+        if webgl:
+            tracce.append(go.Scattergl(x=ascisse, y=valori, name=colonna, mode='lines', line=dict(color=colore)))
+        else:
+            tracce.append(go.Scatter(x=ascisse, y=valori, name=colonna, mode='lines+markers',
+                                     line=dict(color=colore, shape='spline')))
+    return tracce
+
+
+def crea_grafico_barre(df, ricavi_colonna, commissioni_colonna, marginalita_colonna, start_date, end_date, notti):
     """
     Crea un grafico a barre che confronta ricavi totali, commissioni totali e marginalità totale,
     adattando l'asse X alla scala temporale selezionata (mese, 15 giorni, 3 giorni).
+    Gli importi sono attribuiti al periodo di ogni notte del soggiorno (vedi notti_prenotazioni).
 
     Parametri:
-        df (pd.DataFrame): Il DataFrame contenente i dati.
+        df (pd.DataFrame): Il DataFrame contenente i dati, con l'indice di DatiWorkbook.prenotazioni.
         ricavi_colonna (str): Nome della colonna dei ricavi totali.
         commissioni_colonna (str): Nome della colonna delle commissioni totali.
         marginalita_colonna (str): Nome della colonna della marginalità totale.
         start_date (datetime.date): Data di inizio filtro.
         end_date (datetime.date): Data di fine filtro.
+        notti (NottiPrenotazioni): notti delle prenotazioni del workbook (DatiWorkbook.notti).
 
     Ritorna:
         None: Il grafico viene visualizzato direttamente nella dashboard.
     """
     # Controlla se le colonne esistono
-    if ricavi_colonna not in df.columns or commissioni_colonna not in df.columns or marginalita_colonna not in df.columns:
-        raise ValueError(f"Le colonne {ricavi_colonna}, {commissioni_colonna} e/o {marginalita_colonna} non esistono nel DataFrame.")
+    colonne = [ricavi_colonna, commissioni_colonna, marginalita_colonna]
+    if any(col not in notti.tabella.columns for col in colonne):
+        raise ValueError(f"Le colonne {ricavi_colonna}, {commissioni_colonna} e/o {marginalita_colonna} non sono ripartite per notte.")
 
     # Determina la scala temporale basata sulla durata del periodo selezionato
-    delta = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days
-    if delta > 60:
-        freq = 'M'  # Mensile
-        label = 'Mese'
-    elif delta > 15:
-        freq = '2W'  # Ogni 15 giorni
-        label = 'Quindicina'
-    else:
-        freq = '3D'  # Ogni 3 giorni
-        label = 'Ogni 3 giorni'
-
-    # Raggruppa i dati per il periodo scelto
-    df['Data Check-In'] = pd.to_datetime(df['Data Check-In'])
-    df['Periodo'] = df['Data Check-In'].dt.to_period(freq).dt.start_time
-    grouped_df = df.groupby('Periodo').agg({
-        ricavi_colonna: 'sum',
-        commissioni_colonna: 'sum',
-        marginalita_colonna: 'sum'
-    }).reset_index()
+    freq, label = scegli_granularita(start_date, end_date)
+
+    # Raggruppa le notti per il periodo scelto, senza modificare df
+    grouped_df = somma_notti_per_periodo(notti, df, freq, colonne, start_date, end_date)
 
     # Trasforma i dati in formato lungo per il grafico
     df_melted = grouped_df.melt(
@@ -358,68 +281,72 @@ def crea_grafico_barre(df, ricavi_colonna, commissioni_colonna, marginalita_colo
     st.plotly_chart(fig, use_container_width=True)
 
 
-def create_horizontal_bar_chart(df, category_col, value_col):
+@memorizza_grafico
+def create_horizontal_bar_chart(df, category_col, value_col, max_barre=MAX_BARRE, etichetta_altri="Altri"):
     """
-    Crea un grafico a barre orizzontali in cui per ogni riga del DataFrame viene disegnata una barra.
-    Sul lato sinistro della barra viene visualizzato il valore corrispondente.
-    """
-
-    # Calcola il massimo valore per impostare il range dell'asse x
-    max_val = df[value_col].max()
-
-    # Imposta un offset negativo fisso per le annotazioni
-    x_offset = -0.2  # Più a sinistra rispetto a prima
+    Crea un grafico a barre orizzontali con una barra per categoria, dalla maggiore alla minore,
+    con il valore scritto accanto a ogni barra.
 
-    # Calcola il margine sinistro in base alla lunghezza massima delle etichette
-    max_label_length = df[category_col].astype(str).str.len().max()
-    left_margin = max(150, max_label_length * 10)
+    Oltre max_barre categorie, le maggiori max_barre - 1 restano singole e le altre sono
+    sommate in un'unica barra "Altri (n)": la selezione avviene qui con pandas, così il grafico
+    resta di una sola traccia e di al più max_barre barre anche con migliaia di categorie. I valori sono testi della traccia
+    (texttemplate), non annotazioni del layout.
 
-    # Genera un colore diverso per ogni barra utilizzando la palette Plotly
-    colors = px.colors.qualitative.Plotly
-    bar_colors = [colors[i % len(colors)] for i in range(len(df))]
-
-    fig = go.Figure()
-
-    # Aggiunge la traccia a barre orizzontali
-    fig.add_trace(go.Bar(
-        x=df[value_col],
-        y=df[category_col],
+    Parametri:
+        df (DataFrame): dati da rappresentare.
+        category_col (str): colonna delle categorie (righe ripetute sono sommate).
+        value_col (str): colonna dei valori.
+        max_barre (int): numero massimo di barre, compresa quella "Altri".
+        etichetta_altri (str): etichetta della barra con le categorie restanti.
+    """
+    valori = df.groupby(df[category_col].astype(str), sort=False, dropna=False)[value_col].sum()
+    valori = valori.sort_values(ascending=False, kind='stable')
+    if len(valori) > max_barre:
+        altri = valori.iloc[max_barre - 1:]
+        valori = pd.concat([
+            valori.iloc[:max_barre - 1],
+            pd.Series([altri.sum()], index=[f"{etichetta_altri} ({len(altri)})"]),
+        ])
+
+    # Ordine invertito: Plotly disegna la prima barra in basso
+    categorie = valori.index.to_numpy()[::-1]
+    importi = valori.to_numpy(dtype='float64')[::-1]
+
+    # Margine sinistro in base alla lunghezza massima delle etichette
+    max_label_length = max((len(categoria) for categoria in categorie), default=0)
+    left_margin = max(150, max_label_length * 7)
+
+    # Un colore diverso per ogni barra dalla palette Plotly
+    colori = px.colors.qualitative.Plotly
+    bar_colors = [colori[i % len(colori)] for i in range(len(categorie))][::-1]
+
+    fig = go.Figure(go.Bar(
+        x=importi,
+        y=categorie,
         orientation='h',
         marker=dict(color=bar_colors),
-        text="",
+        texttemplate="%{x:,.2f}",
+        textposition='outside',
+        textfont=dict(size=10, color="black"),
+        cliponaxis=False,
     ))
 
-    # Aggiungi annotazioni per mostrare il valore a sinistra di ogni barra
-    # Utilizziamo xref="paper" per fissare il testo rispetto all'area del grafico.
-    for i, row in df.iterrows():
-        fig.add_annotation(
-            x=x_offset,
-            xref="paper",
-            y=row[category_col],
-            text=f"{row[value_col]:,.2f}",
-            showarrow=False,
-            xanchor="right",
-            yanchor="middle",
-            font=dict(size=10, color="black"),
-            align="right",
-            bordercolor="white",
-            borderpad=4,
-            bgcolor="white",
-            opacity=0.8
-        )
-
-    # Imposta il layout, eliminando il titolo dell'asse verticale
+    # Spazio a destra per il testo della barra più lunga
+    min_val = min(np.nanmin(importi, initial=0), 0)
+    max_val = max(np.nanmax(importi, initial=0), 0)
     fig.update_layout(
         xaxis_title="",
         yaxis_title="",
-        margin=dict(l=left_margin + 50, r=20, t=20, b=20),
-        xaxis=dict(range=[0, max_val * 1.1]),
+        margin=dict(l=left_margin, r=20, t=20, b=20),
+        xaxis=dict(range=[min_val * 1.2, max_val * 1.2 or 1]),
+        height=max(300, 22 * len(categorie) + 40),
         autosize=True
     )
 
     return fig
 
 
+@memorizza_grafico
 def create_tachometer(kpi, reference, title="Performance KPI"):
     """
     Crea un tachimetro a 180° diviso in tre zone (verde, arancione, rossa) e con un indicatore a freccia.
@@ -494,3 +421,68 @@ def create_tachometer(kpi, reference, title="Performance KPI"):
     )
 
     return fig
+
+
+@memorizza_grafico
+def create_heatmap_scenari(margine, occupazione, prezzo_notte):
+    """
+    Crea una heatmap del margine annuo per tasso di occupazione (asse y) e prezzo per notte (asse x).
+    Le celle in perdita sono rosse, quelle in utile verdi, con lo zero al centro della scala.
+
+    Parametri:
+        margine (array): matrice occupazione × prezzo del margine annuo.
+        occupazione, prezzo_notte (array): valori degli assi.
+    """
+    limite = float(np.nanmax(np.abs(margine))) if np.size(margine) else 1.0
+
+    fig = go.Figure(go.Heatmap(
+        z=margine,
+        x=prezzo_notte,
+        y=occupazione,
+        zmin=-limite,
+        zmax=limite,
+        colorscale="RdYlGn",
+        colorbar=dict(title="Margine (€)"),
+        hovertemplate="Prezzo: %{x:,.2f} €<br>Occupazione: %{y:.1f}%<br>Margine: %{z:,.2f} €<extra></extra>",
+    ))
+    fig.update_layout(
+        xaxis_title="Prezzo per notte (€)",
+        yaxis_title="Tasso di occupazione (%)",
+        margin=dict(l=10, r=10, t=20, b=20),
+        autosize=True
+    )
+
+    return fig
+
+
+@memorizza_grafico
+def create_istogramma_simulazione(conteggi, bordi, percentili):
+    """
+    Crea l'istogramma del margine annuo simulato con le bande dei percentili:
+    P5-P95 e P25-P75 evidenziate e la mediana tratteggiata.
+
+    Parametri:
+        conteggi, bordi (array): istogramma del margine (np.histogram).
+        percentili (Series): margine per percentile ('P5', 'P25', 'P50', 'P75', 'P95').
+    """
+    centri = (bordi[:-1] + bordi[1:]) / 2
+
+    fig = go.Figure(go.Bar(
+        x=centri,
+        y=conteggi,
+        width=np.diff(bordi),
+        marker=dict(color=np.where(centri < 0, "#EF553B", "#00CC96")),
+        hovertemplate="Margine: %{x:,.0f} €<br>Prove: %{y:,}<extra></extra>",
+    ))
+    fig.add_vrect(x0=percentili['P5'], x1=percentili['P95'], fillcolor="gray", opacity=0.12, line_width=0)
+    fig.add_vrect(x0=percentili['P25'], x1=percentili['P75'], fillcolor="gray", opacity=0.2, line_width=0)
+    fig.add_vline(x=percentili['P50'], line_dash="dash", line_color="black")
+    fig.update_layout(
+        xaxis_title="Margine annuo (€)",
+        yaxis_title="Prove",
+        bargap=0,
+        margin=dict(l=10, r=10, t=20, b=20),
+        autosize=True
+    )
+
+    return fig
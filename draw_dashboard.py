@@ -1,16 +1,25 @@
 import ast
+from dataclasses import fields
 
 import folium
+import numpy as np
 import pandas as pd
 import streamlit as st
 from streamlit_folium import st_folium
 
+from allocazione_spese import DRIVER_RIPARTIZIONE, conto_economico_immobili
 from calculate_available_nights import calculate_available_nigths
+from centesimi import calculate_kpis_centesimi, euro, totali_proprietari_centesimi
 from custom_css import inject_custom_css
-from data_processing import localizzatore
-from draw_charts import create_donut_chart, create_donut_chart1, create_horizontal_bar_chart, create_tachometer, \
-    visualizza_andamento_metriche, visualizza_andamento_ricavi
-from kpis import calculate_kpis, elabora_spese_ricavi, eleboratore_spese, somme_IVA
+from draw_charts import AnelloKPI, create_anelli_kpi, create_heatmap_scenari, create_horizontal_bar_chart, \
+    create_istogramma_simulazione, create_tachometer, visualizza_andamento_metriche, visualizza_andamento_ricavi
+from indice_date import righe_intervallo
+from kpi_cube import kpi_da_cubo
+from kpis import AMMORTAMENTI, KPI, calculate_kpis, calculate_kpis_grouped, elabora_spese_ricavi, eleboratore_spese, somme_IVA
+from scenari import parametri_storici, tabella_pareggio, valuta_scenari
+from simulazione import simula_margine, stima_parametri
+from sql_queries import calculate_kpis_sql, eleboratore_spese_sql
+from sql_storage import database_workbook
 
 
 def render_dashboard():
@@ -32,9 +41,8 @@ def render_dashboard():
         st.error("Nessun file caricato per il calcolo delle notti disponibili.")
         return
 
-    file_path = st.session_state['uploaded_file']
+    workbook = st.session_state['workbook']
     data = st.session_state['data']
-    data = localizzatore(file_path, data)
 
         # Sezione Filtri
     with st.sidebar.expander("🔍 Filtro Dati"):
@@ -92,11 +100,8 @@ def render_dashboard():
                 key="zona_filter_multi"
             )
 
-        # Filtraggio dei dati principali in base alle date
-        dati_filtrati = data[
-            (data['Data Check-In'] >= pd.Timestamp(start_date)) &
-            (data['Data Check-In'] <= pd.Timestamp(end_date))
-        ]
+        # Filtraggio dei dati principali in base alle date, con le ricerche binarie dell'indice per data
+        dati_filtrati = data.iloc[righe_intervallo(workbook.indice_date, start_date, end_date)]
 
         # Filtra in base agli immobili
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -127,7 +132,7 @@ def render_dashboard():
             )
 
         # Calcola le notti disponibili
-        notti_disponibili_df = calculate_available_nigths(file_path, start_date, end_date)
+        notti_disponibili_df = calculate_available_nigths(workbook.disponibilita_giornaliera, start_date, end_date)
 
         # Filtra le notti disponibili in base al filtro appartamento
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -153,9 +158,8 @@ def render_dashboard():
         notti_disponibili_filtrate = st.session_state['filtered_notti_disponibili']
 
     # Calcolo dei KPI
-    kpis = calculate_kpis(dati_filtrati, notti_disponibili_filtrate)
-    spese = st.session_state['spese']
-    kpis_spese, totali_spese_settore, totale_spese = eleboratore_spese(spese)
+    kpis = calcola_kpis(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, immobili_selezionati, zona_selezionata)
+    kpis_spese, totali_spese_settore, totale_spese = elabora_spese(workbook.spese_nette)
     dati_IVA = somme_IVA(totale_spese, kpis)
     riassunto_spese = elabora_spese_ricavi(kpis_spese, totale_spese, totali_spese_settore, kpis)
 
@@ -163,190 +167,61 @@ def render_dashboard():
 
    ############ Layout a 3 colonne per dividere lo schermo in tre sezioni uguali    ###########
     col1, col2 = st.columns([2,4])  # Tre colonne di uguale larghezza
-    # Colonna 1: Grafico ad anello + KPI
+    # Colonna 1: anelli + KPI, disegnati in un unico blocco HTML per gruppo
 
     with col1:
         # Apre il contenitore della card
-        st.metric("💰 Fatturato (€)", f"{kpis['ricavi_totali']:,.2f}")
-
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["ricavi_totali"]
-            kpi = riassunto_spese['costi_totali']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="gr21")
-        with metrica_col:
-            st.metric(" Costi (€)", f"{riassunto_spese['costi_totali'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Variabili rappresentano le commissioni variabili.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
-
-
-        # Terzo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["ricavi_totali"]
-            kpi = riassunto_spese['EBITDA']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="gr31")
-        with metrica_col:
-            st.metric(" EBITDA (€)", f"{riassunto_spese['EBITDA'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Fissi rappresentano la parte fissa dei costi di gestione.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
+        st.metric("💰 Fatturato (€)", f"{kpis.ricavi_totali:,.2f}")
 
-        # Terzo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["ricavi_totali"]
-            kpi = riassunto_spese['MOL']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="gr41")
-        with metrica_col:
-            st.metric("  MOL (€)", f"{riassunto_spese['MOL'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Fissi rappresentano la parte fissa dei costi di gestione.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
+        render_anelli_kpi([
+            AnelloKPI("Costi (€)", riassunto_spese['costi_totali'], riassunto_spese["ricavi_totali"],
+                      "I Costi Variabili rappresentano le commissioni variabili."),
+            AnelloKPI("EBITDA (€)", riassunto_spese['EBITDA'], riassunto_spese["ricavi_totali"],
+                      "I Costi Fissi rappresentano la parte fissa dei costi di gestione."),
+            AnelloKPI("MOL (€)", riassunto_spese['MOL'], riassunto_spese["ricavi_totali"],
+                      "I Costi Fissi rappresentano la parte fissa dei costi di gestione."),
+        ])
 
         st.divider()
         st.write("")  # Spazio verticale
 
-        # Secondo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["ricavi_totali"]
-            kpi = riassunto_spese['costi_variabili']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="gr2")
-        with metrica_col:
-            st.metric(" Costi Variabili (€)", f"{riassunto_spese['costi_variabili'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Variabili rappresentano le commissioni variabili.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
-
-        # Terzo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["costi_totali"]
-            kpi = riassunto_spese['costi_fissi']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="gr3")
-        with metrica_col:
-            st.metric(" Costi Fissi (€)", f"{riassunto_spese['costi_fissi'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Fissi rappresentano la parte fissa dei costi di gestione.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
-        # Terzo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["costi_totali"]
-            kpi = riassunto_spese['ammortamenti']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="gr4")
-        with metrica_col:
-            st.metric("  Ammortamenti (€)", f"{riassunto_spese['ammortamenti'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Fissi rappresentano la parte fissa dei costi di gestione.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
+        render_anelli_kpi([
+            AnelloKPI("Costi Variabili (€)", riassunto_spese['costi_variabili'], riassunto_spese["ricavi_totali"],
+                      "I Costi Variabili rappresentano le commissioni variabili."),
+            AnelloKPI("Costi Fissi (€)", riassunto_spese['costi_fissi'], riassunto_spese["costi_totali"],
+                      "I Costi Fissi rappresentano la parte fissa dei costi di gestione."),
+            AnelloKPI("Ammortamenti (€)", riassunto_spese['ammortamenti'], riassunto_spese["costi_totali"],
+                      "I Costi Fissi rappresentano la parte fissa dei costi di gestione."),
+        ])
 
 
     with col2:
         colonne = ['ricavi_totali', 'commissioni_totali', 'marginalità_totale']
-        fig = visualizza_andamento_ricavi(dati_filtrati, colonne)
+        fig = visualizza_andamento_ricavi(dati_filtrati, colonne, workbook.notti, start_date, end_date)
         st.plotly_chart(fig)
         st.divider()
 
-        col3, col4, col5 = st.columns([1,1,1])
-
-        with col3:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col3:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_totale"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col3:
-                st.metric("📊 M.S.V. (€)", f"{kpis['marginalità_totale']:,.2f}")
-
-        with col4:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col4:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_locazioni"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col4:
-                st.metric("📊 Marginalità Locazioni (€)", f"{kpis['marginalità_locazioni']:,.2f}")
-
-        with col5:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col5:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_pulizie"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col5:
-                st.metric("📊 Marginalità Pulizie (€)", f"{kpis['marginalità_pulizie']:,.2f}")
-
-        col03, col04, col05 = st.columns([1,1,1])
-
-        with col03:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col03:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["commissioni_proprietari"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col03:
-                st.metric("📊 Commissioni Proprietari (€)", f"{kpis['commissioni_proprietari']:,.2f}")
-            # Supponiamo di avere:
-            kpi_value = 75      # il valore del KPI
-            reference_value = 100  # il valore di riferimento
-
-            # Crea il tachimetro:
-            tachometer_fig = create_tachometer(kpi_value, reference_value, title="Performance KPI")
-
-            # Visualizza il tachimetro in Streamlit:
-            st.plotly_chart(tachometer_fig, use_container_width=True)
-
-
-        with col04:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col04:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["commissioni_ota"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col04:
-                st.metric("📊 Commissioni OTA (€)", f"{kpis['commissioni_ota']:,.2f}")
-
-        with col05:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col05:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["commissioni_itw"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col05:
-                st.metric("📊 Commissioni Local Manager (€)", f"{kpis['commissioni_itw']:,.2f}")
+        render_anelli_kpi([
+            AnelloKPI("📊 M.S.V. (€)", kpis.marginalità_totale, kpis.ricavi_totali),
+            AnelloKPI("📊 Marginalità Locazioni (€)", kpis.marginalità_locazioni, kpis.ricavi_totali),
+            AnelloKPI("📊 Marginalità Pulizie (€)", kpis.marginalità_pulizie, kpis.ricavi_totali),
+        ], disposizione='riga')
+
+        render_anelli_kpi([
+            AnelloKPI("📊 Commissioni Proprietari (€)", kpis.commissioni_proprietari, kpis.ricavi_totali),
+            AnelloKPI("📊 Commissioni OTA (€)", kpis.commissioni_ota, kpis.ricavi_totali),
+            AnelloKPI("📊 Commissioni Local Manager (€)", kpis.commissioni_itw, kpis.ricavi_totali),
+        ], disposizione='riga')
+
+        # Supponiamo di avere:
+        kpi_value = 75      # il valore del KPI
+        reference_value = 100  # il valore di riferimento
+
+        # Crea il tachimetro:
+        tachometer_fig = create_tachometer(kpi_value, reference_value, title="Performance KPI")
+
+        # Visualizza il tachimetro in Streamlit:
+        st.plotly_chart(tachometer_fig, use_container_width=True)
 
 
 
@@ -377,9 +252,8 @@ def dashboard_spese():
         return
 
 
-    file_path = st.session_state['uploaded_file']
+    workbook = st.session_state['workbook']
     data = st.session_state['data']
-    data = localizzatore(file_path, data)
     spese = st.session_state['spese']
 
     # Sezione Filtri
@@ -399,17 +273,23 @@ def dashboard_spese():
             key="end_date_filter"
         )
 
-        # Filtra il dataframe spese in base alle date
-        dati_filtrati_spese = spese[
-            (spese['data'] >= pd.Timestamp(start_date)) &
-            (spese['data'] <= pd.Timestamp(end_date))
+        # Filtra le spese (già abbinate alle righe IVA al caricamento) in base alle date
+        spese_nette = workbook.spese_nette
+        dati_filtrati_spese = spese_nette[
+            (spese_nette['data'] >= pd.Timestamp(start_date)) &
+            (spese_nette['data'] <= pd.Timestamp(end_date))
         ]
 
         # Filtra il dataframe data in base allo stesso intervallo (colonna "Data Check-In")
-        dati_filtrati_data = data[
-            (data['Data Check-In'] >= pd.Timestamp(start_date)) &
-            (data['Data Check-In'] <= pd.Timestamp(end_date))
-        ]
+        dati_filtrati_data = data.iloc[righe_intervallo(workbook.indice_date, start_date, end_date)]
+
+        # Parametri del conto economico per immobile
+        ammortamenti = st.number_input("Ammortamenti (€)", min_value=0.0, value=float(AMMORTAMENTI), step=500.0)
+        driver = st.selectbox(
+            "Ripartizione spese comuni",
+            list(DRIVER_RIPARTIZIONE),
+            format_func=lambda chiave: {'notti': "Notti occupate", 'ricavi': "Ricavi", 'quote_uguali': "Quote uguali"}[chiave]
+        )
 
         # Salva i dati filtrati nel session state
         st.session_state['filtered_data_spese'] = dati_filtrati_spese
@@ -423,144 +303,41 @@ def dashboard_spese():
         dati_filtrati_data = st.session_state['filtered_data_data']
 
     # Calcola le notti disponibili
-    notti_disponibili_filtrate = calculate_available_nigths(file_path, start_date, end_date)
+    notti_disponibili_filtrate = calculate_available_nigths(workbook.disponibilita_giornaliera, start_date, end_date)
     st.session_state['filtered_notti_disponibili'] = notti_disponibili_filtrate
 
     if 'filtered_notti_disponibili' in st.session_state:
         notti_disponibili_filtrate = st.session_state['filtered_notti_disponibili']
 
-    kpis_spese, totali_spese_settore, totale_spese = eleboratore_spese(dati_filtrati_spese)
+    kpis_spese, totali_spese_settore, totale_spese = elabora_spese(dati_filtrati_spese, start_date, end_date)
 
-    kpis = calculate_kpis(dati_filtrati_data, notti_disponibili_filtrate)
+    kpis = calcola_kpis(dati_filtrati_data, notti_disponibili_filtrate, start_date, end_date)
     dati_IVA = somme_IVA(totale_spese, kpis)
-    riassunto_spese = elabora_spese_ricavi(kpis_spese, totale_spese, totali_spese_settore, kpis)
+    riassunto_spese = elabora_spese_ricavi(kpis_spese, totale_spese, totali_spese_settore, kpis, ammortamenti)
 
     col1, col2 = st.columns([2,4])
     with col1:
-        # Primo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = riassunto_spese['costi_totali']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="grafico1")
-        with metrica_col:
-            st.metric("🧹 Costi Totali (€)", f"{riassunto_spese['costi_totali'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Totali rappresentano il totale dei costi fissi, compresi quelli relativi alle spese di gestione.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
-
-        st.write("")  # Spazio verticale per separare i blocchi
-
-        # Secondo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["costi_totali"]
-            kpi = riassunto_spese['costi_variabili']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="grafico2")
-        with metrica_col:
-            st.metric("🧹 Costi Variabili (€)", f"{riassunto_spese['costi_variabili'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Variabili rappresentano le commissioni variabili.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
-
-        st.write("")  # Spazio verticale
-
-        # Terzo blocco
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])
-        with grafico_col:
-            totale = riassunto_spese["costi_totali"]
-            kpi = riassunto_spese['costi_fissi']
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="grafico3")
-        with metrica_col:
-            st.metric("🧹 Costi Fissi (€)", f"{riassunto_spese['costi_fissi'].iloc[0]:,.2f}")
-        with info_col:
-            st.markdown(
-                '<span class="info-icon" title="I Costi Fissi rappresentano la parte fissa dei costi di gestione.">ℹ️</span>',
-                unsafe_allow_html=True
-            )
+        render_anelli_kpi([
+            AnelloKPI("🧹 Costi Totali (€)", riassunto_spese['costi_totali'], kpis.ricavi_totali,
+                      "I Costi Totali rappresentano il totale dei costi fissi, compresi quelli relativi alle spese di gestione."),
+            AnelloKPI("🧹 Costi Variabili (€)", riassunto_spese['costi_variabili'], riassunto_spese["costi_totali"],
+                      "I Costi Variabili rappresentano le commissioni variabili."),
+            AnelloKPI("🧹 Costi Fissi (€)", riassunto_spese['costi_fissi'], riassunto_spese["costi_totali"],
+                      "I Costi Fissi rappresentano la parte fissa dei costi di gestione."),
+        ])
     with col2:
         colonne = ['ricavi_totali', 'commissioni_totali', 'marginalità_totale']
-        fig = visualizza_andamento_ricavi(data, colonne)
+        fig = visualizza_andamento_ricavi(data, colonne, workbook.notti)
         st.plotly_chart(fig)
     st.divider()
-    col01, col02, col03, col04, col05 = st.columns([1,1,1,1,1])
-    with col01:
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        with col01:
-            totale = kpis["ricavi_totali"]
-            kpi = riassunto_spese["costi_gestione"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="plotly_chart_col01")  # Mantieni larghezza compatta
-        with col01:
-            render_metric_with_info(
-                metric_label="📊 Costi di gestione (€)",
-                metric_value=riassunto_spese['costi_gestione'],
-                info_text="I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
-            )
-    with col02:
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        with col02:
-            totale = kpis["ricavi_totali"]
-            kpi = riassunto_spese["costi_pulizie"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="plotly_chart_col02")  # Mantieni larghezza compatta
-        with col02:
-            render_metric_with_info(
-                metric_label="📊 Costi Pulizie (€)",
-                metric_value=riassunto_spese["costi_pulizie"],
-                info_text="I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
-            )
-    with col03:
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        with col03:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["commissioni_ota"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="plotly_chart_col03")  # Mantieni larghezza compatta
-        with col03:
-            render_metric_with_info(
-                metric_label="📊 Commissioni OTA (€)",
-                metric_value=kpis['commissioni_ota'],
-                info_text="I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
-            )
-    with col04:
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        with col04:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["commissioni_proprietari"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="plotly_chart_col04")  # Mantieni larghezza compatta
-        with col04:
-            render_metric_with_info(
-                metric_label="📊 Commissioni Proprietari (€)",
-                metric_value=kpis['commissioni_proprietari'],
-                info_text="I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
-            )
-    with col05:
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        with col05:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["commissioni_itw"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="plotly_chart_col05")  # Mantieni larghezza compatta
-        with col05:
-            render_metric_with_info(
-                metric_label="📊 Local Manager (€)",
-                metric_value=kpis['commissioni_itw'],
-                info_text="I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
-            )
+    info_gestione = "I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
+    render_anelli_kpi([
+        AnelloKPI("📊 Costi di gestione (€)", riassunto_spese["costi_gestione"], kpis.ricavi_totali, info_gestione),
+        AnelloKPI("📊 Costi Pulizie (€)", riassunto_spese["costi_pulizie"], kpis.ricavi_totali, info_gestione),
+        AnelloKPI("📊 Commissioni OTA (€)", kpis.commissioni_ota, kpis.ricavi_totali, info_gestione),
+        AnelloKPI("📊 Commissioni Proprietari (€)", kpis.commissioni_proprietari, kpis.ricavi_totali, info_gestione),
+        AnelloKPI("📊 Local Manager (€)", kpis.commissioni_itw, kpis.ricavi_totali, info_gestione),
+    ], disposizione='riga')
     col001, col002 = st.columns([4,2])
     with col001:
         fig = create_horizontal_bar_chart(totali_spese_settore, "Settore di spesa", "totale_netto")
@@ -582,6 +359,23 @@ def dashboard_spese():
             info_text="I Costi di gestione rappresentano il totale delle commissioni per i proprietari, indicatore dei costi di gestione dell'immobile."
         )
 
+    # Conto economico per immobile e per proprietario, calcolato una volta per tutto il portafoglio
+    st.divider()
+    st.subheader("Conto economico per immobile")
+    per_immobile, per_proprietario, per_settore = conto_economico_immobili(
+        dati_filtrati_data, notti_disponibili_filtrate, dati_filtrati_spese, driver, ammortamenti
+    )
+    vista = st.radio("Dettaglio", ["Immobili", "Proprietari"], horizontal=True)
+    if vista == "Immobili":
+        st.dataframe(per_immobile.sort_values('MOL', ascending=False), hide_index=True)
+        immobile = st.selectbox("Spese per settore dell'immobile", per_immobile['Nome Appartamento'])
+        if immobile is not None:
+            st.dataframe(
+                per_settore.set_index('Nome Appartamento').loc[immobile].rename('Spese nette (€)').to_frame()
+            )
+    else:
+        st.dataframe(per_proprietario.sort_values('MOL', ascending=False), hide_index=True)
+
 
 def dashboard_proprietari():
     inject_custom_css()
@@ -599,9 +393,8 @@ def dashboard_proprietari():
         st.error("Nessun file caricato per il calcolo delle notti disponibili.")
         return
 
-    file_path = st.session_state['uploaded_file']
+    workbook = st.session_state['workbook']
     data = st.session_state['data']
-    data = localizzatore(file_path, data)
 
 
         # Sezione Filtri
@@ -660,11 +453,8 @@ def dashboard_proprietari():
                 key="zona_filter_multi"
             )
 
-        # Filtraggio dei dati principali in base alle date
-        dati_filtrati = data[
-            (data['Data Check-In'] >= pd.Timestamp(start_date)) &
-            (data['Data Check-In'] <= pd.Timestamp(end_date))
-        ]
+        # Filtraggio dei dati principali in base alle date, con le ricerche binarie dell'indice per data
+        dati_filtrati = data.iloc[righe_intervallo(workbook.indice_date, start_date, end_date)]
 
         # Filtra in base agli immobili
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -695,7 +485,7 @@ def dashboard_proprietari():
             )
 
         # Calcola le notti disponibili
-        notti_disponibili_df = calculate_available_nigths(file_path, start_date, end_date)
+        notti_disponibili_df = calculate_available_nigths(workbook.disponibilita_giornaliera, start_date, end_date)
 
         # Filtra le notti disponibili in base al filtro appartamento
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -722,7 +512,7 @@ def dashboard_proprietari():
 
 
     # Calcolo dei KPI
-    kpis = calculate_kpis(dati_filtrati, notti_disponibili_filtrate)
+    kpis = calcola_kpis(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, immobili_selezionati, zona_selezionata)
 
 
 
@@ -731,77 +521,26 @@ def dashboard_proprietari():
     with col1:
 
         with col1:
-            st.metric("💰 Fatturato (€)", f"{kpis['ricavi_totali']:,.2f}")
-
-
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        grafico_col, metrica_col = st.columns([3, 5])  # Due sotto-colonne: 2/3 per il grafico, 1/3 per il dato
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["totale_ricavi_locazione"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-        with metrica_col:
-            st.metric("📈 Ricavi (€)", f"{kpis['totale_ricavi_locazione']:,.2f}")
-
-        #grafico ad anello
-        # Sub-layout per centrare il grafico e il dato
-        grafico_col, info_col, metrica_col = st.columns([3, 0.3, 5])  # Due sotto-colonne: 2/3 per il grafico, 1/3 per il dato
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["totale_ricavi_pulizie"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-        with metrica_col:
-            st.metric("🧹 Ricavi Pulizie (€)", f"{kpis['totale_ricavi_pulizie']:,.2f}")
-        # bottone info
-        with info_col:
-            st.markdown(
-            '<span class="info-icon" title="I Ricavi Totali rappresentano la somma complessiva dei ricavi generati dall\'immobile, ottenuti sommando i ricavi da locazione e quelli da servizi aggiuntivi. Questa metrica consente di valutare la performance economica globale dell\'immobile.">ℹ️</span>',
-             unsafe_allow_html=True
-        )
+            st.metric("💰 Fatturato (€)", f"{kpis.ricavi_totali:,.2f}")
+
+
+        render_anelli_kpi([
+            AnelloKPI("📈 Ricavi (€)", kpis.totale_ricavi_locazione, kpis.ricavi_totali),
+            AnelloKPI("🧹 Ricavi Pulizie (€)", kpis.totale_ricavi_pulizie, kpis.ricavi_totali,
+                      "I Ricavi Totali rappresentano la somma complessiva dei ricavi generati dall'immobile, ottenuti sommando i ricavi da locazione e quelli da servizi aggiuntivi. Questa metrica consente di valutare la performance economica globale dell'immobile."),
+        ])
 
     with col2:
         colonne = ['ricavi_totali', 'commissioni_totali', 'marginalità_totale']
-        fig = visualizza_andamento_ricavi(dati_filtrati, colonne)
+        fig = visualizza_andamento_ricavi(dati_filtrati, colonne, workbook.notti, start_date, end_date)
         st.plotly_chart(fig)
         st.divider()
 
-        col3, col4, col5 = st.columns([1,1,1])
-
-        with col3:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col3:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_totale"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col3:
-                st.metric("📊 Profitto (€)", f"{kpis['marginalità_totale']:,.2f}")
-
-        with col4:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col4:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_locazioni"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col4:
-                st.metric("📊 Cedolare Secca (€)", f"{kpis['marginalità_locazioni']:,.2f}")
-
-        with col5:
-            #grafico ad anello
-            # Sub-layout per centrare il grafico e il dato
-            with col5:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_pulizie"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)  # Mantieni larghezza compatta
-            with col5:
-                st.metric("📊 Profitto Netto (€)", f"{kpis['marginalità_pulizie']:,.2f}")
+        render_anelli_kpi([
+            AnelloKPI("📊 Profitto (€)", kpis.marginalità_totale, kpis.ricavi_totali),
+            AnelloKPI("📊 Cedolare Secca (€)", kpis.marginalità_locazioni, kpis.ricavi_totali),
+            AnelloKPI("📊 Profitto Netto (€)", kpis.marginalità_pulizie, kpis.ricavi_totali),
+        ], disposizione='riga')
 
     st.divider()
 
@@ -809,30 +548,35 @@ def dashboard_proprietari():
     col12, col13, col14 = st.columns([4.5,9,4.5])
 
     with col12:
-        with col12:
-            st.write("📊 Tasso di occupazione (%)")
-        with col12:
-            totale = 100
-            kpi = kpis["tasso_di_occupazione"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False)
+        render_anelli_kpi([AnelloKPI("📊 Tasso di occupazione (%)", kpis.tasso_di_occupazione, 100, formato=",.0f")],
+                          disposizione='riga')
         st.divider()
-        st.metric("📈 Prezzo medio a notte (€)", f"{kpis['prezzo_medio_notte']:,.0f}")
-        st.metric("📈 Valore medio prenotazione (€)", f"{kpis['valore_medio_prenotazione']:,.0f}")
+        st.metric("📈 Prezzo medio a notte (€)", f"{kpis.prezzo_medio_notte:,.0f}")
+        st.metric("📈 Valore medio prenotazione (€)", f"{kpis.valore_medio_prenotazione:,.0f}")
 
 
     with col13:
         # Integrazione nella dashboard
-        fig = visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, start_date, end_date)
+        fig = visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, start_date, end_date,
+                                            workbook.disponibilita_giornaliera, workbook.notti)
         if fig:
             st.plotly_chart(fig, use_container_width=True)
 
     with col14:
-        st.metric("📈 Margine medio a notte (€)", f"{kpis['margine_medio_notte']:,.0f}")
-        st.metric("📈 Margine medio per prenotazione (€)", f"{kpis['margine_medio_prenotazione']:,.0f}")
+        st.metric("📈 Margine medio a notte (€)", f"{kpis.margine_medio_notte:,.0f}")
+        st.metric("📈 Margine medio per prenotazione (€)", f"{kpis.margine_medio_prenotazione:,.0f}")
+        st.divider()
+        st.metric("📈 Notti occupate (€)", f"{kpis.notti_occupate:,.0f}")
+        st.metric("📈 Soggiorno medio ", f"{kpis.soggiorno_medio:,.0f}")
+
+    # Estratto per proprietario, sommato al centesimo in modalità importi esatti
+    if st.session_state.get('importi_esatti') and st.session_state.get('backend') != "SQL":
         st.divider()
-        st.metric("📈 Notti occupate (€)", f"{kpis['notti_occupate']:,.0f}")
-        st.metric("📈 Soggiorno medio ", f"{kpis['soggiorno_medio']:,.0f}")
+        st.subheader("Estratto proprietari")
+        estratto = totali_proprietari_centesimi(workbook.centesimi, dati_filtrati)
+        importi = estratto.columns.drop('Nome Proprietario')
+        estratto[importi] = euro(estratto[importi])
+        st.dataframe(estratto.style.format({col: "{:,.2f}" for col in importi}), hide_index=True)
 
 
 def dashboard_analisi_performance():
@@ -849,9 +593,8 @@ def dashboard_analisi_performance():
         st.error("Nessun file caricato per il calcolo delle notti disponibili.")
         return
 
-    file_path = st.session_state['uploaded_file']
+    workbook = st.session_state['workbook']
     data = st.session_state['data']
-    data = localizzatore(file_path, data)
 
 
     # SEZIONE FILTRI (in sidebar)
@@ -932,11 +675,8 @@ def dashboard_analisi_performance():
                     key="zona_filter_multi"
                 )
 
-        # Filtraggio dei dati principali in base alle date
-        dati_filtrati = data[
-            (data['Data Check-In'] >= pd.Timestamp(start_date)) &
-            (data['Data Check-In'] <= pd.Timestamp(end_date))
-        ]
+        # Filtraggio dei dati principali in base alle date, con le ricerche binarie dell'indice per data
+        dati_filtrati = data.iloc[righe_intervallo(workbook.indice_date, start_date, end_date)]
         # Se non si sta effettuando un confronto, applica i filtri sugli immobili e sulle zone
         if confronto_mode == "Nessun Confronto":
             if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -966,7 +706,7 @@ def dashboard_analisi_performance():
             )
 
         # Calcola le notti disponibili
-        notti_disponibili_df = calculate_available_nigths(file_path, start_date, end_date)
+        notti_disponibili_df = calculate_available_nigths(workbook.disponibilita_giornaliera, start_date, end_date)
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati and confronto_mode == "Nessun Confronto":
             if view_option == "Singolo Appartamento":
                 notti_disponibili_filtrate = notti_disponibili_df[
@@ -992,33 +732,29 @@ def dashboard_analisi_performance():
     if confronto_mode == "Confronto Immobili":
         if immobili_selezionati and isinstance(immobili_selezionati, list) and len(immobili_selezionati) == 2:
             imm1, imm2 = immobili_selezionati[0], immobili_selezionati[1]
-            dati1 = dati_filtrati[dati_filtrati['Nome Appartamento'] == imm1]
-            dati2 = dati_filtrati[dati_filtrati['Nome Appartamento'] == imm2]
-            notti1 = notti_disponibili_filtrate[notti_disponibili_filtrate['Appartamento'] == imm1]
-            notti2 = notti_disponibili_filtrate[notti_disponibili_filtrate['Appartamento'] == imm2]
-            kpis1 = calculate_kpis(dati1, notti1)
-            kpis2 = calculate_kpis(dati2, notti2)
+            kpis1, kpis2 = calcola_kpis_per_gruppo(dati_filtrati, notti_disponibili_filtrate, start_date, end_date,
+                                                   'Nome Appartamento', [imm1, imm2])
             st.subheader("Confronto Immobili")
             colA, colB = st.columns(2)
             with colA:
                 st.subheader(imm1)
-                st.metric("💰 Ricavi Totali (€)", f"{kpis1['ricavi_totali']:,.2f}")
-                st.metric("📈 Ricavi Locazione (€)", f"{kpis1['totale_ricavi_locazione']:,.2f}")
-                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis1['totale_ricavi_pulizie']:,.2f}")
-                st.metric("📈 Totale Commissioni (€)", f"{kpis1['totale_commissioni']:,.2f}")
-                st.metric("🧹 Commissioni OTA (€)", f"{kpis1['commissioni_ota']:,.2f}")
-                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis1['commissioni_proprietari']:,.2f}")
-                st.metric("🧹 Commissioni ITW (€)", f"{kpis1['commissioni_itw']:,.2f}")
+                st.metric("💰 Ricavi Totali (€)", f"{kpis1.ricavi_totali:,.2f}")
+                st.metric("📈 Ricavi Locazione (€)", f"{kpis1.totale_ricavi_locazione:,.2f}")
+                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis1.totale_ricavi_pulizie:,.2f}")
+                st.metric("📈 Totale Commissioni (€)", f"{kpis1.totale_commissioni:,.2f}")
+                st.metric("🧹 Commissioni OTA (€)", f"{kpis1.commissioni_ota:,.2f}")
+                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis1.commissioni_proprietari:,.2f}")
+                st.metric("🧹 Commissioni ITW (€)", f"{kpis1.commissioni_itw:,.2f}")
             with colB:
                 st.subheader(imm2)
-                st.metric("💰 Ricavi Totali (€)", f"{kpis2['ricavi_totali']:,.2f}")
-
-                st.metric("📈 Ricavi Locazione (€)", f"{kpis2['totale_ricavi_locazione']:,.2f}")
-                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis2['totale_ricavi_pulizie']:,.2f}")
-                st.metric("📈 Totale Commissioni (€)", f"{kpis2['totale_commissioni']:,.2f}")
-                st.metric("🧹 Commissioni OTA (€)", f"{kpis2['commissioni_ota']:,.2f}")
-                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis2['commissioni_proprietari']:,.2f}")
-                st.metric("🧹 Commissioni ITW (€)", f"{kpis2['commissioni_itw']:,.2f}")
+                st.metric("💰 Ricavi Totali (€)", f"{kpis2.ricavi_totali:,.2f}")
+
+                st.metric("📈 Ricavi Locazione (€)", f"{kpis2.totale_ricavi_locazione:,.2f}")
+                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis2.totale_ricavi_pulizie:,.2f}")
+                st.metric("📈 Totale Commissioni (€)", f"{kpis2.totale_commissioni:,.2f}")
+                st.metric("🧹 Commissioni OTA (€)", f"{kpis2.commissioni_ota:,.2f}")
+                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis2.commissioni_proprietari:,.2f}")
+                st.metric("🧹 Commissioni ITW (€)", f"{kpis2.commissioni_itw:,.2f}")
             return
         else:
             st.info("Seleziona esattamente due appartamenti per il confronto.")
@@ -1027,39 +763,35 @@ def dashboard_analisi_performance():
     elif confronto_mode == "Confronto Zone":
         if zona_selezionata and isinstance(zona_selezionata, list) and len(zona_selezionata) == 2:
             z1, z2 = zona_selezionata[0], zona_selezionata[1]
-            dati1 = dati_filtrati[dati_filtrati['zona'] == z1]
-            dati2 = dati_filtrati[dati_filtrati['zona'] == z2]
-            notti1 = notti_disponibili_filtrate[dati_filtrati['zona'] == z1]
-            notti2 = notti_disponibili_filtrate[dati_filtrati['zona'] == z2]
-            kpis1 = calculate_kpis(dati1, notti1)
-            kpis2 = calculate_kpis(dati2, notti2)
+            kpis1, kpis2 = calcola_kpis_per_gruppo(dati_filtrati, notti_disponibili_filtrate, start_date, end_date,
+                                                   'zona', [z1, z2])
             st.subheader("Confronto Zone")
             colA, colB = st.columns(2)
             with colA:
                 st.subheader(z1)
-                st.metric("💰 Ricavi Totali (€)", f"{kpis1['ricavi_totali']:,.2f}")
-                st.metric("📈 Ricavi Locazione (€)", f"{kpis1['totale_ricavi_locazione']:,.2f}")
-                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis1['totale_ricavi_pulizie']:,.2f}")
-                st.metric("📈 Totale Commissioni (€)", f"{kpis1['totale_commissioni']:,.2f}")
-                st.metric("🧹 Commissioni OTA (€)", f"{kpis1['commissioni_ota']:,.2f}")
-                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis1['commissioni_proprietari']:,.2f}")
-                st.metric("🧹 Commissioni ITW (€)", f"{kpis1['commissioni_itw']:,.2f}")
+                st.metric("💰 Ricavi Totali (€)", f"{kpis1.ricavi_totali:,.2f}")
+                st.metric("📈 Ricavi Locazione (€)", f"{kpis1.totale_ricavi_locazione:,.2f}")
+                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis1.totale_ricavi_pulizie:,.2f}")
+                st.metric("📈 Totale Commissioni (€)", f"{kpis1.totale_commissioni:,.2f}")
+                st.metric("🧹 Commissioni OTA (€)", f"{kpis1.commissioni_ota:,.2f}")
+                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis1.commissioni_proprietari:,.2f}")
+                st.metric("🧹 Commissioni ITW (€)", f"{kpis1.commissioni_itw:,.2f}")
             with colB:
                 st.subheader(z2)
-                st.metric("💰 Ricavi Totali (€)", f"{kpis2['ricavi_totali']:,.2f}")
-                st.metric("📈 Ricavi Locazione (€)", f"{kpis2['totale_ricavi_locazione']:,.2f}")
-                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis2['totale_ricavi_pulizie']:,.2f}")
-                st.metric("📈 Totale Commissioni (€)", f"{kpis2['totale_commissioni']:,.2f}")
-                st.metric("🧹 Commissioni OTA (€)", f"{kpis2['commissioni_ota']:,.2f}")
-                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis2['commissioni_proprietari']:,.2f}")
-                st.metric("🧹 Commissioni ITW (€)", f"{kpis2['commissioni_itw']:,.2f}")
+                st.metric("💰 Ricavi Totali (€)", f"{kpis2.ricavi_totali:,.2f}")
+                st.metric("📈 Ricavi Locazione (€)", f"{kpis2.totale_ricavi_locazione:,.2f}")
+                st.metric("🧹 Ricavi Pulizie (€)", f"{kpis2.totale_ricavi_pulizie:,.2f}")
+                st.metric("📈 Totale Commissioni (€)", f"{kpis2.totale_commissioni:,.2f}")
+                st.metric("🧹 Commissioni OTA (€)", f"{kpis2.commissioni_ota:,.2f}")
+                st.metric("🧹 Commissioni Proprietari (€)", f"{kpis2.commissioni_proprietari:,.2f}")
+                st.metric("🧹 Commissioni ITW (€)", f"{kpis2.commissioni_itw:,.2f}")
             return
         else:
             st.info("Seleziona esattamente due zone per il confronto.")
             return
 
     # Se non è attivo il confronto (confronto_mode == "Nessun Confronto"), prosegui con la dashboard originale
-    kpis = calculate_kpis(dati_filtrati, notti_disponibili_filtrate)
+    kpis = calcola_kpis(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, immobili_selezionati, zona_selezionata)
 
 
 
@@ -1175,120 +907,56 @@ def dashboard_analisi_performance():
     col1, col2 = st.columns([2,4])
     with col1:
         with col1:
-            st.metric("💰 Ricavi Totali (€)", f"{kpis['ricavi_totali']:,.2f}")
-        grafico_col, metrica_col = st.columns([3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["totale_ricavi_locazione"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="g1")
-        with metrica_col:
-            st.metric("📈 Ricavi Locazione (€)", f"{kpis['totale_ricavi_locazione']:,.2f}")
-        grafico_col, metrica_col = st.columns([3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["totale_ricavi_pulizie"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="g2")
-        with metrica_col:
-            st.metric("📈 Ricavi Pulizie (€)", f"{kpis['totale_ricavi_pulizie']:,.2f}")
-        grafico_col, metrica_col = st.columns([3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["commissioni_proprietari"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="g3")
-        with metrica_col:
-            st.metric("📈 Commissioni Proprietari (€)", f"{kpis['commissioni_proprietari']:,.2f}")
-        grafico_col, metrica_col = st.columns([3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["commissioni_ota"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="g4")
-        with metrica_col:
-            st.metric("📈 Commissioni OTA (€)", f"{kpis['commissioni_ota']:,.2f}")
-        grafico_col, metrica_col = st.columns([3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["costo_pulizie_ps_totali"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="g5")
-        with metrica_col:
-            st.metric("🧹 Costi Pulizie (€)", f"{kpis['costo_pulizie_ps_totali']:,.2f}")
-        grafico_col, metrica_col = st.columns([3, 5])
-        with grafico_col:
-            totale = kpis["ricavi_totali"]
-            kpi = kpis["altri_costi"]
-            grafico_anello = create_donut_chart(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False, key="g6")
-        with metrica_col:
-            st.metric("📈 Altri Costi (€)", f"{kpis['altri_costi']:,.2f}")
+            st.metric("💰 Ricavi Totali (€)", f"{kpis.ricavi_totali:,.2f}")
+        render_anelli_kpi([
+            AnelloKPI("📈 Ricavi Locazione (€)", kpis.totale_ricavi_locazione, kpis.ricavi_totali),
+            AnelloKPI("📈 Ricavi Pulizie (€)", kpis.totale_ricavi_pulizie, kpis.ricavi_totali),
+            AnelloKPI("📈 Commissioni Proprietari (€)", kpis.commissioni_proprietari, kpis.ricavi_totali),
+            AnelloKPI("📈 Commissioni OTA (€)", kpis.commissioni_ota, kpis.ricavi_totali),
+            AnelloKPI("🧹 Costi Pulizie (€)", kpis.costo_pulizie_ps_totali, kpis.ricavi_totali),
+            AnelloKPI("📈 Altri Costi (€)", kpis.altri_costi, kpis.ricavi_totali),
+        ])
     with col2:
         colonne = ['ricavi_totali', 'commissioni_totali', 'marginalità_totale']
-        fig = visualizza_andamento_ricavi(dati_filtrati, colonne)
+        fig = visualizza_andamento_ricavi(dati_filtrati, colonne, workbook.notti, start_date, end_date)
         st.plotly_chart(fig)
         st.divider()
-        col3, col4, col5 = st.columns([1,1,1])
-        with col3:
-            with col3:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_immobile"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)
-            with col3:
-                st.metric("📊 Marginalità Operativa (€)", f"{kpis['marginalità_immobile']:,.2f}")
-        with col4:
-            with col4:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_locazioni"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)
-            with col4:
-                st.metric("📊 Marginalità Locazioni (€)", f"{kpis['marginalità_locazioni']:,.2f}")
-        with col5:
-            with col5:
-                totale = kpis["ricavi_totali"]
-                kpi = kpis["marginalità_pulizie"]
-                grafico_anello = create_donut_chart1(totale, kpi)
-                st.plotly_chart(grafico_anello, use_container_width=False)
-            with col5:
-                st.metric("📊 Marginalità Pulizie (€)", f"{kpis['marginalità_pulizie']:,.2f}")
+        render_anelli_kpi([
+            AnelloKPI("📊 Marginalità Operativa (€)", kpis.marginalità_immobile, kpis.ricavi_totali),
+            AnelloKPI("📊 Marginalità Locazioni (€)", kpis.marginalità_locazioni, kpis.ricavi_totali),
+            AnelloKPI("📊 Marginalità Pulizie (€)", kpis.marginalità_pulizie, kpis.ricavi_totali),
+        ], disposizione='riga')
     st.divider()
     st.title("📊 Analisi Prenotazioni ")
     col12, col13, col14 = st.columns([4.5,9,4.5])
     with col12:
-        with col12:
-            st.write("📊 Tasso di occupazione (%)")
-        with col12:
-            totale = 100
-            kpi = kpis["tasso_di_occupazione"]
-            grafico_anello = create_donut_chart1(totale, kpi)
-            st.plotly_chart(grafico_anello, use_container_width=False)
+        render_anelli_kpi([AnelloKPI("📊 Tasso di occupazione (%)", kpis.tasso_di_occupazione, 100, formato=",.0f")],
+                          disposizione='riga')
         st.divider()
-        st.metric("📈 Prezzo medio a notte (€)", f"{kpis['prezzo_medio_notte']:,.0f}")
-        st.metric("📈 Prezzo pulizie (€)", f"{kpis['prezzo_pulizie']:,.0f}")
-        st.metric("📈 M.S.V medio a notte (€)", f"{kpis['margine_medio_notte']:,.0f}")
-        st.metric("📈 M.S.V pulizie per soggiorno (€)", f"{kpis['margine_medio_pulizie']:,.0f}")
+        st.metric("📈 Prezzo medio a notte (€)", f"{kpis.prezzo_medio_notte:,.0f}")
+        st.metric("📈 Prezzo pulizie (€)", f"{kpis.prezzo_pulizie:,.0f}")
+        st.metric("📈 M.S.V medio a notte (€)", f"{kpis.margine_medio_notte:,.0f}")
+        st.metric("📈 M.S.V pulizie per soggiorno (€)", f"{kpis.margine_medio_pulizie:,.0f}")
     with col13:
-        fig = visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, start_date, end_date)
+        fig = visualizza_andamento_metriche(dati_filtrati, notti_disponibili_filtrate, start_date, end_date,
+                                            workbook.disponibilita_giornaliera, workbook.notti)
         if fig:
             st.plotly_chart(fig, use_container_width=True)
         col13_1, col13_2 = st.columns([2,2])
         with col13_1:
-            st.metric("📈 Notti diponibili ", f"{kpis['notti_disponibili']:,.0f}")
-            st.metric("📈 Numero prenotazion (€)", f"{kpis['numero_prenotazioni']:,.0f}")
+            st.metric("📈 Notti diponibili ", f"{kpis.notti_disponibili:,.0f}")
+            st.metric("📈 Numero prenotazion (€)", f"{kpis.numero_prenotazioni:,.0f}")
         with col13_2:
-            st.metric("📈 Notti occupate ", f"{kpis['notti_occupate']:,.0f}")
-            st.metric("📈 Soggiorno medio ", f"{kpis['soggiorno_medio']:,.0f}")
+            st.metric("📈 Notti occupate ", f"{kpis.notti_occupate:,.0f}")
+            st.metric("📈 Soggiorno medio ", f"{kpis.soggiorno_medio:,.0f}")
     with col14:
-        st.metric("📈 Valore medio prenotazione (€)", f"{kpis['valore_medio_prenotazione']:,.0f}")
-        st.metric("📈 M.S.V medio per prenotazione (€)", f"{kpis['margine_medio_prenotazione']:,.0f}")
-        st.metric("📈 Margine medio per prenotazione (€)", f"{kpis['margine_medio_prenotazione']:,.0f}")
+        st.metric("📈 Valore medio prenotazione (€)", f"{kpis.valore_medio_prenotazione:,.0f}")
+        st.metric("📈 M.S.V medio per prenotazione (€)", f"{kpis.margine_medio_prenotazione:,.0f}")
+        st.metric("📈 Margine medio per prenotazione (€)", f"{kpis.margine_medio_prenotazione:,.0f}")
         st.divider()
-        st.metric("📈 Costo Pulizia (€)", f"{kpis['costo_pulizie_ps']:,.0f}")
-        st.metric("📈 Costo Scorte (€)", f"{kpis['costo_scorte_ps']:,.0f}")
-        st.metric("📈 Costo Manutenzioni (€)", f"{kpis['costo_manutenzioni_ps']:,.0f}")
+        st.metric("📈 Costo Pulizia (€)", f"{kpis.costo_pulizie_ps:,.0f}")
+        st.metric("📈 Costo Scorte (€)", f"{kpis.costo_scorte_ps:,.0f}")
+        st.metric("📈 Costo Manutenzioni (€)", f"{kpis.costo_manutenzioni_ps:,.0f}")
 
 
 def render_calcolatore():
@@ -1307,10 +975,8 @@ def render_calcolatore():
         st.error("Nessun file caricato per il calcolo delle notti disponibili.")
         return
 
-    file_path = st.session_state['uploaded_file']
+    workbook = st.session_state['workbook']
     data = st.session_state['data']
-    data = localizzatore(file_path, data)
-    st.write(data)
 
         # Sezione Filtri
     with st.sidebar.expander("🔍 Filtro Dati"):
@@ -1368,11 +1034,8 @@ def render_calcolatore():
                 key="zona_filter_multi"
             )
 
-        # Filtraggio dei dati principali in base alle date
-        dati_filtrati = data[
-            (data['Data Check-In'] >= pd.Timestamp(start_date)) &
-            (data['Data Check-In'] <= pd.Timestamp(end_date))
-        ]
+        # Filtraggio dei dati principali in base alle date, con le ricerche binarie dell'indice per data
+        dati_filtrati = data.iloc[righe_intervallo(workbook.indice_date, start_date, end_date)]
 
         # Filtra in base agli immobili
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -1403,7 +1066,7 @@ def render_calcolatore():
             )
 
         # Calcola le notti disponibili
-        notti_disponibili_df = calculate_available_nigths(file_path, start_date, end_date)
+        notti_disponibili_df = calculate_available_nigths(workbook.disponibilita_giornaliera, start_date, end_date)
 
         # Filtra le notti disponibili in base al filtro appartamento
         if view_option != "Tutti gli Appartamenti" and immobili_selezionati:
@@ -1428,16 +1091,118 @@ def render_calcolatore():
     if 'filtered_notti_disponibili' in st.session_state:
         notti_disponibili_filtrate = st.session_state['filtered_notti_disponibili']
 
+    # Calcolo dei KPI
+    kpis = calcola_kpis(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, immobili_selezionati, zona_selezionata)
+    storico = parametri_storici(kpis)
+
+    st.write("Inserisci i dettagli dell'immobile:")
 
-    st.write(dati_filtrati)
+    # Intervalli dei parametri, centrati sui valori storici delle prenotazioni selezionate
+    col1, col2 = st.columns(2)
+    with col1:
+        occupazione = st.slider("Tasso di occupazione (%)", 0.0, 100.0, (30.0, 100.0))
+        prezzo_max = max(storico['prezzo_notte'] * 2, 100.0)
+        prezzo_notte = st.slider(
+            "Prezzo per notte (€)", 0.0, prezzo_max,
+            (storico['prezzo_notte'] * 0.7, storico['prezzo_notte'] * 1.3)
+        )
+        pulizie_max = max(storico['prezzo_pulizie'] * 2, 50.0)
+        prezzo_pulizie = st.slider(
+            "Prezzo pulizie per soggiorno (€)", 0.0, pulizie_max,
+            (storico['prezzo_pulizie'] * 0.8, storico['prezzo_pulizie'] * 1.2)
+        )
+    with col2:
+        commissione_ota = st.slider(
+            "Commissione OTA (%)", 0.0, 40.0,
+            (min(max(storico['commissione_ota'] - 5, 0.0), 35.0), min(storico['commissione_ota'] + 5, 40.0))
+        )
+        costi_fissi = st.slider("Costi fissi annui (€)", 0.0, 50000.0, (2000.0, 20000.0), step=500.0)
+        passi = st.slider("Valori per parametro", 3, 25, 10)
+        notti_anno = st.number_input("Notti disponibili nell'anno", min_value=1, max_value=366, value=365)
+
+    griglia = valuta_scenari(
+        np.linspace(*occupazione, passi),
+        np.linspace(*prezzo_notte, passi),
+        np.linspace(*prezzo_pulizie, passi),
+        np.linspace(*commissione_ota, passi),
+        np.linspace(*costi_fissi, passi),
+        notti_disponibili=notti_anno,
+        soggiorno_medio=storico['soggiorno_medio'],
+        quota_proprietari=storico['quota_proprietari'],
+    )
+    st.caption(f"{griglia.margine.size:,} scenari valutati")
+
+    # Sezione della griglia mostrata: pulizie, commissione OTA e costi fissi scelti tra i valori calcolati
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        indice_pulizie = st.select_slider(
+            "Pulizie (€)", range(passi), value=passi // 2, format_func=lambda i: f"{griglia.prezzo_pulizie[i]:,.2f}"
+        )
+    with col2:
+        indice_ota = st.select_slider(
+            "Commissione OTA (%)", range(passi), value=passi // 2, format_func=lambda i: f"{griglia.commissione_ota[i]:.1f}"
+        )
+    with col3:
+        indice_fissi = st.select_slider(
+            "Costi fissi (€)", range(passi), value=passi // 2, format_func=lambda i: f"{griglia.costi_fissi[i]:,.0f}"
+        )
 
+    st.subheader("Margine annuo per occupazione e prezzo")
+    fig = create_heatmap_scenari(
+        griglia.margine[:, :, indice_pulizie, indice_ota, indice_fissi], griglia.occupazione, griglia.prezzo_notte
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
+    st.subheader("Occupazione di pareggio (%)")
+    st.dataframe(tabella_pareggio(griglia, indice_pulizie, indice_ota).style.format("{:.1f}", na_rep="—"))
 
-    # Calcolo dei KPI
-    kpis = calculate_kpis(dati_filtrati, notti_disponibili_filtrate)
+    # Simulazione di un nuovo immobile, con distribuzioni stimate dagli appartamenti della stessa zona
+    st.divider()
+    st.subheader("Simulazione di un nuovo immobile")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        zona_simulazione = st.selectbox("Zona degli immobili comparabili", sorted(data['zona'].dropna().unique()))
+        prove = st.select_slider("Anni simulati", [10_000, 50_000, 100_000, 200_000, 500_000], value=100_000)
+    with col2:
+        costi_fissi_simulazione = st.number_input("Costi fissi annui previsti (€)", min_value=0.0, value=10000.0, step=500.0)
+        costi_fissi_dev = st.number_input("Incertezza sui costi fissi (€)", min_value=0.0, value=1000.0, step=100.0)
+    with col3:
+        notti_anno_simulazione = st.number_input(
+            "Notti disponibili del nuovo immobile", min_value=1, max_value=366, value=365
+        )
 
+    # Le distribuzioni usano tutti gli appartamenti della zona nel periodo selezionato
+    dati_periodo = data.iloc[righe_intervallo(workbook.indice_date, start_date, end_date)]
+    parametri = stima_parametri(
+        dati_periodo, notti_disponibili_df, zona_simulazione,
+        costi_fissi_simulazione, costi_fissi_dev, notti_anno_simulazione
+    )
+    if parametri.comparabili == 0:
+        st.warning("Nessuna prenotazione nella zona selezionata per il periodo scelto.")
+    else:
+        risultato = simula_margine(parametri, prove)
+        st.caption(f"{risultato.prove:,} anni simulati su {parametri.comparabili} immobili comparabili")
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Margine mediano (€)", f"{risultato.percentili['P50']:,.2f}")
+        col2.metric("P5 (€)", f"{risultato.percentili['P5']:,.2f}")
+        col3.metric("P95 (€)", f"{risultato.percentili['P95']:,.2f}")
+        col4.metric("Probabilità di perdita", f"{risultato.probabilita_perdita:.1%}")
+
+        fig = create_istogramma_simulazione(risultato.conteggi, risultato.bordi, risultato.percentili)
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def render_anelli_kpi(voci, disposizione='colonna'):
+    """
+    Visualizza un gruppo di KPI con il loro anello in un solo elemento HTML (vedi create_anelli_kpi),
+    invece di una figura Plotly e di una metrica per ogni KPI.
 
-    st.write("Inserisci i dettagli dell'immobile:")
+    Parametri:
+      - voci (list): AnelloKPI da visualizzare.
+      - disposizione (str): 'colonna' oppure 'riga'.
+    """
+    st.markdown(create_anelli_kpi(voci, disposizione), unsafe_allow_html=True)
 
 
 def render_metric_with_info(metric_label, metric_value, info_text, value_format=",.2f", col_ratio=(0.3, 5)):
@@ -1446,7 +1211,7 @@ def render_metric_with_info(metric_label, metric_value, info_text, value_format=
 
     Parametri:
       - metric_label (str): l'etichetta della metrica (es. "Costi di gestione (€)")
-      - metric_value (float): il valore della metrica (es. kpis['commissioni_proprietari'])
+      - metric_value (float): il valore della metrica (es. kpis.commissioni_proprietari)
       - info_text (str): il testo da mostrare al passaggio del mouse sull'icona info.
       - value_format (str): formato da utilizzare per il valore (default ",.2f").
       - col_ratio (tuple): rapporto delle colonne per il valore e il bottone info (default (5, 0.3)).
@@ -1459,3 +1224,103 @@ def render_metric_with_info(metric_label, metric_value, info_text, value_format=
             f'<span class="info-icon" title="{info_text}">ℹ️</span>',
             unsafe_allow_html=True
         )
+
+
+def calcola_kpis(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, immobili=None, zone=None):
+    """
+    Calcola i KPI con il motore scelto nel menù: cubo dei KPI del workbook (kpi_cube) oppure
+    query SQL sul database. Con il cubo i filtri sono applicati alle righe pre-aggregate e i mesi
+    parziali del periodo sono sommati con l'indice per data (indice_date), senza scorrere le prenotazioni.
+    Con gli importi esatti attivi (motore pandas) i KPI sono sommati in centesimi (centesimi.py).
+
+    I KPI del periodo selezionato sono calcolati sulle prenotazioni con check-in nel periodo, come
+    il filtro delle date della dashboard e il motore SQL; solo i grafici per periodo ripartiscono
+    notti e importi sulle singole notti (notti_prenotazioni).
+
+    Parametri:
+      - dati_filtrati: prenotazioni già filtrate (usate solo con gli importi esatti: il cubo riapplica i filtri).
+      - notti_disponibili_filtrate: notti disponibili degli appartamenti selezionati (motore pandas).
+      - start_date, end_date, immobili, zone: filtri applicati;
+        immobili e zone possono essere un singolo valore o una lista.
+    """
+    if st.session_state.get('backend') == "SQL":
+        return calculate_kpis_sql(connessione_database(), start_date, end_date, _come_lista(immobili), _come_lista(zone))
+    workbook = st.session_state['workbook']
+    if st.session_state.get('importi_esatti'):
+        # Importi in centesimi interi, sommati sulle prenotazioni filtrate
+        return calculate_kpis_centesimi(workbook.centesimi, dati_filtrati, notti_disponibili_filtrate)
+    # Mesi interi dal cubo dei KPI, mesi parziali dall'indice per data: entrambi calcolati una volta per workbook
+    return kpi_da_cubo(workbook.cubo, workbook.indice_date, notti_disponibili_filtrate, start_date, end_date,
+                       _come_lista(immobili), _come_lista(zone))
+
+
+def calcola_kpis_per_gruppo(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, chiave, valori):
+    """
+    Calcola i KPI di più appartamenti o zone: con il motore pandas in un solo calculate_kpis_grouped,
+    con il motore SQL con una query per gruppo.
+
+    Parametri:
+      - chiave (str): 'Nome Appartamento' oppure 'zona'.
+      - valori (list): appartamenti o zone di cui calcolare i KPI.
+
+    Ritorna:
+      - lista di KPI, uno per valore, nello stesso ordine di valori.
+    """
+    if st.session_state.get('backend') == "SQL":
+        filtro = 'immobili' if chiave == 'Nome Appartamento' else 'zone'
+        return [calcola_kpis(dati_filtrati, notti_disponibili_filtrate, start_date, end_date, **{filtro: valore})
+                for valore in valori]
+
+    dati = dati_filtrati[dati_filtrati[chiave].isin(valori)]
+    gruppi = calculate_kpis_grouped(dati, notti_disponibili_filtrate, chiave).set_index(chiave)
+    risultati = []
+    for valore in valori:
+        if valore in gruppi.index:
+            risultati.append(KPI(**gruppi.loc[valore, [campo.name for campo in fields(KPI)]].to_dict()))
+        else:
+            # Gruppo senza prenotazioni nel periodo: KPI a zero come con calculate_kpis
+            risultati.append(calculate_kpis(dati.iloc[:0], notti_disponibili_filtrate.iloc[:0]))
+    return risultati
+
+
+def elabora_spese(spese_filtrate, start_date=None, end_date=None):
+    """
+    Calcola i totali delle spese con il motore scelto nel menù: pandas sulla tabella netta
+    delle spese (DatiWorkbook.spese_nette, eventualmente filtrata) oppure SQL.
+    """
+    if st.session_state.get('backend') == "SQL":
+        return eleboratore_spese_sql(connessione_database(), start_date, end_date)
+    return eleboratore_spese(spese_filtrate)
+
+
+def connessione_database():
+    """
+    Restituisce la connessione al database SQLite del workbook corrente (un file per workbook,
+    vedi sql_storage.database_workbook), creando il database se non esiste ancora.
+    """
+    workbook = st.session_state['workbook']
+    if st.session_state.get('db_workbook') is not workbook:
+        imposta_database(database_workbook(workbook), workbook)
+    return st.session_state['db_conn']
+
+
+def imposta_database(conn, workbook):
+    """
+    Salva nel session state la connessione al database di workbook, chiudendo la precedente.
+    """
+    precedente = st.session_state.get('db_conn')
+    if precedente is not None:
+        precedente.close()
+    st.session_state['db_conn'] = conn
+    st.session_state['db_workbook'] = workbook
+
+
+def _come_lista(selezione):
+    """
+    Normalizza la selezione di un filtro (None, valore singolo o lista) in una lista o None.
+    """
+    if selezione is None or (isinstance(selezione, list) and not selezione):
+        return None
+    if isinstance(selezione, (list, tuple)):
+        return list(selezione)
+    return [selezione]
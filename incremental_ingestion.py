@@ -0,0 +1,292 @@
+import hashlib
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from calculate_available_nights import elabora_disponibilita
+from data_processing import COLONNE_PRENOTAZIONI, elabora_posizioni, elabora_spese, preprocess_data, unisci_posizioni
+from kpi_cube import aggiorna_cubo
+from motori_lettura import apri_fogli
+from schema import applica_schema
+from workbook_loader import DatiWorkbook, fogli_grezzi
+
+# Codice delle righe IVA del Foglio 4: appartengono alla spesa che le precede
+CODICE_IVA = '59.01.01'
+
+# Colonne che identificano una prenotazione tra un export e il successivo
+CHIAVE_PRENOTAZIONE = ['ID Appartamento', 'Data Check-In', 'Data Check-Out']
+
+# Colonne della riga di spesa (Codice, data, Immobile associato alla spesa, nelle colonne lette
+# del Foglio 4) che identificano un gruppo di spese tra un export e il successivo
+CHIAVE_SPESA = [0, 4, 6]
+
+
+@dataclass
+class Impronte:
+    """
+    Impronte delle righe già elaborate, confrontate con il nuovo export per trovare le differenze.
+    """
+    prenotazioni: pd.DataFrame       # una riga per prenotazione del Foglio 1: chiave e impronta del contenuto
+    chiavi_prenotazioni: np.ndarray  # chiave di ogni riga di DatiWorkbook.prenotazioni
+    spese: pd.DataFrame              # un gruppo del Foglio 4 (spesa seguita dalle sue righe IVA) per riga:
+                                     # chiave del contenuto e identità (vedi CHIAVE_SPESA)
+    chiavi_spese: np.ndarray         # chiave del gruppo di ogni riga di DatiWorkbook.spese
+    posizioni: str                   # impronta dell'intero Foglio 3
+
+
+@dataclass
+class Delta:
+    """
+    Differenze applicate da carica_workbook_incrementale, per aggiornare il database.
+    """
+    completo: bool                   # True se tutte le prenotazioni sono state rielaborate
+    prenotazioni_rimosse: np.ndarray = field(default_factory=lambda: np.empty(0, dtype='uint64'))
+    prenotazioni_nuove: np.ndarray = field(default_factory=lambda: np.empty(0, dtype='uint64'))
+    spese_rimosse: np.ndarray = field(default_factory=lambda: np.empty(0, dtype='uint64'))
+    spese_nuove: np.ndarray = field(default_factory=lambda: np.empty(0, dtype='uint64'))
+    # Righe inserite, modificate e rimosse per foglio
+    riepilogo: dict = field(default_factory=dict)
+
+
+def carica_workbook_incrementale(uploaded_file, precedente=None, formato=None, motore=None):
+    """
+    Aggiorna il workbook già caricato con un nuovo export, elaborando solo le righe cambiate.
+
+    Le prenotazioni sono confrontate per ID appartamento, check-in e check-out (le ripetizioni
+    della stessa chiave sono numerate in ordine); le spese per gruppi di righe (spesa e righe IVA
+    successive) identificati dal contenuto, con codice, data e immobile della spesa per
+    riconoscere i gruppi modificati. Conversione di date e importi, colonne derivate e
+    unione con le posizioni vengono eseguite solo sulle righe inserite o modificate; le altre sono
+    riprese da `precedente`. Le righe restano nell'ordine del foglio, come con carica_workbook.
+    Se `precedente` ha già il cubo dei KPI, il nuovo cubo è aggiornato con le sole righe
+    cambiate (vedi kpi_cube.aggiorna_cubo). La lettura del file resta completa, perché serve
+    al confronto.
+
+    Parametri:
+        uploaded_file: file del nuovo export (vedi carica_workbook).
+        precedente (DatiWorkbook): workbook caricato in precedenza. Senza impronte (es. letto
+                                   dalla cache) tutte le righe vengono elaborate.
+        formato, motore: vedi motori_lettura.apri_fogli.
+
+    Ritorna:
+        - DatiWorkbook aggiornato, con le nuove impronte
+        - Delta con le chiavi delle righe rimosse e nuove e il riepilogo per foglio
+    """
+    inizio = time.perf_counter()
+    impronte = precedente.impronte if precedente is not None else None
+    anomalie = {'Prenotazioni': {}, 'Spese': {}}
+
+    with apri_fogli(uploaded_file, formato, motore) as (motore, fogli):
+        grezzi = fogli_grezzi(fogli)
+
+    posizioni = elabora_posizioni(grezzi['posizioni'])
+    impronta_posizioni = hashlib.sha256(
+        pd.util.hash_pandas_object(posizioni, index=False).to_numpy().tobytes()
+    ).hexdigest()
+    completo = impronte is None or impronte.posizioni != impronta_posizioni
+
+    prenotazioni, chiavi_prenotazioni, tabella, delta_prenotazioni = _aggiorna_prenotazioni(
+        grezzi['prenotazioni'], posizioni, None if impronte is None else precedente, completo,
+        anomalie['Prenotazioni']
+    )
+    spese, chiavi_spese, gruppi, delta_spese = _aggiorna_spese(
+        grezzi['spese'], None if impronte is None else precedente, anomalie['Spese']
+    )
+
+    workbook = DatiWorkbook(
+        prenotazioni=prenotazioni,
+        disponibilita=elabora_disponibilita(grezzi['disponibilita']),
+        posizioni=posizioni,
+        spese=spese,
+        righe_non_valide={foglio: righe for foglio, righe in anomalie.items() if righe},
+        motore=motore,
+        impronte=Impronte(tabella, chiavi_prenotazioni, gruppi, chiavi_spese, impronta_posizioni),
+    )
+    delta = Delta(
+        completo=completo,
+        prenotazioni_rimosse=delta_prenotazioni['rimosse'],
+        prenotazioni_nuove=delta_prenotazioni['nuove'],
+        spese_rimosse=delta_spese['rimosse'],
+        spese_nuove=delta_spese['nuove'],
+        riepilogo={'Prenotazioni': delta_prenotazioni['conteggi'], 'Spese': delta_spese['conteggi']},
+    )
+    if delta_prenotazioni['righe'] is not None and 'cubo' in vars(precedente):
+        # Il cubo dei KPI già calcolato viene aggiornato con le sole righe cambiate; le altre
+        # proprietà derivate del workbook sono ricalcolate al primo utilizzo
+        workbook.cubo = aggiorna_cubo(precedente.cubo, *delta_prenotazioni['righe'])
+    workbook.tempo_lettura = time.perf_counter() - inizio
+    return workbook, delta
+
+
+def _aggiorna_prenotazioni(testo, posizioni, precedente, completo, anomalie):
+    """
+    Elabora le prenotazioni nuove o modificate e le unisce a quelle invariate di `precedente`.
+
+    Se `completo` è True (primo caricamento o posizioni cambiate) le righe invariate vengono
+    riunite alle nuove posizioni senza riconvertirne date e importi.
+    """
+    testo.columns = COLONNE_PRENOTAZIONI
+    testo = testo.dropna(subset=['ID Appartamento'])
+    tabella = pd.DataFrame({
+        'chiave': _chiavi(pd.util.hash_pandas_object(testo[CHIAVE_PRENOTAZIONE], index=False)),
+        'impronta': pd.util.hash_pandas_object(testo, index=False).to_numpy(),
+    }, index=testo.index)
+
+    if precedente is None:
+        vecchia = tabella.iloc[:0]
+        base = precedente_chiavi = None
+    else:
+        vecchia = precedente.impronte.prenotazioni
+        base, precedente_chiavi = precedente.prenotazioni, precedente.impronte.chiavi_prenotazioni
+
+    invariate = pd.MultiIndex.from_frame(tabella).isin(pd.MultiIndex.from_frame(vecchia))
+    chiave_nota = tabella['chiave'].isin(vecchia['chiave']).to_numpy()
+    rimosse = vecchia['chiave'][~vecchia['chiave'].isin(tabella['chiave'])].to_numpy()
+    modificate = chiave_nota & ~invariate
+
+    # Solo le righe inserite o modificate passano per conversione e colonne derivate
+    elaborate = preprocess_data(testo[~invariate], anomalie)
+    elaborate, chiavi_elaborate = _unisci_con_chiavi(
+        elaborate, tabella['chiave'].reindex(elaborate.index).to_numpy(), posizioni
+    )
+
+    parti, chiavi = [elaborate], [chiavi_elaborate]
+    if base is not None:
+        da_tenere = np.isin(precedente_chiavi, tabella['chiave'].to_numpy()[invariate])
+        tenute, chiavi_tenute = base[da_tenere], precedente_chiavi[da_tenere]
+        if completo:
+            # Posizioni cambiate: le righe invariate vengono riunite, senza duplicati di merge precedenti
+            unica = ~pd.Series(chiavi_tenute).duplicated().to_numpy()
+            tenute = tenute[unica].drop(columns=posizioni.columns)
+            tenute, chiavi_tenute = _unisci_con_chiavi(tenute, chiavi_tenute[unica], posizioni)
+        parti.insert(0, tenute)
+        chiavi.insert(0, chiavi_tenute)
+
+    chiavi = np.concatenate(chiavi)
+    if base is not None and not completo and len(elaborate) == 0 and len(rimosse) == 0:
+        # Nessuna differenza: il DataFrame precedente viene riusato così com'è
+        prenotazioni = base
+    else:
+        # Righe nell'ordine del nuovo foglio, come con un caricamento completo (la merge con le
+        # posizioni può ripetere una riga: le ripetizioni restano consecutive)
+        posizione = pd.Series(np.arange(len(tabella)), index=tabella['chiave'].to_numpy())
+        ordine = np.argsort(posizione.reindex(chiavi).to_numpy(), kind='stable')
+        prenotazioni, _ = applica_schema(pd.concat(parti, ignore_index=True).iloc[ordine].reset_index(drop=True))
+        chiavi = chiavi[ordine]
+
+    delta = {
+        'rimosse': np.concatenate([rimosse, tabella['chiave'].to_numpy()[modificate]]),
+        'nuove': np.asarray(chiavi_elaborate),
+        # Righe di `precedente` tolte (rimosse o vecchia versione delle modificate) e righe
+        # elaborate, già nei tipi dello schema, per aggiornare il cubo dei KPI; None se il
+        # confronto non è possibile
+        'righe': None if base is None or completo else (
+            base[~da_tenere], prenotazioni[np.isin(chiavi, chiavi_elaborate)]
+        ),
+        'conteggi': {
+            'inserite': int((~chiave_nota).sum()),
+            'modificate': int(modificate.sum()),
+            'rimosse': len(rimosse),
+        },
+    }
+    return prenotazioni, chiavi, tabella.reset_index(drop=True), delta
+
+
+def _unisci_con_chiavi(prenotazioni, chiavi, posizioni):
+    """
+    Unisce le posizioni alle prenotazioni mantenendo la chiave di ogni riga risultante.
+    """
+    unite = unisci_posizioni(prenotazioni.assign(_chiave=chiavi), posizioni)
+    return unite.drop(columns='_chiave'), unite['_chiave'].to_numpy(dtype='uint64')
+
+
+def _aggiorna_spese(testo, precedente, anomalie):
+    """
+    Elabora i gruppi di spese nuovi e li unisce a quelli invariati di `precedente`, nell'ordine del foglio.
+
+    Un gruppo è una spesa con importo totale seguita dalle sue righe IVA: così le righe IVA
+    ricevono data e settore dalla spesa corretta anche elaborando solo una parte del foglio.
+    """
+    codice, totale = testo.iloc[:, 0], testo.iloc[:, 3]
+    gruppo = ((codice != CODICE_IVA) & totale.notna()).cumsum().to_numpy()
+    # I gruppi sono righe consecutive: posizione della prima riga di ogni gruppo
+    inizi = np.flatnonzero(np.diff(gruppo, prepend=-1))
+    tabella = pd.DataFrame({
+        'chiave': _chiavi(_impronte_gruppi(testo, gruppo, inizi)),
+        'identita': _chiavi(pd.util.hash_pandas_object(testo.iloc[inizi, CHIAVE_SPESA], index=False)),
+    })
+    chiavi_gruppi = tabella['chiave'].to_numpy()
+    chiavi_righe = np.repeat(chiavi_gruppi, np.diff(np.append(inizi, len(testo))))
+
+    if precedente is None:
+        vecchia, base, precedente_chiavi = tabella.iloc[:0], None, None
+    else:
+        vecchia = precedente.impronte.spese
+        base, precedente_chiavi = precedente.spese, precedente.impronte.chiavi_spese
+    vecchie = vecchia['chiave'].to_numpy()
+
+    nota = np.isin(chiavi_righe, vecchie)
+    rimosse = vecchie[~np.isin(vecchie, chiavi_gruppi)]
+
+    # L'indice di elabora_spese è la posizione della riga nel foglio
+    elaborate = elabora_spese(testo[~nota].copy(), anomalie)
+    parti = [elaborate]
+    chiavi = [chiavi_righe[elaborate.index]]
+    ordine = [elaborate.index.to_numpy()]
+
+    if base is not None:
+        # Le righe invariate prendono la posizione del proprio gruppo nel nuovo foglio
+        prima_riga = pd.Series(inizi, index=chiavi_gruppi)
+        da_tenere = np.isin(precedente_chiavi, chiavi_righe[nota])
+        parti.insert(0, base[da_tenere])
+        chiavi.insert(0, precedente_chiavi[da_tenere])
+        ordine.insert(0, prima_riga.reindex(precedente_chiavi[da_tenere]).to_numpy())
+
+    spese = pd.concat(parti)
+    posizione = np.argsort(np.concatenate(ordine), kind='stable')
+    spese = spese.iloc[posizione].reset_index(drop=True)
+
+    # Gruppi nuovi o spariti; tra questi, quelli con la stessa identità nei due export sono modificati
+    nuovi = ~np.isin(chiavi_gruppi, vecchie)
+    identita_nota = tabella['identita'].isin(vecchia['identita']).to_numpy()
+    identita_rimasta = vecchia['identita'].isin(tabella['identita']).to_numpy()
+    delta = {
+        'rimosse': rimosse,
+        'nuove': chiavi_gruppi[nuovi],
+        'conteggi': {
+            'inserite': int((nuovi & ~identita_nota).sum()),
+            'modificate': int((nuovi & identita_nota).sum()),
+            'rimosse': int((~np.isin(vecchie, chiavi_gruppi) & ~identita_rimasta).sum()),
+        },
+    }
+    return spese, np.concatenate(chiavi)[posizione], tabella, delta
+
+
+def _impronte_gruppi(testo, gruppo, inizi):
+    """
+    Impronta del contenuto di ogni gruppo di righe consecutive, nell'ordine delle righe.
+
+    Ogni impronta di riga è combinata con la sua posizione nel gruppo (hash della coppia), poi
+    le impronte del gruppo sono unite con uno XOR cumulato (np.bitwise_xor.reduceat).
+    """
+    if len(testo) == 0:
+        return np.empty(0, dtype='uint64')
+    posizione_nel_gruppo = np.arange(len(testo)) - np.repeat(inizi, np.diff(np.append(inizi, len(testo))))
+    impronte_righe = pd.util.hash_pandas_object(testo, index=False).to_numpy()
+    mescolate = pd.util.hash_pandas_object(
+        pd.DataFrame({'impronta': impronte_righe, 'posizione': posizione_nel_gruppo}), index=False
+    ).to_numpy()
+    return np.bitwise_xor.reduceat(mescolate, inizi)
+
+
+def _chiavi(impronte):
+    """
+    Rende univoche le impronte ripetute numerandone le occorrenze (prima, seconda, ...).
+    """
+    impronte = pd.Series(np.asarray(impronte, dtype='uint64'))
+    occorrenza = impronte.groupby(impronte).cumcount()
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({'impronta': impronte, 'occorrenza': occorrenza}), index=False
+    ).to_numpy()
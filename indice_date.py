@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from centesimi import blocco_centesimi
+from kpis import COLONNE_BLOCCO
+
+
+@dataclass(frozen=True)
+class IndiceDate:
+    """
+    Prenotazioni ordinate per data di check-in, con le somme cumulate del blocco dei KPI in
+    centesimi (centesimi.blocco_centesimi): la somma su un intervallo di date è la differenza
+    di due righe, esatta perché intera.
+
+    L'ordine globale risponde ai filtri sulle sole date; l'ordine per appartamento (e zona)
+    risponde ai filtri su appartamenti e zone, un segmento contiguo per appartamento.
+    """
+    secondi: np.ndarray                # check-in ordinati, in secondi dal 1970 (int64)
+    ordine: np.ndarray                 # posizione in DatiWorkbook.prenotazioni di ogni check-in ordinato
+    cumulata: np.ndarray               # int64 (prenotazioni + 1) × COLONNE_BLOCCO, nell'ordine globale
+    segmenti: pd.DataFrame             # un segmento per coppia 'Nome Appartamento', 'zona'
+    chiavi: np.ndarray                 # segmento * ampiezza + secondi dal primo check-in, ordinate
+    cumulata_segmenti: np.ndarray      # int64 (prenotazioni + 1) × COLONNE_BLOCCO, nell'ordine di chiavi
+    minimo: int                        # primo check-in, in secondi dal 1970
+    ampiezza: int                      # secondi tra primo e ultimo check-in + 2, passo tra due segmenti
+
+
+def costruisci_indice(prenotazioni):
+    """
+    Ordina le prenotazioni per check-in (globalmente e per appartamento) e calcola le somme
+    cumulate del blocco dei KPI in centesimi nei due ordini.
+
+    Parametri:
+        prenotazioni (DataFrame): prenotazioni elaborate (DatiWorkbook.prenotazioni).
+
+    Ritorna:
+        IndiceDate pronto per somme_intervallo.
+    """
+    blocco = blocco_centesimi(prenotazioni)
+    secondi = prenotazioni['Data Check-In'].to_numpy(dtype='datetime64[s]').astype('int64')
+
+    ordine = np.argsort(secondi, kind='stable')
+
+    # Segmenti: coppie appartamento/zona nell'ordine di prima comparsa (zona mancante inclusa)
+    coppie = prenotazioni[['Nome Appartamento', 'zona']]
+    segmento = coppie.groupby(list(coppie.columns), observed=True, dropna=False, sort=False).ngroup().to_numpy()
+    segmenti = coppie.drop_duplicates().reset_index(drop=True)
+
+    minimo = int(secondi.min()) if len(secondi) else 0
+    ampiezza = int(secondi.max()) - minimo + 2 if len(secondi) else 2
+    chiavi = segmento.astype('int64') * ampiezza + (secondi - minimo)
+    ordine_segmenti = np.argsort(chiavi, kind='stable')
+
+    return IndiceDate(
+        secondi=secondi[ordine],
+        ordine=ordine,
+        cumulata=_cumulata(blocco[ordine]),
+        segmenti=segmenti,
+        chiavi=chiavi[ordine_segmenti],
+        cumulata_segmenti=_cumulata(blocco[ordine_segmenti]),
+        minimo=minimo,
+        ampiezza=ampiezza,
+    )
+
+
+def somme_intervallo(indice, start_date, end_date, immobili=None, zone=None):
+    """
+    Somme delle colonne COLONNE_BLOCCO per le prenotazioni con check-in tra start_date
+    ed end_date (estremi inclusi), con due ricerche binarie per segmento selezionato.
+
+    Parametri:
+        indice (IndiceDate): indice del workbook (DatiWorkbook.indice_date).
+        start_date, end_date: intervallo sulla data di check-in.
+        immobili, zone (list): appartamenti e zone da includere (None = tutti).
+
+    Ritorna:
+        array int64 con una somma per colonna di COLONNE_BLOCCO (importi in centesimi, vedi
+        centesimi.somme_in_euro).
+    """
+    if not immobili and not zone:
+        basso, alto = _estremi(indice, start_date, end_date)
+        return indice.cumulata[alto] - indice.cumulata[basso]
+
+    inizio, fine = _secondi(start_date), _secondi(end_date)
+    selezionati = np.ones(len(indice.segmenti), dtype=bool)
+    if immobili:
+        selezionati &= indice.segmenti['Nome Appartamento'].isin(immobili).to_numpy()
+    if zone:
+        selezionati &= indice.segmenti['zona'].isin(zone).to_numpy()
+    base = np.flatnonzero(selezionati).astype('int64') * indice.ampiezza
+
+    # Fuori dall'intervallo dei check-in le date sono riportate ai bordi del segmento
+    inizio = np.clip(inizio - indice.minimo, -1, indice.ampiezza - 1)
+    fine = np.clip(fine - indice.minimo, -1, indice.ampiezza - 1)
+    basso = np.searchsorted(indice.chiavi, base + inizio, side='left')
+    # Con fine prima di inizio l'intervallo è vuoto
+    alto = np.maximum(np.searchsorted(indice.chiavi, base + fine, side='right'), basso)
+    return (indice.cumulata_segmenti[alto] - indice.cumulata_segmenti[basso]).sum(axis=0)
+
+
+def righe_intervallo(indice, start_date, end_date):
+    """
+    Posizioni in DatiWorkbook.prenotazioni delle prenotazioni con check-in tra start_date ed
+    end_date (estremi inclusi), in ordine crescente: con due ricerche binarie al posto del
+    confronto su tutte le date, `prenotazioni.iloc[righe]` è il filtro delle date della dashboard.
+    """
+    basso, alto = _estremi(indice, start_date, end_date)
+    return np.sort(indice.ordine[basso:alto])
+
+
+def _estremi(indice, start_date, end_date):
+    """
+    Righe dell'ordine globale che delimitano i check-in tra start_date ed end_date (alto escluso).
+    """
+    basso = np.searchsorted(indice.secondi, _secondi(start_date), side='left')
+    alto = max(np.searchsorted(indice.secondi, _secondi(end_date), side='right'), basso)
+    return basso, alto
+
+
+def _cumulata(blocco):
+    """
+    Somme cumulate per colonna, precedute da una riga di zeri.
+    """
+    cumulata = np.zeros((len(blocco) + 1, len(COLONNE_BLOCCO)), dtype='int64')
+    np.cumsum(blocco, axis=0, out=cumulata[1:])
+    return cumulata
+
+
+def _secondi(data):
+    """
+    Data in secondi dal 1970-01-01.
+    """
+    return int(pd.Timestamp(data).to_datetime64().astype('datetime64[s]').astype('int64'))
@@ -0,0 +1,150 @@
+import hashlib
+import io
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from motori_lettura import formato_file
+from workbook_loader import DatiWorkbook, carica_workbook
+
+# Cartella locale della cache e dimensione massima complessiva (modificabili da variabile d'ambiente)
+CACHE_DIR = Path(os.environ.get("PROPERTIZE_CACHE_DIR", ".cache_ingestione"))
+CACHE_MAX_BYTES = int(os.environ.get("PROPERTIZE_CACHE_MAX_MB", "500")) * 1024 * 1024
+
+# DataFrame di DatiWorkbook salvati in Parquet, un file per foglio
+FOGLI = ('prenotazioni', 'disponibilita', 'posizioni', 'spese')
+
+# Versione dell'elaborazione dei fogli salvata in cache: va incrementata a ogni modifica di
+# conversioni, schema o colonne derivate, così le voci scritte prima diventano mancate
+VERSIONE_ELABORAZIONE = 1
+
+
+def hash_workbook(contenuto):
+    """
+    Restituisce lo SHA-256 (esadecimale) dei byte del workbook, usato come chiave della cache.
+    """
+    return hashlib.sha256(contenuto).hexdigest()
+
+
+def chiave_file(uploaded_file):
+    """
+    Restituisce lo SHA-256 del file caricato; per un export CSV copre tutti i file, nell'ordine di caricamento.
+    """
+    if formato_file(uploaded_file) == 'csv':
+        return hash_workbook(b''.join(hash_workbook(_leggi_bytes(f)).encode() for f in uploaded_file))
+    return hash_workbook(_leggi_bytes(uploaded_file))
+
+
+def carica_workbook_con_cache(uploaded_file, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, streaming=False):
+    """
+    Carica il workbook passando dalla cache su disco.
+
+    Se lo stesso file (stesso SHA-256) è già stato elaborato con la stessa VERSIONE_ELABORAZIONE,
+    i DataFrame vengono letti dai file Parquet della cache; altrimenti il workbook viene elaborato
+    con carica_workbook e salvato.
+    La cache sopravvive al riavvio dell'app ed è limitata a max_bytes, eliminando per prime
+    le voci usate meno di recente.
+
+    Parametri:
+        uploaded_file: percorso o file caricato (st.file_uploader), o lista di file CSV (uno per foglio).
+        cache_dir (Path): cartella della cache.
+        max_bytes (int): dimensione massima complessiva della cache.
+        streaming (bool): in caso di elaborazione, legge il Foglio 1 a blocchi (vedi carica_workbook).
+
+    Ritorna:
+        DatiWorkbook con i DataFrame dei quattro fogli; dalla cache il motore riportato è 'cache'.
+    """
+    inizio = time.perf_counter()
+    formato = formato_file(uploaded_file)
+    chiave = chiave_file(uploaded_file)
+    if streaming:
+        # La lettura a blocchi converte le celle senza passare dal testo: voce separata
+        chiave += "-streaming"
+    # Le voci di versioni precedenti non vengono più lette e lasciano la cache per anzianità
+    cartella = Path(cache_dir) / f"v{VERSIONE_ELABORAZIONE}-{chiave}"
+
+    workbook = _leggi_da_cache(cartella)
+    if workbook is not None:
+        # Aggiorna la data di ultimo utilizzo per l'eliminazione LRU
+        os.utime(cartella)
+        workbook.motore = 'cache'
+        workbook.tempo_lettura = time.perf_counter() - inizio
+        return workbook
+
+    # I CSV vengono riletti dai file caricati, che servono per associare i nomi ai fogli
+    sorgente = uploaded_file if formato == 'csv' else io.BytesIO(_leggi_bytes(uploaded_file))
+    workbook = carica_workbook(sorgente, streaming=streaming, formato=formato)
+    if _scrivi_in_cache(cartella, workbook):
+        _elimina_meno_recenti(Path(cache_dir), max_bytes, da_tenere=cartella)
+    return workbook
+
+
+def _leggi_bytes(uploaded_file):
+    """
+    Restituisce il contenuto del file come bytes, sia da percorso che da file caricato.
+    """
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        return Path(uploaded_file).read_bytes()
+    if hasattr(uploaded_file, 'getvalue'):
+        return uploaded_file.getvalue()
+    uploaded_file.seek(0)
+    return uploaded_file.read()
+
+
+def _leggi_da_cache(cartella):
+    """
+    Legge i fogli salvati in Parquet; restituisce None se la voce non esiste o è incompleta.
+    """
+    percorsi = {foglio: cartella / f"{foglio}.parquet" for foglio in FOGLI}
+    if not all(percorso.exists() for percorso in percorsi.values()):
+        return None
+    try:
+        return DatiWorkbook(**{foglio: pd.read_parquet(percorso) for foglio, percorso in percorsi.items()})
+    except (OSError, ValueError):
+        # Voce danneggiata: viene rimossa e il file rielaborato
+        shutil.rmtree(cartella, ignore_errors=True)
+        return None
+
+
+def _scrivi_in_cache(cartella, workbook):
+    """
+    Salva i fogli in Parquet in una cartella temporanea, poi la rinomina nella voce definitiva.
+
+    Ritorna True se la voce è stata scritta. Se un foglio non è convertibile in Parquet
+    (ad esempio colonne con tipi misti) la cache viene saltata senza interrompere il caricamento.
+    """
+    cartella.parent.mkdir(parents=True, exist_ok=True)
+    temporanea = cartella.with_name(f"{cartella.name}.tmp-{os.getpid()}")
+    try:
+        temporanea.mkdir(exist_ok=True)
+        for foglio in FOGLI:
+            getattr(workbook, foglio).to_parquet(temporanea / f"{foglio}.parquet")
+        os.replace(temporanea, cartella)
+    except (OSError, ValueError, TypeError, NotImplementedError, ImportError):
+        shutil.rmtree(temporanea, ignore_errors=True)
+        return False
+    return True
+
+
+def _elimina_meno_recenti(cache_dir, max_bytes, da_tenere=None):
+    """
+    Elimina le voci usate meno di recente finché la cache non rientra in max_bytes.
+    """
+    voci = []
+    for cartella in cache_dir.iterdir():
+        if not cartella.is_dir() or '.tmp-' in cartella.name:
+            continue
+        dimensione = sum(f.stat().st_size for f in cartella.iterdir() if f.is_file())
+        voci.append((cartella.stat().st_mtime, dimensione, cartella))
+
+    totale = sum(dimensione for _, dimensione, _ in voci)
+    for _, dimensione, cartella in sorted(voci, key=lambda voce: voce[0]):
+        if totale <= max_bytes:
+            break
+        if cartella == da_tenere:
+            continue
+        shutil.rmtree(cartella, ignore_errors=True)
+        totale -= dimensione
@@ -0,0 +1,145 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from centesimi import blocco_centesimi, somme_in_euro
+from indice_date import somme_intervallo
+from kpis import COLONNE_BLOCCO, KPI, deriva_kpi
+
+# Dimensioni del cubo: attributi dell'appartamento, OTA e mese del check-in
+DIMENSIONI_CUBO = ['Nome Appartamento', 'zona', 'Nome Proprietario', 'OTA', 'mese']
+
+
+@dataclass(frozen=True)
+class CuboKPI:
+    """
+    Grandezze additive dei KPI pre-aggregate per appartamento, zona, proprietario, OTA e mese.
+    """
+    tabella: pd.DataFrame  # una riga per combinazione presente: DIMENSIONI_CUBO e COLONNE_BLOCCO
+                           # (int64, importi in centesimi)
+    mese: np.ndarray       # mese di ogni riga in mesi dal 1970-01 (int64), per selezionare gli intervalli
+
+
+def costruisci_cubo(prenotazioni):
+    """
+    Costruisce il cubo dei KPI sommando il blocco in centesimi (centesimi.blocco_centesimi)
+    per ogni combinazione di appartamento, zona, proprietario, OTA e mese del check-in.
+
+    Parametri:
+        prenotazioni (DataFrame): prenotazioni elaborate (DatiWorkbook.prenotazioni).
+
+    Ritorna:
+        CuboKPI con la tabella pre-aggregata.
+    """
+    valori = pd.DataFrame(blocco_centesimi(prenotazioni), columns=COLONNE_BLOCCO, index=prenotazioni.index)
+    chiavi = [prenotazioni[col] for col in DIMENSIONI_CUBO[:-1]]
+    chiavi.append(prenotazioni['Data Check-In'].dt.to_period('M').dt.start_time.rename('mese'))
+
+    # Le prenotazioni senza zona (appartamento non presente nel Foglio 3) restano nel cubo
+    tabella = valori.groupby(chiavi, observed=True, dropna=False, sort=True).sum().reset_index()
+    return CuboKPI(
+        tabella=tabella,
+        mese=tabella['mese'].to_numpy(dtype='datetime64[M]').astype('int64'),
+    )
+
+
+def aggiorna_cubo(cubo, tolte, aggiunte):
+    """
+    Aggiorna il cubo dei KPI con le prenotazioni tolte e aggiunte, senza ripartire da tutte.
+
+    Le righe del cubo delle prenotazioni tolte sono sottratte e quelle delle aggiunte sommate
+    con un groupby sulle sole righe del cubo; le combinazioni rimaste senza prenotazioni sono
+    eliminate. Le somme sono intere: il risultato è esattamente quello di costruisci_cubo
+    sulle prenotazioni aggiornate.
+
+    Parametri:
+        cubo (CuboKPI): cubo delle prenotazioni precedenti.
+        tolte (DataFrame): prenotazioni rimosse o nella versione precedente alla modifica.
+        aggiunte (DataFrame): prenotazioni inserite o nella versione modificata.
+
+    Ritorna:
+        CuboKPI aggiornato.
+    """
+    sottratte = costruisci_cubo(tolte).tabella
+    sottratte[COLONNE_BLOCCO] = -sottratte[COLONNE_BLOCCO]
+    unite = pd.concat([cubo.tabella, sottratte, costruisci_cubo(aggiunte).tabella], ignore_index=True)
+
+    tabella = unite.groupby(DIMENSIONI_CUBO, observed=True, dropna=False, sort=True)[COLONNE_BLOCCO].sum()
+    tabella = tabella[tabella['numero_prenotazioni'] > 0].reset_index()
+    return CuboKPI(
+        tabella=tabella,
+        mese=tabella['mese'].to_numpy(dtype='datetime64[M]').astype('int64'),
+    )
+
+
+def kpi_da_cubo(cubo, indice, notti_disponibili_filtrate, start_date, end_date, immobili=None, zone=None):
+    """
+    Calcola i KPI di calculate_kpis per un intervallo di check-in e una selezione di
+    appartamenti e zone, sommando le righe del cubo.
+
+    I mesi interamente compresi nell'intervallo sono letti dal cubo; le prenotazioni dei
+    mesi iniziale e finale parziali sono sommate con l'indice per data (indice_date),
+    con due ricerche binarie per appartamento selezionato. Le prenotazioni non vengono
+    scorse: il costo dipende dalle righe del cubo e dai segmenti selezionati.
+
+    Cubo e indice sommano gli importi in centesimi interi, convertiti in euro solo per
+    deriva_kpi: i totali sono quelli degli importi dell'export, senza gli errori di
+    arrotondamento delle somme in float (calculate_kpis può differire di frazioni di centesimo).
+
+    Parametri:
+        cubo (CuboKPI): cubo del workbook (DatiWorkbook.cubo).
+        indice (IndiceDate): indice per data delle stesse prenotazioni (DatiWorkbook.indice_date).
+        notti_disponibili_filtrate (DataFrame): notti disponibili degli appartamenti selezionati.
+        start_date, end_date: intervallo sulla data di check-in (estremi inclusi).
+        immobili, zone (list): appartamenti e zone da includere (None = tutti).
+
+    Ritorna:
+        KPI con gli stessi valori di calculate_kpis sulle prenotazioni filtrate.
+    """
+    inizio, fine = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    # Mesi interi dell'intervallo: dal primo mese che inizia dopo `inizio` all'ultimo che finisce prima di `fine`
+    primo_mese = _mese(inizio) + (inizio != inizio.to_period('M').start_time)
+    ultimo_mese = _mese(fine) - (fine.normalize() != fine.to_period('M').end_time.normalize())
+
+    if primo_mese > ultimo_mese:
+        # Intervallo senza mesi interi: solo l'indice per data
+        somme = somme_intervallo(indice, inizio, fine, immobili, zone)
+    else:
+        righe = (cubo.mese >= primo_mese) & (cubo.mese <= ultimo_mese)
+        righe &= _selezione(cubo.tabella, immobili, zone)
+        somme = cubo.tabella.loc[righe, COLONNE_BLOCCO].to_numpy().sum(axis=0)
+
+        # Mesi parziali: dall'inizio al primo mese intero e dopo l'ultimo mese intero fino alla fine
+        un_secondo = pd.Timedelta(seconds=1)
+        somme = somme + somme_intervallo(indice, inizio, _inizio_mese(primo_mese) - un_secondo, immobili, zone)
+        somme = somme + somme_intervallo(indice, _inizio_mese(ultimo_mese + 1), fine, immobili, zone)
+
+    return KPI(**deriva_kpi(somme_in_euro(somme), notti_disponibili_filtrate['Notti Disponibili'].sum()))
+
+
+def _selezione(frame, immobili, zone):
+    """
+    Maschera delle righe degli appartamenti e delle zone selezionati (None = nessun filtro).
+    """
+    maschera = np.ones(len(frame), dtype=bool)
+    if immobili:
+        maschera &= frame['Nome Appartamento'].isin(immobili).to_numpy()
+    if zone:
+        maschera &= frame['zona'].isin(zone).to_numpy()
+    return maschera
+
+
+def _inizio_mese(mese):
+    """
+    Primo giorno di un mese espresso in mesi dal 1970-01.
+    """
+    return pd.Timestamp(np.datetime64(int(mese), 'M'))
+
+
+def _mese(data):
+    """
+    Mese di una data in mesi dal 1970-01.
+    """
+    return data.to_datetime64().astype('datetime64[M]').astype('int64')
@@ -1,13 +1,18 @@
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 
+from spese_nette import totali_per_settore
+
 
 def somme_IVA(df, kpsi):
     import pandas as pd
     # df è il DataFrame con i totali (che contiene la colonna 'Totale_IVA')
-    # kpsi è un dizionario (non un DataFrame) che contiene i valori di IVA_Totale_credito e IVA_Totale_debito
+    # kpsi è il KPI di calculate_kpis, con i valori di IVA_Totale_credito e IVA_Totale_Debito
     totale_IVA_value = pd.to_numeric(df['Totale_IVA'].iloc[0], errors='coerce')
-    IVA_Totale_credito = float(kpsi.get('IVA_Totale_credito', 0))
-    IVA_Totale_debito = float(kpsi.get('IVA_Totale_Debito', 0))
+    IVA_Totale_credito = float(kpsi.IVA_Totale_credito)
+    IVA_Totale_debito = float(kpsi.IVA_Totale_Debito)
 
     IVA_a_credito = totale_IVA_value + IVA_Totale_credito
     IVA_a_debito = IVA_Totale_debito
@@ -20,197 +25,249 @@ def somme_IVA(df, kpsi):
     }
 
 
-def calculate_kpis(data, notti_disponibili_filtrate):
-
-
-    #   RICAVI   SENZA IVA   #
-
-
-
-    totale_ricavi_locazione = data['Ricavi Locazione'].sum() - data['IVA Provvigioni PM'].sum()
-    totale_ricavi_pulizie = data['Ricavi Pulizie'].sum() / 1.22
-    ricavi_totali = totale_ricavi_locazione + totale_ricavi_pulizie
-
-
-    #   COMMISSIONI SENZA IVA   #
-
-    commissioni_ota = data['Commissioni OTA'].sum() / 1.22
-    commissioni_proprietari = data['Commissioni Proprietari Lorde'].sum()
-    commissioni_ota_locazioni = data['Commissioni OTA'].sum() / 1.22 * (data['Ricavi Locazione'].sum() / (data['Ricavi Locazione'].sum() + data['Ricavi Pulizie'].sum()))
-    commissioni_itw = data['Commissioni ITW Nette'].sum()
-    totale_commissioni = data['Commissioni OTA'].sum() / 1.22 + data['Commissioni ITW Nette'].sum() + commissioni_proprietari
-
-    #   MARGINALITà SENZA IVA   #
+# Colonne sommate da calculate_kpis, nell'ordine delle colonne del blocco NumPy
+COLONNE_KPI = [
+    'Ricavi Locazione', 'Ricavi Pulizie', 'IVA Provvigioni PM', 'Commissioni OTA',
+    'Commissioni ITW Nette', 'IVA Commissioni ITW', 'Commissioni Proprietari Lorde',
+    'costo_pulizie_ps', 'costo_scorte_ps', 'costo_manutenzioni_ps',
+]
 
-    marginalità_locazioni = totale_ricavi_locazione - commissioni_ota_locazioni - data['Commissioni Proprietari Lorde'].sum()
-    marginalità_pulizie = totale_ricavi_pulizie - (data['Commissioni OTA'].sum() / 1.22 - commissioni_ota_locazioni)
-    marginalità_totale = marginalità_locazioni + marginalità_pulizie
+# Colonne del blocco di blocco_kpi: importi e notti, valori presenti per colonna, numero di prenotazioni
+COLONNE_BLOCCO = (
+    COLONNE_KPI + ['Notti Occupate'] + [f'{col} (presenti)' for col in COLONNE_KPI] + ['numero_prenotazioni']
+)
 
+# Chiavi che dipendono solo dall'appartamento: calculate_kpis_grouped ne calcola le notti disponibili
+CHIAVI_APPARTAMENTO = ['Nome Appartamento', 'ID Appartamento', 'Nome Proprietario', 'zona']
 
-    #  SALDO IVA   #
 
-    IVA_OTA = data['Commissioni OTA'].sum() * 0.22
-    IVA_Totale_credito = data['IVA Commissioni ITW'].sum() + IVA_OTA
-    IVA_Totale_Debito = data['IVA Provvigioni PM'].sum()
-    Saldo_IVA = IVA_Totale_Debito - IVA_Totale_credito
-
-    #CALCOLO COSTI DI PULIZIE SCORTE E MANUTENZIONE PER SOGGIORNO E TOTALI
+@dataclass(slots=True)
+class KPI:
+    """
+    KPI delle prenotazioni filtrate, calcolati da calculate_kpis (o calculate_kpis_sql).
+    Importi senza IVA; le medie sono NaN (o inf) se mancano prenotazioni o notti.
+    """
+    totale_ricavi_locazione: float
+    totale_ricavi_pulizie: float
+    ricavi_totali: float
+    commissioni_ota: float
+    commissioni_itw: float
+    commissioni_proprietari: float
+    totale_commissioni: float
+    marginalità_locazioni: float
+    marginalità_pulizie: float
+    marginalità_totale: float
+    IVA_Totale_credito: float
+    IVA_Totale_Debito: float
+    Saldo_IVA: float
+    valore_medio_prenotazione: float
+    prezzo_medio_notte: float
+    soggiorno_medio: float
+    margine_medio_prenotazione: float
+    margine_medio_notte: float
+    margine_medio_pulizie: float
+    prezzo_pulizie: float
+    notti_occupate: float
+    tasso_di_occupazione: float
+    notti_disponibili: float
+    notti_libere: float
+    numero_prenotazioni: int
+    costo_pulizie_ps: float
+    costo_scorte_ps: float
+    costo_manutenzioni_ps: float
+    costo_pulizie_ps_totali: float
+    costo_scorte_ps_totali: float
+    costo_manutenzioni_ps_totali: float
+    altri_costi: float
+    marginalità_immobile: float
 
-    costo_pulizie_ps = data['costo_pulizie_ps'].mean()
-    costo_scorte_ps = data['costo_scorte_ps'].mean()
-    costo_manutenzioni_ps = data['costo_manutenzioni_ps'].mean()
 
-    costo_pulizie_ps_totali = data['costo_pulizie_ps'].sum()
-    costo_scorte_ps_totali = data['costo_scorte_ps'].sum()
-    costo_manutenzioni_ps_totali = data['costo_manutenzioni_ps'].sum()
-    altri_costi = costo_scorte_ps_totali + costo_manutenzioni_ps_totali
+def calculate_kpis(data, notti_disponibili_filtrate):
+    """
+    Calcola i KPI delle prenotazioni filtrate con un'unica riduzione su un blocco NumPy.
 
+    Somme e conteggi di tutte le colonne usate (COLONNE_KPI e notti occupate) vengono
+    calcolati in una sola passata in float64 (vedi blocco_kpi); i KPI sono poi derivati
+    da questi scalari (vedi deriva_kpi). Il DataFrame in ingresso non viene modificato.
 
+    Parametri:
+        data (DataFrame): prenotazioni filtrate.
+        notti_disponibili_filtrate (DataFrame): notti disponibili per appartamento ('Notti Disponibili').
 
+    Ritorna:
+        KPI con i valori calcolati.
+    """
+    somme = dict(zip(COLONNE_BLOCCO, blocco_kpi(data).sum(axis=0)))
+    return KPI(**deriva_kpi(somme, notti_disponibili_filtrate['Notti Disponibili'].sum()))
 
 
+def calculate_kpis_grouped(data, notti_disponibili_filtrate, by):
+    """
+    Calcola tutti i KPI di calculate_kpis per ogni gruppo di prenotazioni, in un solo groupby.
 
-    #  CALCOLO NOTTI, PRENOTAZIONI ECC...   #
+    Somme, conteggi dei valori presenti e numero di prenotazioni di tutti i gruppi vengono
+    calcolati con un'unica somma raggruppata del blocco di blocco_kpi; i KPI sono poi derivati
+    colonna per colonna con le stesse formule di calculate_kpis (vedi deriva_kpi).
 
-    # Calcolo delle notti occupate (Durata soggiorno) per ogni riga
-    data['Notti Occupate'] = (data['Data Check-Out'] - data['Data Check-In']).dt.days
+    Le notti disponibili (e quindi notti libere e tasso di occupazione) sono calcolate solo
+    se tutte le chiavi dipendono dall'appartamento (CHIAVI_APPARTAMENTO): ogni gruppo riceve
+    le notti degli appartamenti delle sue prenotazioni. Per chiavi come OTA o mese sono NaN.
 
-    # Controlla se ci sono valori negativi (check-out prima del check-in) e li gestisce
-    data['Notti Occupate'] = data['Notti Occupate'].apply(lambda x: max(x, 0))  # Imposta a 0 eventuali valori negativi
+    Parametri:
+        data (DataFrame): prenotazioni filtrate.
+        notti_disponibili_filtrate (DataFrame): notti disponibili per appartamento
+                                                ('Appartamento', 'Notti Disponibili').
+        by (str o list): colonne di raggruppamento (es. 'Nome Appartamento', ['zona', 'OTA'], 'Mese').
 
-    #Calcola il numero totale di prenotazioni basandosi sul numero di righe del DataFrame.
-    numero_prenotazioni = len(data)
+    Ritorna:
+        DataFrame con una riga per gruppo: le colonne di `by` seguite da una colonna per ogni KPI.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+
+    valori = pd.DataFrame(blocco_kpi(data), columns=COLONNE_BLOCCO, index=data.index)
+    somme = valori.groupby([data[col] for col in by], observed=True, sort=True).sum()
+
+    if set(by) <= set(CHIAVI_APPARTAMENTO):
+        # Notti disponibili degli appartamenti di ogni gruppo
+        appartamenti = data[list(dict.fromkeys(by + ['Nome Appartamento']))].drop_duplicates()
+        disponibili = appartamenti.merge(
+            notti_disponibili_filtrate, left_on='Nome Appartamento', right_on='Appartamento', how='left'
+        ).groupby(by, observed=True)['Notti Disponibili'].sum()
+        notti_disponibili = disponibili.reindex(somme.index).to_numpy(dtype='float64')
+    else:
+        notti_disponibili = np.full(len(somme), np.nan)
 
-    #Calcolo notti occupate, libere e tasso di occupazione
-    valore_medio_prenotazione = totale_ricavi_locazione/numero_prenotazioni
-    prezzo_medio_notte = totale_ricavi_locazione/data['Notti Occupate'].sum()
-    soggiorno_medio = data['Notti Occupate'].sum()/numero_prenotazioni
-    notti_occupate = data['Notti Occupate'].sum()
-    notti_disponibili = notti_disponibili_filtrate['Notti Disponibili'].sum()
-    notti_libere = notti_disponibili - notti_occupate
-    tasso_di_occupazione = notti_occupate/notti_disponibili*100
+    kpi = deriva_kpi({col: somme[col].to_numpy() for col in COLONNE_BLOCCO}, notti_disponibili)
+    return pd.DataFrame(kpi, index=somme.index).reset_index()
 
 
-    #   MARGINALITà MEDIA SENZA IVA   #
+def blocco_kpi(data):
+    """
+    Blocco NumPy float64 con le colonne COLONNE_BLOCCO per ogni prenotazione: importi di
+    COLONNE_KPI e notti occupate (0 se vuoti), indicatori dei valori presenti e una colonna di uno.
 
+    Sommando il blocco (per intero, per gruppo o per intervallo) si ottengono tutte le
+    grandezze additive da cui deriva_kpi calcola i KPI.
+    """
+    # Notti occupate per prenotazione: check-out prima del check-in = 0, date mancanti = NaN
+    notti = (data['Data Check-Out'] - data['Data Check-In']).dt.days.to_numpy(dtype='float64')
+    blocco = np.column_stack([data[COLONNE_KPI].to_numpy(dtype='float64'), np.maximum(notti, 0)])
 
-    margine_medio_prenotazione = marginalità_totale/numero_prenotazioni
-    margine_medio_notte = marginalità_locazioni/data['Notti Occupate'].sum()
-    prezzo_pulizie = totale_ricavi_pulizie/numero_prenotazioni
-    margine_medio_pulizie = marginalità_pulizie/numero_prenotazioni
+    # Le celle vuote (es. costi di appartamenti senza posizione) sono escluse come in pandas
+    validi = ~np.isnan(blocco)
+    return np.column_stack([np.where(validi, blocco, 0), validi[:, :len(COLONNE_KPI)], np.ones(len(data))])
 
-    #    Utile   #
 
-    marginalità_immobile = marginalità_totale - costo_pulizie_ps_totali - altri_costi
+def deriva_kpi(somme, notti_disponibili):
+    """
+    Deriva i KPI dalle somme delle colonne COLONNE_BLOCCO e dalle notti disponibili.
 
-    return {
-        "totale_ricavi_locazione": totale_ricavi_locazione,
-        "totale_ricavi_pulizie": totale_ricavi_pulizie,
-        "ricavi_totali": ricavi_totali,
-        "commissioni_ota": commissioni_ota,
-        "commissioni_itw": commissioni_itw,
-        "commissioni_proprietari": commissioni_proprietari,
-        "totale_commissioni": totale_commissioni,
-        "marginalità_locazioni": marginalità_locazioni,
-        "marginalità_pulizie": marginalità_pulizie,
-        "marginalità_totale": marginalità_totale,
-        "IVA_Totale_credito": IVA_Totale_credito,
-        "IVA_Totale_Debito": IVA_Totale_Debito,
-        "Saldo_IVA": Saldo_IVA,
-        "valore_medio_prenotazione": valore_medio_prenotazione,
-        'prezzo_medio_notte':prezzo_medio_notte,
-        'soggiorno_medio':soggiorno_medio,
-        'margine_medio_prenotazione':margine_medio_prenotazione,
-        'margine_medio_notte': margine_medio_notte,
-        'margine_medio_pulizie': margine_medio_pulizie,
-        'prezzo_pulizie':prezzo_pulizie,
-        'notti_occupate':notti_occupate,
-        'tasso_di_occupazione':tasso_di_occupazione,
-        'notti_disponibili': notti_disponibili,
-        'notti_libere': notti_libere,
-        'numero_prenotazioni': numero_prenotazioni,
-        'costo_pulizie_ps':  costo_pulizie_ps,
-        'costo_scorte_ps':costo_scorte_ps,
-        'costo_manutenzioni_ps':costo_manutenzioni_ps,
-        'costo_pulizie_ps_totali':costo_pulizie_ps_totali,
-        'costo_scorte_ps_totali':costo_scorte_ps_totali,
-        'costo_manutenzioni_ps_totali':costo_manutenzioni_ps_totali,
-        'altri_costi':altri_costi,
-        'marginalità_immobile':marginalità_immobile
-    }
+    Funziona sia con scalari (calculate_kpis) sia con array di un valore per gruppo
+    (calculate_kpis_grouped). Ritorna un dict con i campi di KPI.
+    """
+    # Le divisioni per zero danno NaN o inf, come le somme pandas di un DataFrame vuoto
+    with np.errstate(divide='ignore', invalid='ignore'):
+        numero_prenotazioni = np.asarray(somme['numero_prenotazioni']).astype('int64')[()]
+        notti_occupate = somme['Notti Occupate']
+
+        #   RICAVI   SENZA IVA   #
+        totale_ricavi_locazione = somme['Ricavi Locazione'] - somme['IVA Provvigioni PM']
+        totale_ricavi_pulizie = somme['Ricavi Pulizie'] / 1.22
+        ricavi_totali = totale_ricavi_locazione + totale_ricavi_pulizie
+
+        #   COMMISSIONI SENZA IVA   #
+        commissioni_ota = somme['Commissioni OTA'] / 1.22
+        commissioni_proprietari = somme['Commissioni Proprietari Lorde']
+        commissioni_ota_locazioni = commissioni_ota * (
+            somme['Ricavi Locazione'] / (somme['Ricavi Locazione'] + somme['Ricavi Pulizie'])
+        )
+        commissioni_itw = somme['Commissioni ITW Nette']
+        totale_commissioni = commissioni_ota + commissioni_itw + commissioni_proprietari
+
+        #   MARGINALITà SENZA IVA   #
+        marginalità_locazioni = totale_ricavi_locazione - commissioni_ota_locazioni - commissioni_proprietari
+        marginalità_pulizie = totale_ricavi_pulizie - (commissioni_ota - commissioni_ota_locazioni)
+        marginalità_totale = marginalità_locazioni + marginalità_pulizie
+
+        #  SALDO IVA   #
+        IVA_Totale_credito = somme['IVA Commissioni ITW'] + somme['Commissioni OTA'] * 0.22
+        IVA_Totale_Debito = somme['IVA Provvigioni PM']
+
+        #  COSTI DI PULIZIE SCORTE E MANUTENZIONE PER SOGGIORNO E TOTALI  #
+        costo_pulizie_ps_totali = somme['costo_pulizie_ps']
+        costo_scorte_ps_totali = somme['costo_scorte_ps']
+        costo_manutenzioni_ps_totali = somme['costo_manutenzioni_ps']
+        altri_costi = costo_scorte_ps_totali + costo_manutenzioni_ps_totali
+
+        return dict(
+            totale_ricavi_locazione=totale_ricavi_locazione,
+            totale_ricavi_pulizie=totale_ricavi_pulizie,
+            ricavi_totali=ricavi_totali,
+            commissioni_ota=commissioni_ota,
+            commissioni_itw=commissioni_itw,
+            commissioni_proprietari=commissioni_proprietari,
+            totale_commissioni=totale_commissioni,
+            marginalità_locazioni=marginalità_locazioni,
+            marginalità_pulizie=marginalità_pulizie,
+            marginalità_totale=marginalità_totale,
+            IVA_Totale_credito=IVA_Totale_credito,
+            IVA_Totale_Debito=IVA_Totale_Debito,
+            Saldo_IVA=IVA_Totale_Debito - IVA_Totale_credito,
+            valore_medio_prenotazione=totale_ricavi_locazione / numero_prenotazioni,
+            prezzo_medio_notte=totale_ricavi_locazione / notti_occupate,
+            soggiorno_medio=notti_occupate / numero_prenotazioni,
+            margine_medio_prenotazione=marginalità_totale / numero_prenotazioni,
+            margine_medio_notte=marginalità_locazioni / notti_occupate,
+            margine_medio_pulizie=marginalità_pulizie / numero_prenotazioni,
+            prezzo_pulizie=totale_ricavi_pulizie / numero_prenotazioni,
+            notti_occupate=notti_occupate,
+            tasso_di_occupazione=notti_occupate / notti_disponibili * 100,
+            notti_disponibili=notti_disponibili,
+            notti_libere=notti_disponibili - notti_occupate,
+            numero_prenotazioni=numero_prenotazioni,
+            costo_pulizie_ps=costo_pulizie_ps_totali / somme['costo_pulizie_ps (presenti)'],
+            costo_scorte_ps=costo_scorte_ps_totali / somme['costo_scorte_ps (presenti)'],
+            costo_manutenzioni_ps=costo_manutenzioni_ps_totali / somme['costo_manutenzioni_ps (presenti)'],
+            costo_pulizie_ps_totali=costo_pulizie_ps_totali,
+            costo_scorte_ps_totali=costo_scorte_ps_totali,
+            costo_manutenzioni_ps_totali=costo_manutenzioni_ps_totali,
+            altri_costi=altri_costi,
+            marginalità_immobile=marginalità_totale - costo_pulizie_ps_totali - altri_costi,
+        )
 
 
 def eleboratore_spese(df):
     """
-    Per ogni spesa (riga in cui il codice non è "59.01.01"), calcola l'importo netto
-    sottraendo l'importo IVA (presumibilmente nella riga immediatamente successiva,
-    colonna 'y') dall'importo (colonna 'x'). Inoltre, per ogni riga IVA (codice "59.01.01"),
-    assegna il settore di spesa della riga precedente nella nuova colonna 'settore_spesa'.
+    Calcola i totali delle spese per settore e complessivi dalla tabella netta delle spese
+    (una riga per spesa con lordo, IVA e netto, vedi spese_nette.normalizza_spese).
 
     Parametri:
-      - df: DataFrame contenente le colonne 'x', 'y', 'settore' e 'codice'.
+      - df: tabella netta delle spese (DatiWorkbook.spese_nette), eventualmente filtrata per data.
 
     Ritorna:
-      - df: DataFrame aggiornato con la colonna 'importo_netto' per le spese e la colonna
-            'settore_spesa' assegnata per le righe IVA.
+      - df: la tabella ricevuta, non modificata
+      - totali: DataFrame per settore con 'Totale Spese', 'Totale IVA' e 'totale_netto'
+      - totali_df: DataFrame con 'Totale_Spese_netto', 'Totale_Spese_lordo' e 'Totale_IVA'
     """
-
-
-    # Maschera per identificare le righe delle spese (non IVA)
-    expense_mask = df['Codice'] != "59.01.01"
-
-    # Assicurati che le colonne siano di tipo numerico
-    df['Importo Totale'] = pd.to_numeric(df['Importo Totale'], errors='coerce')
-    df['Importo'] = pd.to_numeric(df['Importo'], errors='coerce')
-
-    # Calcola l'importo netto per le spese (sottraendo l'importo IVA dalla spesa)
-    # Si assume che la riga successiva contenga l'importo dell'IVA (colonna y)
-    df.loc[expense_mask, 'importo_netto'] = df.loc[expense_mask, 'Importo Totale'].astype(float) - df['Importo'].shift(-1).astype(float)
-
-    # Maschera per le righe IVA (codice "59.01.01")
-    vat_mask = df['Codice'] == "59.01.01"
-
-    # Assegna alla riga IVA il settore della spesa dalla riga precedente
-    df.loc[vat_mask, 'Settore di spesa'] = df['Settore di spesa'].shift(1)
-
-    # Converti in numerico le colonne, in caso contengano stringhe o formati non numerici
-    df['Importo Totale'] = pd.to_numeric(df['Importo Totale'], errors='coerce')
-    df['Importo'] = pd.to_numeric(df['Importo'], errors='coerce')
-
-    # Filtra le righe spesa (non IVA)
-    df_spesa = df[df['Codice'] != "59.01.01"]
-    totali_spesa = df_spesa.groupby("Settore di spesa")['Importo Totale'].sum().reset_index()
-    totali_spesa.rename(columns={'Importo Totale': 'Totale Spese'}, inplace=True)
-
-    # Filtra le righe IVA
-    df_iva = df[df['Codice'] == "59.01.01"]
-    totali_iva = df_iva.groupby("Settore di spesa")['Importo'].sum().reset_index()
-    totali_iva.rename(columns={'Importo': 'Totale IVA'}, inplace=True)
-
-    # Unisci i risultati per settore
-    totali = pd.merge(totali_spesa, totali_iva, on="Settore di spesa", how="outer").fillna(0)
-
-    totali['totale_netto'] = totali['Totale Spese'] - totali['Totale IVA']
-
-    # Calcola il totale IVA complessivo
-    totale_iva_complessivo = totali_iva['Totale IVA'].sum()
-
-    totale_spese_netto = totali['totale_netto'].sum()
-    totale_spese_lordo = totali['Totale Spese'].sum()
+    totali = totali_per_settore(df)
 
     # Crea un nuovo DataFrame con i totali ottenuti
     totali_df = pd.DataFrame({
-        'Totale_Spese_netto': [totale_spese_netto],
-        'Totale_Spese_lordo': [totale_spese_lordo],
-        'Totale_IVA': [totale_iva_complessivo]
+        'Totale_Spese_netto': [totali['totale_netto'].sum()],
+        'Totale_Spese_lordo': [totali['Totale Spese'].sum()],
+        'Totale_IVA': [totali['Totale IVA'].sum()]
     })
 
     return df, totali, totali_df
 
 
-def elabora_spese_ricavi(spese, spese_totali, spese_totali_settore, ricavi):
-    costi_totali = float(spese_totali["Totale_Spese_netto"].iloc[0]) + float(ricavi["totale_commissioni"])
-    costi_variabili = float(ricavi["totale_commissioni"])
+# Ammortamenti annui predefiniti del portafoglio
+AMMORTAMENTI = 15000
+
+
+def elabora_spese_ricavi(spese, spese_totali, spese_totali_settore, ricavi, ammortamenti=AMMORTAMENTI):
+    costi_totali = float(spese_totali["Totale_Spese_netto"].iloc[0]) + float(ricavi.totale_commissioni)
+    costi_variabili = float(ricavi.totale_commissioni)
     costi_fissi = float(spese_totali["Totale_Spese_netto"].iloc[0])
     if "PULIZIE" in spese_totali_settore["Settore di spesa"].unique():
         df_pulizie = spese_totali_settore[spese_totali_settore["Settore di spesa"] == "PULIZIE"]
@@ -219,8 +276,7 @@ def elabora_spese_ricavi(spese, spese_totali, spese_totali_settore, ricavi):
     else:
         costi_pulizie = 0.0
     costi_gestione = costi_fissi - costi_pulizie
-    ricavi_totali = float(ricavi["ricavi_totali"])
-    ammortamenti = 15000
+    ricavi_totali = float(ricavi.ricavi_totali)
     EBITDA = ricavi_totali - costi_totali
     MOL = EBITDA - ammortamenti
 
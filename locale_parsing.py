@@ -0,0 +1,176 @@
+import pandas as pd
+
+# Formati data provati sui primi valori testuali di ogni colonna (giorno/mese/anno per primo)
+FORMATI_DATA = [
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%y',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+]
+
+# Numero di valori usati per riconoscere il formato data di una colonna
+CAMPIONE_FORMATO = 50
+
+# Caratteri ignorati negli importi: spazi e simbolo dell'euro
+TABELLA_PULIZIA = str.maketrans({' ': None, '\xa0': None, '€': None})
+
+
+def parse_numeri(valori):
+    """
+    Converte una colonna di importi in float64 con un'unica conversione vettoriale.
+
+    Accetta celle numeriche e testo in formato italiano ("1.234,56", "1234,56", "€ 12,50")
+    o con punto decimale ("1234.56"). Nel testo con la virgola i punti sono separatori delle
+    migliaia; senza virgola, più punti ("1.234.567") indicano le migliaia e un solo punto il decimale.
+    Il formato prevalente della colonna è convertito in blocco, le eccezioni con una seconda passata.
+
+    Parametri:
+        valori (Series): colonna letta dal foglio (numeri, testo o valori mancanti).
+
+    Ritorna:
+        - Series float64 con gli importi (NaN se mancanti o non convertibili)
+        - Index delle righe con un valore presente ma non convertibile
+    """
+    valori = pd.Series(valori, copy=False)
+    testo_mask = _maschera_testo(valori)
+    if testo_mask is None:
+        numeri = pd.to_numeric(valori, errors='coerce').astype('float64')
+        return numeri, _righe_non_valide(valori, numeri)
+
+    testo = valori if testo_mask.all() else valori[testo_mask]
+    numeri_testo = _testo_in_numeri(testo)
+
+    if testo_mask.all():
+        numeri = numeri_testo
+    else:
+        numeri = pd.to_numeric(valori.where(~testo_mask), errors='coerce').astype('float64')
+        numeri[testo_mask] = numeri_testo
+
+    return numeri, _righe_non_valide(valori, numeri)
+
+
+def _testo_in_numeri(testo):
+    """
+    Converte celle di testo in float64: prima come testo con punto decimale, poi con la virgola
+    decimale; solo le celle ancora non convertite passano per la pulizia completa.
+    """
+    try:
+        # Caso più frequente (celle numeriche lette come testo): conversione diretta
+        return pd.Series(testo.to_numpy().astype('float64'), index=testo.index)
+    except ValueError:
+        pass
+
+    con_punto = testo.str.replace(',', '.', regex=False)
+    try:
+        return pd.Series(con_punto.to_numpy().astype('float64'), index=testo.index)
+    except ValueError:
+        pass
+
+    # Virgola decimale con punti delle migliaia ("1.234,56"): i punti vanno tolti prima
+    con_virgola = (con_punto.to_numpy() != testo.to_numpy())
+    italiano = testo[con_virgola].str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    convertibili = con_punto.where(~con_virgola, italiano)
+    try:
+        return pd.Series(convertibili.to_numpy().astype('float64'), index=testo.index)
+    except ValueError:
+        numeri = pd.to_numeric(convertibili, errors='coerce').astype('float64')
+
+    # Eccezioni rimaste (spazi, simbolo dell'euro, "1.234.567"), di solito poche celle
+    rimaste = numeri.isna() & testo.notna()
+    if rimaste.any():
+        numeri[rimaste] = testo[rimaste].map(_numero_da_testo)
+    return numeri
+
+
+def _numero_da_testo(valore):
+    """
+    Converte un singolo testo con spazi, simbolo dell'euro o separatori delle migliaia.
+    """
+    valore = valore.translate(TABELLA_PULIZIA)
+    if ',' in valore:
+        valore = valore.replace('.', '').replace(',', '.')
+    elif valore.count('.') > 1:
+        valore = valore.replace('.', '')
+    try:
+        return float(valore)
+    except ValueError:
+        return float('nan')
+
+
+def parse_date(valori, formato=None):
+    """
+    Converte una colonna di date con un formato esplicito, riconosciuto una sola volta per colonna.
+
+    Le celle già in formato data vengono mantenute; il testo viene convertito con il formato
+    di FORMATI_DATA che converte più valori del campione iniziale della colonna.
+
+    Parametri:
+        valori (Series): colonna letta dal foglio.
+        formato (str): formato strftime da usare; se None viene riconosciuto automaticamente.
+
+    Ritorna:
+        - Series datetime64 (NaT se mancanti o non convertibili)
+        - Index delle righe con un valore presente ma non convertibile
+    """
+    valori = pd.Series(valori, copy=False)
+    testo_mask = _maschera_testo(valori)
+    if testo_mask is None:
+        date = pd.to_datetime(valori, errors='coerce')
+        return date, _righe_non_valide(valori, date)
+
+    testo = valori if testo_mask.all() else valori[testo_mask]
+    if formato is None:
+        formato = rileva_formato_data(testo)
+    if formato is None:
+        convertite = pd.Series(pd.NaT, index=testo.index, dtype='datetime64[ns]')
+    else:
+        convertite = pd.to_datetime(testo, format=formato, errors='coerce')
+
+    if testo_mask.all():
+        date = convertite
+    else:
+        date = pd.to_datetime(valori.where(~testo_mask), errors='coerce')
+        date[testo_mask] = convertite
+
+    return date, _righe_non_valide(valori, date)
+
+
+def rileva_formato_data(testo):
+    """
+    Restituisce il formato di FORMATI_DATA che converte più valori del campione, o None se nessuno.
+    """
+    campione = testo.head(CAMPIONE_FORMATO).str.strip()
+    campione = campione[campione != '']
+    migliore, convertiti_migliore = None, 0
+    for formato in FORMATI_DATA:
+        convertiti = pd.to_datetime(campione, format=formato, errors='coerce').notna().sum()
+        if convertiti > convertiti_migliore:
+            migliore, convertiti_migliore = formato, convertiti
+        if convertiti == len(campione):
+            break
+    return migliore
+
+
+def _maschera_testo(valori):
+    """
+    Restituisce la maschera delle celle di testo, o None se la colonna non contiene testo.
+    """
+    tipo = pd.api.types.infer_dtype(valori, skipna=True)
+    if tipo == 'string':
+        return valori.notna()
+    if tipo in ('floating', 'integer', 'mixed-integer-float', 'decimal', 'datetime', 'datetime64', 'date', 'empty'):
+        return None
+    return valori.map(type).eq(str)
+
+
+def _righe_non_valide(valori, convertiti):
+    """
+    Restituisce le righe con un valore presente (testo non vuoto) che la conversione ha reso mancante.
+    """
+    candidati = valori[convertiti.isna() & valori.notna()]
+    vuoti = candidati.map(lambda v: isinstance(v, str) and v.strip() == '')
+    return candidati.index[~vuoti.to_numpy(dtype=bool)]
@@ -0,0 +1,233 @@
+import csv
+import io
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string
+
+# Motori opzionali: calamine (Rust, il più veloce per xlsx/xlsb) e pyxlsb (solo xlsb)
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    from pyxlsb import convert_date, open_workbook as open_xlsb
+except ImportError:
+    open_xlsb = None
+
+# Formati accettati dal caricamento del file
+FORMATI = ('xlsx', 'xlsm', 'xlsb', 'csv')
+
+# Parole chiave nel nome dei file CSV per riconoscere il foglio, nell'ordine dei fogli del workbook
+FOGLI_CSV = ('prenotazioni', 'disponibilita', 'posizioni', 'spese')
+
+# pyxlsb restituisce le date come numeri seriali Excel: colonne data di ogni foglio
+# (None = tutte le colonne dopo la prima, come i periodi del Foglio 2)
+COLONNE_DATA_XLSB = {0: "G,H", 1: None, 3: "I"}
+
+
+def formato_file(sorgente):
+    """
+    Restituisce il formato ('xlsx', 'xlsm', 'xlsb', 'csv') dall'estensione del file caricato.
+
+    Una lista di file è sempre un export CSV (un file per foglio); senza nome si assume xlsx.
+    """
+    if isinstance(sorgente, (list, tuple)):
+        return 'csv'
+    nome = sorgente if isinstance(sorgente, (str, os.PathLike)) else getattr(sorgente, 'name', '')
+    estensione = Path(str(nome)).suffix.lower().lstrip('.')
+    return estensione if estensione in FORMATI else 'xlsx'
+
+
+def sorgente_caricata(file_caricati):
+    """
+    Controlla i file scelti nel caricamento e restituisce la sorgente da leggere: il file se è
+    un solo file Excel, la lista dei file se sono i CSV dei quattro fogli (uno per foglio).
+
+    Parametri:
+        file_caricati (list): file caricati (st.file_uploader con accept_multiple_files).
+
+    Ritorna:
+        Il file Excel oppure la lista dei file CSV.
+
+    Solleva:
+        ValueError: per qualsiasi altra combinazione (un solo CSV, CSV diversi da quattro,
+                    file Excel insieme ad altri file).
+    """
+    file_caricati = list(file_caricati)
+    csv_caricati = [f for f in file_caricati if formato_file(f) == 'csv']
+    if len(file_caricati) == 1 and not csv_caricati:
+        return file_caricati[0]
+    if len(csv_caricati) == len(file_caricati) == len(FOGLI_CSV):
+        return file_caricati
+    raise ValueError(
+        f"Carica un solo file Excel oppure {len(FOGLI_CSV)} file CSV, uno per foglio "
+        f"({', '.join(FOGLI_CSV)}): hai caricato {len(csv_caricati)} CSV "
+        f"e {len(file_caricati) - len(csv_caricati)} altri file."
+    )
+
+
+def scegli_motore(formato, motore=None):
+    """
+    Sceglie il motore di lettura per il formato: calamine se installato, altrimenti pyxlsb per
+    i file xlsb e openpyxl per gli altri. Un motore richiesto ma non installato viene ignorato.
+
+    Parametri:
+        formato (str): formato del file (vedi formato_file).
+        motore (str): motore preferito ('calamine', 'pyxlsb', 'openpyxl'), opzionale.
+
+    Ritorna:
+        Nome del motore da usare.
+    """
+    if formato == 'csv':
+        return 'csv'
+    disponibili = [nome for nome, modulo in (('calamine', CalamineWorkbook), ('pyxlsb', open_xlsb)) if modulo]
+    if formato != 'xlsb':
+        disponibili = [nome for nome in disponibili if nome != 'pyxlsb'] + ['openpyxl']
+    if not disponibili:
+        raise ImportError("Per leggere file xlsb serve python-calamine o pyxlsb (pip install python-calamine).")
+    return motore if motore in disponibili else disponibili[0]
+
+
+def motore_pandas(sorgente):
+    """
+    Restituisce il motore da passare a pd.read_excel per il file (calamine se installato).
+    """
+    return scegli_motore(formato_file(sorgente))
+
+
+@contextmanager
+def apri_fogli(sorgente, formato=None, motore=None):
+    """
+    Apre il file con il motore scelto e fornisce le righe dei fogli, nell'ordine del workbook.
+
+    Ogni foglio è un iterabile di tuple di valori (intestazione compresa), con None per le celle
+    vuote e le date già come date; le colonne mantengono la posizione delle lettere Excel.
+    Se calamine non riesce ad aprire un file xlsx, la lettura passa a openpyxl.
+
+    Parametri:
+        sorgente: percorso o file caricato; per i CSV una lista di file, uno per foglio.
+        formato (str): formato del file, se None ricavato dal nome (vedi formato_file).
+        motore (str): motore preferito (vedi scegli_motore).
+
+    Ritorna (come context manager):
+        - nome del motore usato
+        - lista delle righe di ogni foglio
+    """
+    formato = formato or formato_file(sorgente)
+    motore = scegli_motore(formato, motore)
+
+    if motore == 'csv':
+        yield motore, _fogli_csv(sorgente)
+        return
+
+    if hasattr(sorgente, 'seek'):
+        sorgente.seek(0)
+
+    if motore == 'calamine':
+        try:
+            workbook = CalamineWorkbook.from_filelike(sorgente) if hasattr(sorgente, 'read') \
+                else CalamineWorkbook.from_path(str(sorgente))
+        except Exception:
+            if formato == 'xlsb':
+                raise
+            motore = 'openpyxl'
+            if hasattr(sorgente, 'seek'):
+                sorgente.seek(0)
+        else:
+            try:
+                yield motore, [_righe_calamine(workbook, i) for i in range(len(workbook.sheet_names))]
+            finally:
+                workbook.close()
+            return
+
+    if motore == 'pyxlsb':
+        with open_xlsb(sorgente) as workbook:
+            yield motore, [_righe_pyxlsb(workbook, i) for i in range(len(workbook.sheets))]
+        return
+
+    workbook = load_workbook(sorgente, read_only=True, data_only=True)
+    try:
+        yield motore, [_righe_openpyxl(sheet) for sheet in workbook.worksheets]
+    finally:
+        workbook.close()
+
+
+def _righe_openpyxl(sheet):
+    """
+    Righe di un foglio openpyxl in sola lettura, lette su richiesta.
+    """
+    # In modalità read_only le dimensioni salvate nel file possono essere errate
+    sheet.reset_dimensions()
+    yield from sheet.iter_rows(values_only=True)
+
+
+def _righe_calamine(workbook, indice):
+    """
+    Righe di un foglio calamine: le celle vuote ('') diventano None.
+    """
+    # skip_empty_area=False mantiene righe e colonne iniziali vuote, quindi le lettere Excel
+    for riga in workbook.get_sheet_by_index(indice).to_python(skip_empty_area=False):
+        yield tuple(None if valore == '' else valore for valore in riga)
+
+
+def _righe_pyxlsb(workbook, indice):
+    """
+    Righe di un foglio xlsb, con i numeri seriali delle colonne data convertiti in date.
+    """
+    lettere = COLONNE_DATA_XLSB.get(indice, "")
+    indici = None if lettere is None else indici_colonne(lettere)
+    with workbook.get_sheet(indice + 1) as sheet:
+        for riga in sheet.rows():
+            valori = [cella.v for cella in riga]
+            for i in (range(1, len(valori)) if indici is None else indici):
+                if i < len(valori) and isinstance(valori[i], (int, float)):
+                    valori[i] = convert_date(valori[i])
+            yield tuple(valori)
+
+
+def _fogli_csv(sorgenti):
+    """
+    Legge un export CSV (un file per foglio) come righe di testo.
+
+    I file sono associati ai fogli dalle parole di FOGLI_CSV nel nome; se il nome non basta,
+    vale l'ordine di caricamento.
+    """
+    sorgenti = list(sorgenti) if isinstance(sorgenti, (list, tuple)) else [sorgenti]
+    nomi = [Path(str(getattr(s, 'name', s))).stem.lower() for s in sorgenti]
+    per_nome = [next((s for s, nome in zip(sorgenti, nomi) if chiave in nome), None) for chiave in FOGLI_CSV]
+    if all(s is not None for s in per_nome) and len(set(map(id, per_nome))) == len(FOGLI_CSV):
+        sorgenti = per_nome
+    return [_righe_csv(sorgente) for sorgente in sorgenti]
+
+
+def _righe_csv(sorgente):
+    """
+    Righe di un file CSV, con separatore (';', ',' o tabulazione) e codifica riconosciuti dal file.
+    """
+    if isinstance(sorgente, (str, os.PathLike)):
+        contenuto = Path(sorgente).read_bytes()
+    else:
+        sorgente.seek(0)
+        contenuto = sorgente.read()
+    try:
+        testo = contenuto.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Export di Excel in italiano senza UTF-8
+        testo = contenuto.decode('cp1252')
+
+    prima_riga = testo.split('\n', 1)[0]
+    separatore = max([';', ',', '\t'], key=prima_riga.count)
+    # csv.reader accetta righe di lunghezza diversa, come i fogli con colonne vuote finali
+    for riga in csv.reader(io.StringIO(testo), delimiter=separatore):
+        yield tuple(None if valore == '' else valore for valore in riga)
+
+
+def indici_colonne(lettere):
+    """
+    Converte le lettere delle colonne (es. "B,D,E") in indici a partire da 0.
+    """
+    return [column_index_from_string(lettera.strip()) - 1 for lettera in lettere.split(",") if lettera.strip()]
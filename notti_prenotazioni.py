@@ -0,0 +1,137 @@
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from data_processing import MAX_NOTTI_SOGGIORNO
+from periodi import CalendarioPeriodi, costruisci_calendario
+
+# Importi delle prenotazioni ripartiti in parti uguali sulle notti del soggiorno
+COLONNE_RIPARTITE = [
+    'ricavi_totali', 'commissioni_totali', 'marginalità_totale',
+    'Ricavi Locazione', 'Ricavi Pulizie', 'Commissioni OTA',
+]
+
+
+@dataclass(frozen=True)
+class NottiPrenotazioni:
+    """
+    Tabella delle notti delle prenotazioni: una riga per notte occupata, con gli importi ripartiti.
+
+    I soggiorni senza notti (check-out nel giorno del check-in o mancante) hanno una sola riga
+    nel giorno del check-in con Notti Occupate = 0, così gli importi non vanno persi.
+    """
+    indice: pd.Index          # indice di DatiWorkbook.prenotazioni, per selezionare le prenotazioni filtrate
+    tabella: pd.DataFrame     # prenotazione (posizione, int32), giorno (giorni dal 1970, int32),
+                              # Notti Occupate (uint8) e COLONNE_RIPARTITE per notte (float32)
+    calendario: CalendarioPeriodi  # codici dei periodi di ogni granularità sui giorni della tabella
+
+    @cached_property
+    def impronta(self):
+        """
+        SHA-256 del contenuto (tabella e indice), calcolato alla prima richiesta: identifica le
+        notti nella cache dei grafici anche tra workbook diversi caricati nello stesso processo.
+        """
+        impronta = hashlib.sha256(pd.util.hash_pandas_object(self.tabella, index=False).to_numpy().tobytes())
+        impronta.update(pd.util.hash_pandas_object(self.indice).to_numpy().tobytes())
+        return impronta.hexdigest()
+
+
+def costruisci_notti(prenotazioni):
+    """
+    Espande le prenotazioni in notti con operazioni vettoriali (np.repeat e somme cumulate)
+    e calcola i codici dei periodi dei giorni coperti (vedi periodi.costruisci_calendario).
+
+    La notte i-esima di un soggiorno cade nel giorno check-in + i; ogni notte riceve
+    1/Durata Soggiorno degli importi della prenotazione. Così un soggiorno dal 28 gennaio
+    al 5 febbraio attribuisce 4 notti a gennaio e 4 a febbraio.
+
+    Parametri:
+        prenotazioni (DataFrame): prenotazioni elaborate (DatiWorkbook.prenotazioni).
+
+    Ritorna:
+        NottiPrenotazioni con la tabella delle notti.
+    """
+    check_in = prenotazioni['Data Check-In'].to_numpy(dtype='datetime64[D]').astype('int64')
+    # Le durate errate sono già azzerate al caricamento (calcola_colonne_derivate); il limite
+    # protegge np.repeat da workbook elaborati altrove
+    durata = np.clip(prenotazioni['Durata Soggiorno'].to_numpy(dtype='int64'), 0, MAX_NOTTI_SOGGIORNO)
+    # Almeno una riga per prenotazione, anche senza notti
+    righe = np.maximum(durata, 1)
+
+    # Posizione di ogni notte nel proprio soggiorno: contatore globale meno l'inizio del soggiorno
+    totale = int(righe.sum())
+    inizio_soggiorno = np.cumsum(righe) - righe
+    notte = np.arange(totale) - np.repeat(inizio_soggiorno, righe)
+
+    tabella = pd.DataFrame({
+        'prenotazione': np.repeat(np.arange(len(prenotazioni), dtype='int32'), righe),
+        'giorno': (np.repeat(check_in, righe) + notte).astype('int32'),
+        'Notti Occupate': np.repeat(durata > 0, righe).astype('uint8'),
+    })
+    for col in COLONNE_RIPARTITE:
+        quota = prenotazioni[col].to_numpy(dtype='float64') / righe
+        tabella[col] = np.repeat(quota, righe).astype('float32')
+
+    giorni = tabella['giorno'].to_numpy()
+    calendario = costruisci_calendario(giorni.min(), giorni.max()) if len(giorni) else costruisci_calendario(0, -1)
+
+    return NottiPrenotazioni(indice=prenotazioni.index, tabella=tabella, calendario=calendario)
+
+
+def somma_notti_per_periodo(notti, dati_filtrati, freq, colonne=(), start_date=None, end_date=None):
+    """
+    Somma notti occupate e importi ripartiti delle prenotazioni filtrate per periodo.
+
+    Parametri:
+        notti (NottiPrenotazioni): tabella delle notti del workbook (DatiWorkbook.notti).
+        dati_filtrati (DataFrame): prenotazioni selezionate, con l'indice di DatiWorkbook.prenotazioni.
+        freq (str): granularità dei periodi, tra le chiavi di periodi.GRANULARITA ('M', '2W', '3D').
+        colonne (list): colonne di COLONNE_RIPARTITE da sommare.
+        start_date, end_date (datetime.date): se indicate, contano solo le notti comprese
+                                              tra le due date (estremi inclusi).
+
+    Ritorna:
+        DataFrame con una riga per periodo: 'Periodo' (inizio), 'Fine Periodo' (ultimo giorno),
+        'Notti Occupate' e le colonne richieste.
+    """
+    colonne = list(colonne)
+    tabella = notti.tabella
+
+    # Prenotazioni selezionate, poi le loro notti nell'intervallo di date
+    selezionate = np.zeros(len(notti.indice), dtype=bool)
+    posizioni = notti.indice.get_indexer(dati_filtrati.index)
+    selezionate[posizioni[posizioni >= 0]] = True
+    maschera = selezionate[tabella['prenotazione'].to_numpy()]
+    giorno = tabella['giorno'].to_numpy()
+    if start_date is not None:
+        maschera &= giorno >= _giorno(start_date)
+    if end_date is not None:
+        maschera &= giorno <= _giorno(end_date)
+
+    # Codici dei periodi precalcolati; si tengono solo i periodi con almeno una notte
+    periodi = notti.calendario.periodi(freq)
+    codici = notti.calendario.codici(freq, giorno[maschera])
+    presenti = np.bincount(codici, minlength=len(periodi.inizi)) > 0
+    periodo = (np.cumsum(presenti) - 1)[codici]
+    inizi = periodi.inizi[presenti]
+
+    # Somme per periodo in float64 (np.bincount), anche se le quote sono float32
+    risultato = pd.DataFrame({
+        'Periodo': inizi,
+        'Fine Periodo': periodi.fini[presenti],
+        'Notti Occupate': np.bincount(periodo, weights=tabella['Notti Occupate'].to_numpy()[maschera],
+                                      minlength=len(inizi)).astype('int64'),
+    })
+    for col in colonne:
+        risultato[col] = np.bincount(periodo, weights=tabella[col].to_numpy()[maschera], minlength=len(inizi))
+    return risultato
+
+
+def _giorno(data):
+    """
+    Giorno di una data in giorni dal 1970-01-01.
+    """
+    return pd.Timestamp(data).to_datetime64().astype('datetime64[D]').astype('int64')
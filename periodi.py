@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Granularità dei grafici temporali (frequenze di pandas to_period) e loro etichetta
+GRANULARITA = {
+    'M': 'Mese',
+    '2W': 'Quindicina',
+    '3D': 'Ogni 3 giorni',
+}
+
+
+@dataclass(frozen=True)
+class PeriodiGranularita:
+    """
+    Periodi di una granularità sui giorni del calendario: codice intero per giorno e mappa codice → periodo.
+    """
+    codici: np.ndarray        # codice del periodo (int32) di ogni giorno da CalendarioPeriodi.primo_giorno
+    inizi: np.ndarray         # inizio (datetime64[ns]) di ogni codice, crescente
+    fini: np.ndarray          # ultimo giorno (datetime64[ns]) di ogni codice
+
+
+@dataclass(frozen=True)
+class CalendarioPeriodi:
+    """
+    Codici dei periodi di tutte le GRANULARITA per un intervallo di giorni, calcolati una volta
+    per workbook: i grafici raggruppano per codice senza convertire date.
+    """
+    primo_giorno: int                 # giorni dal 1970-01-01 del primo giorno coperto
+    granularita: dict                 # freq → PeriodiGranularita
+
+    def codici(self, freq, giorni):
+        """
+        Codici del periodo `freq` dei giorni indicati (giorni dal 1970, compresi nel calendario).
+        """
+        return self.periodi(freq).codici[giorni - self.primo_giorno]
+
+    def periodi(self, freq):
+        if freq not in self.granularita:
+            raise ValueError(f"Granularità non supportata: {freq}")
+        return self.granularita[freq]
+
+
+def costruisci_calendario(primo_giorno, ultimo_giorno):
+    """
+    Calcola i periodi di ogni granularità di GRANULARITA per i giorni da primo_giorno a
+    ultimo_giorno (giorni dal 1970-01-01, estremi inclusi).
+
+    I periodi sono quelli di pandas to_period(freq), identificati dall'inizio: i codici sono le
+    posizioni degli inizi ordinati, così l'ordine dei codici è quello cronologico.
+    """
+    giorni = pd.to_datetime(np.arange(primo_giorno, ultimo_giorno + 1), unit='D')
+
+    granularita = {}
+    for freq in GRANULARITA:
+        periodi = giorni.to_period(freq)
+        inizi, codici = np.unique(periodi.start_time.to_numpy(), return_inverse=True)
+        fini = pd.Series(periodi.end_time.normalize()).groupby(codici).max()
+        granularita[freq] = PeriodiGranularita(
+            codici=codici.astype('int32'),
+            inizi=inizi,
+            fini=fini.reindex(range(len(inizi))).to_numpy(),
+        )
+    return CalendarioPeriodi(primo_giorno=int(primo_giorno), granularita=granularita)
+
+
+def scegli_granularita(start_date, end_date):
+    """
+    Granularità di un grafico in base alla durata del periodo selezionato: mensile oltre
+    60 giorni, ogni 15 giorni oltre 15 giorni, altrimenti ogni 3 giorni.
+
+    Ritorna:
+        tuple: (freq, etichetta) con freq tra le chiavi di GRANULARITA.
+    """
+    delta = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days
+    if delta > 60:
+        freq = 'M'
+    elif delta > 15:
+        freq = '2W'
+    else:
+        freq = '3D'
+    return freq, GRANULARITA[freq]
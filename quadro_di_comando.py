@@ -1,8 +1,12 @@
 import streamlit as st
 
-from data_processing import carica_elaboara_spese, load_and_preprocess_data
-from draw_dashboard import dashboard_analisi_performance, dashboard_proprietari, dashboard_spese, render_calcolatore, \
-    render_dashboard
+from cache_grafici import CACHE_GRAFICI
+from draw_dashboard import dashboard_analisi_performance, dashboard_proprietari, dashboard_spese, imposta_database, \
+    render_calcolatore, render_dashboard
+from incremental_ingestion import carica_workbook_incrementale
+from ingestion_cache import carica_workbook_con_cache, chiave_file
+from motori_lettura import sorgente_caricata
+from sql_storage import database_workbook
 
 # Configurazione della pagina
 st.set_page_config(
@@ -17,18 +21,74 @@ st.set_page_config(
 def upload_file():
     # Sezione espandibile per il caricamento del file
     with st.expander("📂 Carica File Excel"):
-        uploaded_file = st.file_uploader("Seleziona un file Excel", type="xlsx")
+        uploaded_file = st.file_uploader(
+            "Seleziona un file Excel (xlsx, xlsb) o i CSV dei quattro fogli",
+            type=["xlsx", "xlsm", "xlsb", "csv"],
+            accept_multiple_files=True,
+            help="Per l'export CSV carica un file per foglio: prenotazioni, disponibilita, posizioni, spese."
+        )
+        streaming = st.checkbox(
+            "Lettura a blocchi (export molto grandi)",
+            help="Legge le prenotazioni a blocchi di righe per limitare la memoria usata."
+        )
+        incrementale = st.checkbox(
+            "Aggiornamento incrementale (nuovo export mensile)",
+            help="Confronta il file con quello caricato in precedenza ed elabora solo "
+                 "le prenotazioni e le spese inserite, modificate o rimosse."
+        )
         if uploaded_file:
-            st.success("File caricato con successo!")
-           # Salva i dati nel session state
+            # Un solo file Excel viene passato da solo, i CSV come lista (uno per foglio)
+            try:
+                uploaded_file = sorgente_caricata(uploaded_file)
+            except ValueError as errore:
+                st.error(str(errore))
+                return None
+            chiave = chiave_file(uploaded_file)
+            precedente = st.session_state.get('workbook')
+            if precedente is not None and st.session_state.get('chiave_file') == chiave:
+                # Stesso file del rerun precedente: il workbook è già in memoria
+                workbook = precedente
+            elif incrementale:
+                # Senza un workbook precedente con impronte tutte le righe vengono elaborate
+                workbook, delta = carica_workbook_incrementale(uploaded_file, precedente)
+                # Il database del workbook precedente, se già creato, viene copiato e riceve solo le differenze
+                if precedente is not None and st.session_state.get('db_workbook') is precedente:
+                    imposta_database(database_workbook(workbook, precedente, delta), workbook)
+                for foglio, conteggi in delta.riepilogo.items():
+                    st.info(f"{foglio}: {conteggi['inserite']} inserite, {conteggi['modificate']} modificate, "
+                            f"{conteggi['rimosse']} rimosse.")
+            else:
+                # Legge tutti i fogli (dalla cache se il file è già stato elaborato) e salva i dati nel session state
+                workbook = carica_workbook_con_cache(uploaded_file, streaming=streaming)
+            st.session_state['chiave_file'] = chiave
             st.session_state['uploaded_file'] = uploaded_file
-            st.session_state['data'] = load_and_preprocess_data(uploaded_file)
-            st.session_state['spese'] = carica_elaboara_spese(uploaded_file)
+            st.session_state['workbook'] = workbook
+            st.session_state['data'] = workbook.prenotazioni
+            st.session_state['spese'] = workbook.spese
+            st.success("File caricato con successo!")
+            # Segnala le celle con importi o date non convertibili
+            for foglio, colonne in workbook.righe_non_valide.items():
+                for colonna, righe in colonne.items():
+                    st.warning(
+                        f"{foglio}, colonna '{colonna}': {len(righe)} valori non convertibili "
+                        f"(righe {', '.join(map(str, righe[:10]))}{'…' if len(righe) > 10 else ''})."
+                    )
+            st.caption(f"Motore di lettura: {workbook.motore} ({workbook.tempo_lettura:.2f} s)")
+            # Memoria delle prenotazioni con lo schema compatto (solo alla prima elaborazione del file)
+            if workbook.memoria:
+                st.caption(
+                    f"Memoria prenotazioni: {workbook.memoria['dopo'] / 1e6:.1f} MB "
+                    f"(prima della conversione {workbook.memoria['prima'] / 1e6:.1f} MB)"
+                )
     return uploaded_file
 
 
 ################### Main  ####################
 menu = st.sidebar.selectbox("Menù", ["Carica File", "Dashboard", "Analisi Performance", "Dashboard Propietari", "Analisi spese", "Calcolatore"])
+# Motore di calcolo dei KPI: pandas in memoria oppure query SQL sul database SQLite
+st.sidebar.radio("Motore di calcolo", ("Pandas", "SQL"), key="backend", horizontal=True)
+# Importi esatti: somme in centesimi interi e scorpori IVA arrotondati per prenotazione
+st.sidebar.toggle("Importi esatti al centesimo", key="importi_esatti")
 
 if menu == "Carica File":
     upload_file()
@@ -42,3 +102,10 @@ elif menu == "Analisi spese":
     dashboard_spese()
 elif menu == "Calcolatore":
     render_calcolatore()
+
+# Efficacia della cache dei grafici (cache_grafici), aggiornata a fine pagina
+statistiche = CACHE_GRAFICI.statistiche()
+st.sidebar.caption(
+    f"Cache grafici: {statistiche.colpi} colpi, {statistiche.mancati} mancati, "
+    f"{statistiche.voci}/{statistiche.max_voci} figure"
+)
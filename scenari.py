@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Assi della griglia degli scenari, nell'ordine delle dimensioni di GrigliaScenari.margine
+ASSI_SCENARI = ['occupazione', 'prezzo_notte', 'prezzo_pulizie', 'commissione_ota', 'costi_fissi']
+
+
+@dataclass(frozen=True)
+class GrigliaScenari:
+    """
+    Margine annuo di un immobile per ogni combinazione dei valori dei parametri.
+    """
+    occupazione: np.ndarray      # tasso di occupazione (%)
+    prezzo_notte: np.ndarray     # ricavo di locazione per notte, senza IVA (€)
+    prezzo_pulizie: np.ndarray   # prezzo delle pulizie per soggiorno, IVA inclusa (€)
+    commissione_ota: np.ndarray  # commissione OTA sul prezzo lordo del soggiorno (%)
+    costi_fissi: np.ndarray      # costi fissi annui (€)
+    margine: np.ndarray          # margine annuo, una dimensione per asse di ASSI_SCENARI
+    pareggio: np.ndarray         # occupazione (%) di pareggio per prezzo, pulizie, commissione e costi fissi
+                                 # (NaN se il pareggio non è raggiungibile entro il 100%)
+
+
+def parametri_storici(kpis):
+    """
+    Ricava dai KPI storici i valori di partenza del calcolatore.
+
+    Parametri:
+        kpis (KPI): KPI delle prenotazioni selezionate.
+
+    Ritorna:
+        dict con occupazione, prezzo_notte, prezzo_pulizie, commissione_ota (in %),
+        soggiorno_medio e quota_proprietari (frazione dei ricavi di locazione).
+    """
+    ricavi_locazione = kpis.totale_ricavi_locazione
+    ricavi_lordi = ricavi_locazione + kpis.totale_ricavi_pulizie * 1.22
+
+    def quota(valore, totale):
+        return float(valore / totale) if totale else 0.0
+
+    return {
+        'occupazione': float(np.nan_to_num(kpis.tasso_di_occupazione)),
+        'prezzo_notte': float(np.nan_to_num(kpis.prezzo_medio_notte)),
+        'prezzo_pulizie': float(np.nan_to_num(kpis.prezzo_pulizie)) * 1.22,
+        'commissione_ota': quota(kpis.commissioni_ota * 1.22, ricavi_lordi) * 100,
+        'soggiorno_medio': float(np.nan_to_num(kpis.soggiorno_medio, nan=1.0)) or 1.0,
+        'quota_proprietari': quota(kpis.commissioni_proprietari, ricavi_locazione),
+    }
+
+
+def valuta_scenari(occupazione, prezzo_notte, prezzo_pulizie, commissione_ota, costi_fissi,
+                   notti_disponibili=365, soggiorno_medio=1.0, quota_proprietari=0.0):
+    """
+    Calcola il margine annuo su tutta la griglia dei parametri con il broadcasting di NumPy.
+
+    Le formule sono quelle della marginalità totale di kpis.deriva_kpi applicate a un anno di notti:
+        ricavi = notti * prezzo_notte + soggiorni * prezzo_pulizie / 1.22
+        commissioni OTA = commissione_ota * (notti * prezzo_notte + soggiorni * prezzo_pulizie) / 1.22
+        commissioni proprietari = quota_proprietari * notti * prezzo_notte
+        margine = ricavi - commissioni - costi_fissi
+    con notti = occupazione * notti_disponibili e soggiorni = notti / soggiorno_medio.
+
+    Il margine è lineare nell'occupazione: il contributo per notte permette di calcolare
+    direttamente l'occupazione di pareggio di ogni combinazione.
+
+    Parametri:
+        occupazione, prezzo_notte, prezzo_pulizie, commissione_ota, costi_fissi (array):
+            valori di ogni asse (vedi GrigliaScenari).
+        notti_disponibili (int): notti disponibili nell'anno.
+        soggiorno_medio (float): notti per soggiorno.
+        quota_proprietari (float): commissioni proprietari come frazione dei ricavi di locazione.
+
+    Ritorna:
+        GrigliaScenari con il margine e l'occupazione di pareggio.
+    """
+    assi = [np.asarray(asse, dtype='float64') for asse in
+            (occupazione, prezzo_notte, prezzo_pulizie, commissione_ota, costi_fissi)]
+    occ, prezzo, pulizie, ota, fissi = np.ix_(*assi)
+
+    # Contributo per notte occupata (dimensioni: 1 × prezzo × pulizie × commissione × 1)
+    contributo = contributo_per_notte(prezzo, pulizie, ota, soggiorno_medio, quota_proprietari)
+
+    notti = occ / 100 * notti_disponibili
+    margine = notti * contributo - fissi
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pareggio = fissi[0] / (contributo[0] * notti_disponibili) * 100
+    pareggio = np.where((contributo[0] > 0) & (pareggio <= 100), pareggio, np.nan)
+
+    return GrigliaScenari(*assi, margine=margine, pareggio=pareggio)
+
+
+def contributo_per_notte(prezzo_notte, prezzo_pulizie, commissione_ota, soggiorno_medio, quota_proprietari):
+    """
+    Margine per notte occupata prima dei costi fissi (vedi valuta_scenari).
+
+    Accetta scalari o array con dimensioni compatibili per il broadcasting; la commissione OTA è in %.
+    """
+    pulizie_per_notte = prezzo_pulizie / soggiorno_medio
+    return (
+        prezzo_notte * (1 - quota_proprietari)
+        + pulizie_per_notte / 1.22
+        - commissione_ota / 100 * (prezzo_notte + pulizie_per_notte) / 1.22
+    )
+
+
+def tabella_pareggio(griglia, indice_pulizie, indice_ota):
+    """
+    Occupazione di pareggio per prezzo per notte (righe) e costi fissi (colonne), con
+    prezzo delle pulizie e commissione OTA fissati.
+
+    Parametri:
+        griglia (GrigliaScenari): scenari calcolati da valuta_scenari.
+        indice_pulizie, indice_ota (int): posizioni dei valori scelti sui rispettivi assi.
+
+    Ritorna:
+        DataFrame con l'occupazione (%) di pareggio.
+    """
+    return pd.DataFrame(
+        griglia.pareggio[:, indice_pulizie, indice_ota, :],
+        index=pd.Index(griglia.prezzo_notte, name='Prezzo per notte (€)'),
+        columns=pd.Index(griglia.costi_fissi, name='Costi fissi (€)'),
+    )
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from data_processing import COLONNE_NUMERICHE
+
+# Schema compatto delle prenotazioni: chiavi ripetute come categorie, importi in float32
+# dove la precisione al centesimo è garantita, durate in interi piccoli.
+SCHEMA_PRENOTAZIONI = {
+    'ID Appartamento': 'category',
+    'Nome Appartamento': 'category',
+    'Nome Proprietario': 'category',
+    'OTA': 'category',
+    'OTA Lordo/Netta': 'category',
+    'Mese': 'category',
+    'nome_immobile': 'category',
+    'id_immobile': 'category',
+    'zona': 'category',
+    'coordinate_zona': 'category',
+    'indirizzo': 'category',
+    'coordinate_indirizzo': 'category',
+    'Durata Soggiorno': 'int32',
+    **{col: 'float32' for col in COLONNE_NUMERICHE},
+    'ricavi_totali': 'float32',
+    'commissioni_totali': 'float32',
+    'marginalità_totale': 'float32',
+    'commissioni_OTA_locazioni': 'float32',
+    'marginalità_locazioni': 'float32',
+    'marginalità_pulizie': 'float32',
+    'costo_pulizie_ps': 'float32',
+    'costo_scorte_ps': 'float32',
+    'costo_manutenzioni_ps': 'float32',
+}
+
+
+def applica_schema(data, schema=SCHEMA_PRENOTAZIONI):
+    """
+    Converte le colonne delle prenotazioni nei tipi compatti dello schema.
+
+    Le colonne float32 vengono convertite solo se ogni importo resta uguale al centesimo;
+    le colonne intere solo se non ci sono valori mancanti. Le colonne assenti vengono ignorate.
+
+    Parametri:
+        data (DataFrame): prenotazioni elaborate (dopo unisci_posizioni).
+        schema (dict): tipo di destinazione per colonna.
+
+    Ritorna:
+        - DataFrame con i tipi compatti
+        - dict con la memoria occupata prima e dopo, in byte ('prima', 'dopo')
+    """
+    prima = int(data.memory_usage(deep=True).sum())
+
+    tipi = {}
+    for col, tipo in schema.items():
+        if col not in data.columns:
+            continue
+        if tipo == 'float32' and not _float32_al_centesimo(data[col]):
+            continue
+        if tipo.startswith('int') and data[col].isna().any():
+            continue
+        tipi[col] = tipo
+    data = data.astype(tipi)
+
+    return data, {'prima': prima, 'dopo': int(data.memory_usage(deep=True).sum())}
+
+
+def _float32_al_centesimo(colonna):
+    """
+    Verifica che la colonna, convertita in float32, conservi ogni valore arrotondato al centesimo.
+    """
+    valori = pd.to_numeric(colonna, errors='coerce').to_numpy(dtype='float64')
+    ridotti = valori.astype('float32').astype('float64')
+    return bool(np.array_equal(np.round(valori, 2), np.round(ridotti, 2), equal_nan=True))
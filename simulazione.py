@@ -0,0 +1,241 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from kpis import calculate_kpis_grouped
+from scenari import contributo_per_notte
+
+# Percentili del margine annuo riportati dalla simulazione
+PERCENTILI = (5, 25, 50, 75, 95)
+
+# Prove simulate da ogni processo: sotto questa soglia la simulazione resta nel processo corrente
+PROVE_PER_BLOCCO = 50_000
+
+# Dispersione relativa usata quando gli appartamenti comparabili sono meno di due
+DISPERSIONE_MINIMA = 0.10
+
+# Processi per le simulazioni grandi: creati una volta e riusati (vedi _esecutore)
+_ESECUTORE = None
+_LOCK_ESECUTORE = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ParametriSimulazione:
+    """
+    Distribuzioni dei parametri annui di un nuovo immobile, stimate dagli appartamenti comparabili.
+
+    È immutabile e confrontabile per valore: fa da chiave della cache delle simulazioni.
+    """
+    occupazione_alfa: float      # Beta del tasso di occupazione (frazione)
+    occupazione_beta: float
+    prezzo_mu: float             # lognormale del prezzo per notte (media e deviazione del logaritmo)
+    prezzo_sigma: float
+    soggiorno_media: float       # normale della durata media del soggiorno (notti, almeno 1)
+    soggiorno_dev: float
+    pulizie_media: float         # normale del prezzo delle pulizie per soggiorno, IVA inclusa
+    pulizie_dev: float
+    ota_media: float             # normale della commissione OTA (%)
+    ota_dev: float
+    proprietari_media: float     # normale della quota dei proprietari sui ricavi di locazione
+    proprietari_dev: float
+    costi_fissi_media: float     # normale dei costi fissi annui
+    costi_fissi_dev: float
+    notti_anno: int = 365
+    comparabili: int = 0         # appartamenti usati per la stima
+
+
+@dataclass(frozen=True)
+class RisultatoSimulazione:
+    """
+    Sintesi del margine annuo simulato.
+    """
+    prove: int
+    percentili: pd.Series        # margine per ogni percentile di PERCENTILI
+    media: float
+    probabilita_perdita: float   # frazione delle prove con margine negativo
+    conteggi: np.ndarray         # istogramma del margine
+    bordi: np.ndarray
+
+
+def stima_parametri(prenotazioni, notti_disponibili_filtrate, zona, costi_fissi, costi_fissi_dev=0.0, notti_anno=365):
+    """
+    Stima le distribuzioni di ParametriSimulazione dai KPI degli appartamenti della zona,
+    un campione per appartamento (calculate_kpis_grouped).
+
+    Il tasso di occupazione segue una Beta e il prezzo per notte una lognormale, stimate con
+    il metodo dei momenti; soggiorno medio, pulizie, commissione OTA e quota dei proprietari
+    seguono normali troncate. Con meno di due appartamenti comparabili la dispersione è
+    DISPERSIONE_MINIMA del valore medio.
+
+    Parametri:
+        prenotazioni (DataFrame): prenotazioni del periodo storico di riferimento.
+        notti_disponibili_filtrate (DataFrame): notti disponibili per appartamento nello stesso periodo.
+        zona (str): zona degli appartamenti comparabili.
+        costi_fissi, costi_fissi_dev (float): media e deviazione dei costi fissi annui.
+        notti_anno (int): notti disponibili nell'anno del nuovo immobile.
+
+    Ritorna:
+        ParametriSimulazione.
+    """
+    comparabili = prenotazioni[prenotazioni['zona'] == zona]
+    kpi = calculate_kpis_grouped(comparabili, notti_disponibili_filtrate, 'Nome Appartamento')
+
+    def colonna(nome):
+        return kpi[nome].to_numpy(dtype='float64')
+
+    ricavi_locazione = colonna('totale_ricavi_locazione')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ota = colonna('commissioni_ota') * 1.22 / (ricavi_locazione + colonna('totale_ricavi_pulizie') * 1.22) * 100
+        proprietari = colonna('commissioni_proprietari') / ricavi_locazione
+
+    occupazione = colonna('tasso_di_occupazione') / 100
+    occupazione_alfa, occupazione_beta = _beta(occupazione[(occupazione > 0) & (occupazione < 1)])
+    prezzo = colonna('prezzo_medio_notte')
+    prezzo_mu, prezzo_sigma = _momenti(np.log(prezzo[prezzo > 0]), dispersione_assoluta=True)
+    soggiorno_media, soggiorno_dev = _momenti(colonna('soggiorno_medio'), predefinito=1.0)
+    pulizie_media, pulizie_dev = _momenti(colonna('prezzo_pulizie') * 1.22)
+    ota_media, ota_dev = _momenti(ota)
+    proprietari_media, proprietari_dev = _momenti(proprietari)
+
+    return ParametriSimulazione(
+        occupazione_alfa=occupazione_alfa,
+        occupazione_beta=occupazione_beta,
+        prezzo_mu=prezzo_mu,
+        prezzo_sigma=prezzo_sigma,
+        soggiorno_media=soggiorno_media,
+        soggiorno_dev=soggiorno_dev,
+        pulizie_media=pulizie_media,
+        pulizie_dev=pulizie_dev,
+        ota_media=ota_media,
+        ota_dev=ota_dev,
+        proprietari_media=proprietari_media,
+        proprietari_dev=proprietari_dev,
+        costi_fissi_media=float(costi_fissi),
+        costi_fissi_dev=float(costi_fissi_dev),
+        notti_anno=int(notti_anno),
+        comparabili=len(kpi),
+    )
+
+
+@lru_cache(maxsize=32)
+def simula_margine(parametri, prove=100_000, seme=0):
+    """
+    Simula il margine annuo di un nuovo immobile e ne riassume la distribuzione.
+
+    Le prove sono divise in blocchi di PROVE_PER_BLOCCO eseguiti in parallelo nei processi
+    di _esecutore (con un solo blocco la simulazione resta nel processo corrente), ciascuno
+    con un generatore indipendente derivato da `seme`: a parità di parametri il risultato è
+    lo stesso. I risultati restano in cache (per parametri, prove e seme), così un nuovo
+    rendering della pagina non ripete la simulazione.
+
+    Parametri:
+        parametri (ParametriSimulazione): distribuzioni stimate con stima_parametri.
+        prove (int): numero di anni simulati.
+        seme (int): seme del generatore casuale.
+
+    Ritorna:
+        RisultatoSimulazione.
+    """
+    blocchi = max(1, -(-prove // PROVE_PER_BLOCCO))
+    dimensioni = [len(parte) for parte in np.array_split(np.arange(prove), blocchi)]
+    semi = np.random.SeedSequence(seme).spawn(blocchi)
+
+    if blocchi == 1:
+        margini = _simula_blocco(parametri, dimensioni[0], semi[0])
+    else:
+        try:
+            margini = np.concatenate(list(_esecutore().map(_simula_blocco, [parametri] * blocchi, dimensioni, semi)))
+        except BrokenProcessPool:
+            # Un processo è terminato (es. main non importabile con 'spawn'): il prossimo
+            # calcolo ricrea l'esecutore, questo prosegue nel processo corrente
+            _scarta_esecutore()
+            margini = np.concatenate([_simula_blocco(parametri, dimensione, seme_blocco)
+                                       for dimensione, seme_blocco in zip(dimensioni, semi)])
+
+    conteggi, bordi = np.histogram(margini, bins=60)
+    return RisultatoSimulazione(
+        prove=prove,
+        percentili=pd.Series(np.percentile(margini, PERCENTILI), index=[f"P{p}" for p in PERCENTILI]),
+        media=float(margini.mean()),
+        probabilita_perdita=float((margini < 0).mean()),
+        conteggi=conteggi,
+        bordi=bordi,
+    )
+
+
+def _esecutore():
+    """
+    ProcessPoolExecutor condiviso dalle simulazioni, creato alla prima richiesta.
+
+    I processi sono avviati con 'spawn': il server Streamlit ha più thread e un fork
+    (predefinito su Linux) potrebbe copiare lock già acquisiti e bloccare i processi figli.
+    """
+    global _ESECUTORE
+    with _LOCK_ESECUTORE:
+        if _ESECUTORE is None:
+            _ESECUTORE = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _ESECUTORE
+
+
+def _scarta_esecutore():
+    """
+    Chiude l'esecutore condiviso dopo un errore dei processi, così ne viene creato uno nuovo.
+    """
+    global _ESECUTORE
+    with _LOCK_ESECUTORE:
+        if _ESECUTORE is not None:
+            _ESECUTORE.shutdown(wait=False, cancel_futures=True)
+            _ESECUTORE = None
+
+
+def _simula_blocco(parametri, prove, seme):
+    """
+    Margine annuo di `prove` anni simulati, con estrazioni vettoriali (eseguito nei processi figli).
+    """
+    rng = np.random.default_rng(seme)
+    p = parametri
+
+    occupazione = rng.beta(p.occupazione_alfa, p.occupazione_beta, prove)
+    prezzo = rng.lognormal(p.prezzo_mu, p.prezzo_sigma, prove)
+    soggiorno = np.maximum(rng.normal(p.soggiorno_media, p.soggiorno_dev, prove), 1)
+    pulizie = np.maximum(rng.normal(p.pulizie_media, p.pulizie_dev, prove), 0)
+    ota = np.clip(rng.normal(p.ota_media, p.ota_dev, prove), 0, 100)
+    proprietari = np.clip(rng.normal(p.proprietari_media, p.proprietari_dev, prove), 0, 1)
+    costi_fissi = np.maximum(rng.normal(p.costi_fissi_media, p.costi_fissi_dev, prove), 0)
+
+    notti = occupazione * p.notti_anno
+    return notti * contributo_per_notte(prezzo, pulizie, ota, soggiorno, proprietari) - costi_fissi
+
+
+def _beta(valori):
+    """
+    Parametri alfa e beta di una Beta con media e varianza dei valori (metodo dei momenti).
+    """
+    media, dev = _momenti(valori, predefinito=0.5)
+    media = min(max(media, 1e-3), 1 - 1e-3)
+    # Concentrazione alfa + beta; una varianza nulla o eccessiva la rende non valida
+    concentrazione = media * (1 - media) / dev ** 2 - 1 if dev > 0 else 0
+    if concentrazione <= 0:
+        concentrazione = max(media * (1 - media) / (DISPERSIONE_MINIMA * media) ** 2 - 1, 2.0)
+    return media * concentrazione, (1 - media) * concentrazione
+
+
+def _momenti(valori, predefinito=0.0, dispersione_assoluta=False):
+    """
+    Media e deviazione standard dei valori finiti; con meno di due valori la deviazione è
+    DISPERSIONE_MINIMA della media (o DISPERSIONE_MINIMA stessa, per grandezze logaritmiche).
+    """
+    valori = valori[np.isfinite(valori)]
+    media = float(valori.mean()) if len(valori) else predefinito
+    if len(valori) >= 2:
+        return media, float(valori.std(ddof=1))
+    return media, DISPERSIONE_MINIMA if dispersione_assoluta else abs(media) * DISPERSIONE_MINIMA
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+# Codice delle righe IVA del Foglio 4: appartengono alla spesa che le precede
+CODICE_IVA = '59.01.01'
+
+# Colonne descrittive della spesa riportate nella tabella netta, come categorie
+COLONNE_CATEGORIA = ['Codice', 'Settore di spesa', 'Immobile associato alla spesa']
+
+
+def normalizza_spese(spese):
+    """
+    Trasforma le righe del Foglio 4 (spese seguite dalle proprie righe IVA) in una tabella
+    con una riga per spesa e gli importi lordo, IVA e netto.
+
+    Ogni spesa viene associata a tutte le righe IVA che la seguono fino alla spesa successiva
+    (nessuna, una o più), con un'unica somma raggruppata per posizione.
+
+    Parametri:
+        spese (DataFrame): spese elaborate da data_processing.elabora_spese (DatiWorkbook.spese).
+
+    Ritorna:
+        DataFrame con una riga per spesa: 'riga' (posizione in spese), 'data', 'Codice',
+        'Descrizione', 'Settore di spesa', 'Immobile associato alla spesa', 'lordo', 'iva',
+        'netto' (float64) e 'righe_iva' (numero di righe IVA della spesa).
+    """
+    iva = (spese['Codice'] == CODICE_IVA).to_numpy()
+    # Gruppo di ogni riga: numero di spese incontrate fino a lì (0 = righe IVA senza spesa)
+    gruppo = np.cumsum(~iva)
+    gruppi = int(gruppo[-1]) + 1 if len(gruppo) else 1
+
+    importo = spese['Importo'].to_numpy(dtype='float64')
+    iva_per_gruppo = np.bincount(gruppo, weights=np.where(iva & ~np.isnan(importo), importo, 0), minlength=gruppi)
+    righe_iva = np.bincount(gruppo, weights=iva, minlength=gruppi)
+
+    righe = np.flatnonzero(~iva)
+    voci = spese.iloc[righe]
+    lordo = voci['Importo Totale'].to_numpy(dtype='float64')
+    importo_iva = iva_per_gruppo[gruppo[righe]]
+
+    tabella = pd.DataFrame({
+        'riga': righe.astype('int32'),
+        'data': voci['data'].to_numpy(),
+        'Codice': voci['Codice'].to_numpy(),
+        'Descrizione': voci['Descrizione'].to_numpy(),
+        'Settore di spesa': voci['Settore di spesa'].to_numpy(),
+        'Immobile associato alla spesa': voci['Immobile associato alla spesa'].to_numpy(),
+        'lordo': lordo,
+        'iva': importo_iva,
+        'netto': lordo - importo_iva,
+        'righe_iva': righe_iva[gruppo[righe]].astype('int16'),
+    })
+    return tabella.astype({col: 'category' for col in COLONNE_CATEGORIA})
+
+
+def totali_per_settore(spese_nette):
+    """
+    Totali lordo, IVA e netto per settore di spesa con un solo groupby sulla tabella netta.
+
+    Parametri:
+        spese_nette (DataFrame): tabella di normalizza_spese, eventualmente filtrata.
+
+    Ritorna:
+        DataFrame con 'Settore di spesa', 'Totale Spese', 'Totale IVA' e 'totale_netto'.
+    """
+    return spese_nette.groupby('Settore di spesa', observed=True)[['lordo', 'iva', 'netto']].sum().reset_index().rename(
+        columns={'lordo': 'Totale Spese', 'iva': 'Totale IVA', 'netto': 'totale_netto'}
+    )
@@ -0,0 +1,242 @@
+import math
+
+import pandas as pd
+
+from kpis import KPI
+
+# Codice delle righe IVA nel Foglio 4
+CODICE_IVA = '59.01.01'
+
+
+# Somme per prenotazione nel periodo/selezione richiesti, da cui sono derivati tutti i KPI.
+# Riproduce calculate_kpis (kpis.py): stesse formule, IVA al 22%; le divisioni usano dividi
+# (vedi _dividi) per dare NaN o ±inf come NumPy quando il divisore è zero.
+QUERY_KPIS = """
+WITH filtrate AS (
+    SELECT *
+    FROM prenotazioni
+    WHERE "Data Check-In" BETWEEN :inizio AND :fine
+    {filtri}
+),
+somme AS (
+    SELECT
+        TOTAL("Ricavi Locazione") AS ricavi_locazione,
+        TOTAL("Ricavi Pulizie") AS ricavi_pulizie,
+        TOTAL("IVA Provvigioni PM") AS iva_provvigioni_pm,
+        TOTAL("Commissioni OTA") AS commissioni_ota_lorde,
+        TOTAL("Commissioni ITW Nette") AS commissioni_itw,
+        TOTAL("IVA Commissioni ITW") AS iva_commissioni_itw,
+        TOTAL("Commissioni Proprietari Lorde") AS commissioni_proprietari,
+        AVG(costo_pulizie_ps) AS costo_pulizie_ps,
+        AVG(costo_scorte_ps) AS costo_scorte_ps,
+        AVG(costo_manutenzioni_ps) AS costo_manutenzioni_ps,
+        TOTAL(costo_pulizie_ps) AS costo_pulizie_ps_totali,
+        TOTAL(costo_scorte_ps) AS costo_scorte_ps_totali,
+        TOTAL(costo_manutenzioni_ps) AS costo_manutenzioni_ps_totali,
+        COUNT(*) AS numero_prenotazioni,
+        TOTAL(MAX(julianday("Data Check-Out") - julianday("Data Check-In"), 0)) AS notti_occupate
+    FROM filtrate
+),
+base AS (
+    SELECT
+        *,
+        ricavi_locazione - iva_provvigioni_pm AS totale_ricavi_locazione,
+        ricavi_pulizie / 1.22 AS totale_ricavi_pulizie,
+        commissioni_ota_lorde / 1.22 AS commissioni_ota,
+        commissioni_ota_lorde / 1.22 * dividi(ricavi_locazione, ricavi_locazione + ricavi_pulizie)
+            AS commissioni_ota_locazioni,
+        commissioni_ota_lorde * 0.22 + iva_commissioni_itw AS IVA_Totale_credito,
+        iva_provvigioni_pm AS IVA_Totale_Debito,
+        costo_scorte_ps_totali + costo_manutenzioni_ps_totali AS altri_costi,
+        (SELECT TOTAL(MAX(julianday(MIN(data_fine, :fine)) - julianday(MAX(data_inizio, :inizio)) + 1, 0))
+         FROM disponibilita
+         WHERE 1 = 1 {filtri_disponibilita}) AS notti_disponibili
+    FROM somme
+),
+margini AS (
+    SELECT
+        *,
+        totale_ricavi_locazione - commissioni_ota_locazioni - commissioni_proprietari AS marginalità_locazioni,
+        totale_ricavi_pulizie - (commissioni_ota - commissioni_ota_locazioni) AS marginalità_pulizie
+    FROM base
+)
+SELECT
+    totale_ricavi_locazione,
+    totale_ricavi_pulizie,
+    totale_ricavi_locazione + totale_ricavi_pulizie AS ricavi_totali,
+    commissioni_ota,
+    commissioni_itw,
+    commissioni_proprietari,
+    commissioni_ota + commissioni_itw + commissioni_proprietari AS totale_commissioni,
+    marginalità_locazioni,
+    marginalità_pulizie,
+    marginalità_locazioni + marginalità_pulizie AS marginalità_totale,
+    IVA_Totale_credito,
+    IVA_Totale_Debito,
+    IVA_Totale_Debito - IVA_Totale_credito AS Saldo_IVA,
+    dividi(totale_ricavi_locazione, numero_prenotazioni) AS valore_medio_prenotazione,
+    dividi(totale_ricavi_locazione, notti_occupate) AS prezzo_medio_notte,
+    dividi(notti_occupate, numero_prenotazioni) AS soggiorno_medio,
+    dividi(marginalità_locazioni + marginalità_pulizie, numero_prenotazioni) AS margine_medio_prenotazione,
+    dividi(marginalità_locazioni, notti_occupate) AS margine_medio_notte,
+    dividi(marginalità_pulizie, numero_prenotazioni) AS margine_medio_pulizie,
+    dividi(totale_ricavi_pulizie, numero_prenotazioni) AS prezzo_pulizie,
+    notti_occupate,
+    dividi(notti_occupate, notti_disponibili) * 100 AS tasso_di_occupazione,
+    notti_disponibili,
+    notti_disponibili - notti_occupate AS notti_libere,
+    numero_prenotazioni,
+    costo_pulizie_ps,
+    costo_scorte_ps,
+    costo_manutenzioni_ps,
+    costo_pulizie_ps_totali,
+    costo_scorte_ps_totali,
+    costo_manutenzioni_ps_totali,
+    altri_costi,
+    marginalità_locazioni + marginalità_pulizie - costo_pulizie_ps_totali - altri_costi AS marginalità_immobile
+FROM margini
+"""
+
+QUERY_NOTTI_DISPONIBILI = """
+SELECT
+    appartamento AS "Appartamento",
+    CAST(TOTAL(MAX(julianday(MIN(data_fine, :fine)) - julianday(MAX(data_inizio, :inizio)) + 1, 0)) AS INTEGER)
+        AS "Notti Disponibili"
+FROM disponibilita
+WHERE 1 = 1 {filtri}
+GROUP BY appartamento
+ORDER BY MIN(rowid)
+"""
+
+# Totali per settore: importi delle spese e delle righe IVA (già associate al settore della spesa)
+QUERY_SPESE_SETTORE = """
+SELECT
+    "Settore di spesa",
+    TOTAL(CASE WHEN Codice IS NOT :codice_iva THEN "Importo Totale" END) AS "Totale Spese",
+    TOTAL(CASE WHEN Codice IS :codice_iva THEN Importo END) AS "Totale IVA",
+    TOTAL(CASE WHEN Codice IS NOT :codice_iva THEN "Importo Totale" END)
+        - TOTAL(CASE WHEN Codice IS :codice_iva THEN Importo END) AS totale_netto
+FROM spese
+WHERE "Settore di spesa" IS NOT NULL {filtri}
+GROUP BY "Settore di spesa"
+ORDER BY "Settore di spesa"
+"""
+
+QUERY_SPESE_PERIODO = """
+SELECT *
+FROM spese
+WHERE 1 = 1 {filtri}
+ORDER BY rowid
+"""
+
+
+def calculate_kpis_sql(conn, start_date, end_date, appartamenti=None, zone=None):
+    """
+    Calcola i KPI di calculate_kpis con una query parametrica sul database.
+
+    I filtri sono quelli delle dashboard: check-in nel periodo, appartamenti e zone sulle
+    prenotazioni; notti disponibili degli appartamenti selezionati (tutti se nessuno), senza
+    filtro di zona. Gli indici di sql_storage.INDICI coprono appartamento o zona con la data.
+
+    Parametri:
+        conn (sqlite3.Connection): database popolato da salva_workbook_su_db.
+        start_date, end_date: intervallo sulla data di check-in (estremi inclusi).
+        appartamenti (list): nomi degli appartamenti da includere (None = tutti).
+        zone (list): zone da includere (None = tutte).
+
+    Ritorna:
+        KPI con gli stessi valori restituiti da calculate_kpis sulle stesse selezioni.
+    """
+    parametri = {'inizio': _data_iso(start_date), 'fine': _data_iso(end_date)}
+    filtri = _filtro_in('"Nome Appartamento"', 'app', appartamenti, parametri)
+    filtri += _filtro_in('zona', 'zona', zone, parametri)
+    # Come nelle dashboard con il motore pandas, le notti disponibili sono filtrate solo per
+    # appartamento: con un filtro di zona restano quelle di tutti gli appartamenti selezionati
+    filtri_disponibilita = _filtro_in('appartamento', 'app', appartamenti, parametri)
+
+    query = QUERY_KPIS.format(filtri=filtri, filtri_disponibilita=filtri_disponibilita)
+    conn.create_function('dividi', 2, _dividi, deterministic=True)
+    cursore = conn.execute(query, parametri)
+    nomi = [descrizione[0] for descrizione in cursore.description]
+    valori = cursore.fetchone()
+
+    # SQLite restituisce NULL per i NaN (0 / 0 o valori mancanti): diventano NaN come in pandas
+    return KPI(**{nome: float('nan') if valore is None else valore for nome, valore in zip(nomi, valori)})
+
+
+def calculate_available_nigths_sql(conn, start_date, end_date, appartamenti=None):
+    """
+    Calcola le notti disponibili per appartamento come calculate_available_nigths.
+
+    Ritorna:
+        DataFrame con le colonne 'Appartamento' e 'Notti Disponibili'.
+    """
+    parametri = {'inizio': _data_iso(start_date), 'fine': _data_iso(end_date)}
+    filtri = _filtro_in('appartamento', 'app', appartamenti, parametri)
+    return pd.read_sql_query(QUERY_NOTTI_DISPONIBILI.format(filtri=filtri), conn, params=parametri)
+
+
+def eleboratore_spese_sql(conn, start_date=None, end_date=None):
+    """
+    Calcola i totali delle spese per settore e complessivi come eleboratore_spese.
+
+    Parametri:
+        conn (sqlite3.Connection): database popolato da salva_workbook_su_db.
+        start_date, end_date: intervallo sulla data della spesa (None = nessun filtro).
+
+    Ritorna:
+        - spese: righe di spesa del periodo
+        - totali: DataFrame per settore con 'Totale Spese', 'Totale IVA' e 'totale_netto'
+        - totali_df: DataFrame con 'Totale_Spese_netto', 'Totale_Spese_lordo' e 'Totale_IVA'
+    """
+    parametri = {'codice_iva': CODICE_IVA}
+    filtri = ''
+    if start_date is not None and end_date is not None:
+        parametri.update({'inizio': _data_iso(start_date), 'fine': _data_iso(end_date)})
+        filtri = 'AND data BETWEEN :inizio AND :fine'
+
+    spese = pd.read_sql_query(QUERY_SPESE_PERIODO.format(filtri=filtri), conn, params=parametri)
+    spese['data'] = pd.to_datetime(spese['data'], errors='coerce')
+    totali = pd.read_sql_query(QUERY_SPESE_SETTORE.format(filtri=filtri), conn, params=parametri)
+
+    totali_df = pd.DataFrame({
+        'Totale_Spese_netto': [totali['totale_netto'].sum()],
+        'Totale_Spese_lordo': [totali['Totale Spese'].sum()],
+        'Totale_IVA': [totali['Totale IVA'].sum()]
+    })
+
+    return spese, totali, totali_df
+
+
+def _dividi(dividendo, divisore):
+    """
+    Divisione con i risultati di NumPy per il divisore zero: ±inf (segno del dividendo e dello
+    zero) o NaN per 0 / 0, che SQLite restituisce come NULL.
+    """
+    if dividendo is None or divisore is None:
+        return None
+    if divisore == 0:
+        if dividendo == 0:
+            return None
+        return math.copysign(math.inf, dividendo) * math.copysign(1.0, divisore)
+    return dividendo / divisore
+
+
+def _data_iso(data):
+    """
+    Converte una data nel formato testo 'YYYY-MM-DD' usato nel database.
+    """
+    return pd.Timestamp(data).strftime('%Y-%m-%d')
+
+
+def _filtro_in(colonna, prefisso, valori, parametri):
+    """
+    Restituisce la condizione "AND colonna IN (...)" con parametri nominati, o '' se valori è vuoto.
+    """
+    if not valori:
+        return ''
+    nomi = []
+    for i, valore in enumerate(valori):
+        nomi.append(f':{prefisso}{i}')
+        parametri[f'{prefisso}{i}'] = valore
+    return f"AND {colonna} IN ({', '.join(nomi)})"
@@ -0,0 +1,206 @@
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Cartella dei database SQLite, uno per workbook (modificabile da variabile d'ambiente)
+DB_DIR = Path(os.environ.get("PROPERTIZE_DB_DIR", ".database_sql"))
+# Database tenuti nella cartella: oltre, vengono eliminati quelli usati meno di recente
+DB_MAX_FILE = int(os.environ.get("PROPERTIZE_DB_MAX_FILE", "8"))
+
+# Colonne data salvate come testo ISO 'YYYY-MM-DD', confrontabili direttamente nelle query
+COLONNE_DATA = {
+    'prenotazioni': ['Data Check-In', 'Data Check-Out'],
+    'spese': ['data'],
+}
+
+# Indici sulle colonne filtrate dalle query di sql_queries: appartamento o zona con la data
+# di check-in (filtri della dashboard), appartamento della disponibilità e data delle spese
+INDICI = [
+    'CREATE INDEX IF NOT EXISTS idx_prenotazioni_check_in ON prenotazioni("Data Check-In")',
+    'CREATE INDEX IF NOT EXISTS idx_prenotazioni_appartamento_check_in '
+    'ON prenotazioni("Nome Appartamento", "Data Check-In")',
+    'CREATE INDEX IF NOT EXISTS idx_prenotazioni_zona_check_in ON prenotazioni(zona, "Data Check-In")',
+    'CREATE INDEX IF NOT EXISTS idx_disponibilita_appartamento ON disponibilita(appartamento)',
+    'CREATE INDEX IF NOT EXISTS idx_spese_data ON spese(data)',
+]
+
+# Indici sulle chiavi dell'aggiornamento incrementale (solo se il workbook ha le impronte)
+INDICI_CHIAVI = [
+    'CREATE INDEX IF NOT EXISTS idx_prenotazioni_chiave ON prenotazioni(chiave)',
+    'CREATE INDEX IF NOT EXISTS idx_spese_chiave ON spese(chiave)',
+]
+
+
+def apri_database(percorso, sola_lettura=False):
+    """
+    Apre (o crea) un database SQLite usato come backend dei KPI.
+
+    Con sola_lettura il file deve esistere e non può essere modificato dalla connessione.
+    """
+    # Streamlit può eseguire i rerun della stessa sessione su thread diversi
+    if sola_lettura:
+        return sqlite3.connect(f"{Path(percorso).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(percorso, check_same_thread=False)
+
+
+def database_workbook(workbook, precedente=None, delta=None, cartella=DB_DIR, max_file=DB_MAX_FILE):
+    """
+    Apre in sola lettura il database del workbook, creandolo se non esiste.
+
+    Ogni workbook ha il proprio file, chiamato con l'impronta del contenuto (DatiWorkbook.impronta):
+    sessioni con file diversi non condividono tabelle, sessioni con lo stesso file condividono
+    un database identico. Il file viene scritto in un file temporaneo e poi rinominato, così chi
+    lo legge non vede mai tabelle a metà. Con un aggiornamento incrementale (precedente e delta)
+    il nuovo database parte da una copia di quello del workbook precedente e riceve solo le
+    differenze (vedi aggiorna_workbook_su_db); il database precedente resta invariato.
+
+    Parametri:
+        workbook (DatiWorkbook): workbook da interrogare.
+        precedente (DatiWorkbook): workbook da cui è stato calcolato `delta` (None = nessuno).
+        delta (Delta): differenze di carica_workbook_incrementale rispetto a `precedente`.
+        cartella (Path): cartella dei database.
+        max_file (int): numero massimo di database tenuti nella cartella.
+
+    Ritorna:
+        sqlite3.Connection in sola lettura.
+    """
+    cartella = Path(cartella)
+    percorso = cartella / f"{workbook.impronta}.sqlite"
+    if not percorso.exists():
+        cartella.mkdir(parents=True, exist_ok=True)
+        temporaneo = percorso.with_name(f"{percorso.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        origine = cartella / f"{precedente.impronta}.sqlite" if precedente is not None else None
+        try:
+            if delta is not None and origine is not None and origine.exists():
+                shutil.copyfile(origine, temporaneo)
+                conn = apri_database(temporaneo)
+                aggiorna_workbook_su_db(workbook, delta, conn)
+            else:
+                conn = apri_database(temporaneo)
+                salva_workbook_su_db(workbook, conn)
+            conn.close()
+            os.replace(temporaneo, percorso)
+        finally:
+            if temporaneo.exists():
+                temporaneo.unlink()
+        _elimina_database_meno_recenti(cartella, max_file, da_tenere=percorso)
+    else:
+        # Aggiorna la data di ultimo utilizzo per l'eliminazione dei database meno recenti
+        os.utime(percorso)
+    return apri_database(percorso, sola_lettura=True)
+
+
+def salva_workbook_su_db(workbook, conn):
+    """
+    Carica i quattro fogli del workbook nel database, sostituendo i dati precedenti.
+
+    Crea le tabelle prenotazioni, disponibilita (formato lungo appartamento/inizio/fine),
+    posizioni e spese, con gli indici INDICI sulle colonne filtrate dalle query.
+
+    Parametri:
+        workbook (DatiWorkbook): fogli già elaborati da carica_workbook.
+        conn (sqlite3.Connection): connessione aperta con apri_database.
+    """
+    tabelle = {
+        'prenotazioni': workbook.prenotazioni,
+        'disponibilita': intervalli_disponibilita(workbook),
+        'posizioni': workbook.posizioni,
+        'spese': workbook.spese,
+    }
+    indici = list(INDICI)
+    if workbook.impronte is not None:
+        # Chiavi delle righe, usate da aggiorna_workbook_su_db per sostituire solo le righe cambiate
+        tabelle['prenotazioni'] = _con_chiavi(workbook.prenotazioni, workbook.impronte.chiavi_prenotazioni)
+        tabelle['spese'] = _con_chiavi(workbook.spese, workbook.impronte.chiavi_spese)
+        indici += INDICI_CHIAVI
+
+    with conn:
+        for nome, frame in tabelle.items():
+            frame = _date_iso(frame, COLONNE_DATA.get(nome, []))
+            frame.to_sql(nome, conn, if_exists='replace', index=False)
+        for indice in indici:
+            conn.execute(indice)
+    conn.execute('ANALYZE')
+
+
+def aggiorna_workbook_su_db(workbook, delta, conn):
+    """
+    Applica al database le differenze di un aggiornamento incrementale (vedi incremental_ingestion).
+
+    Elimina le prenotazioni e le spese rimosse o modificate e inserisce solo quelle nuove;
+    la disponibilità viene sostituita per intero. Se le prenotazioni sono state rielaborate
+    tutte (delta.completo) o il database non ha le chiavi, il workbook viene salvato da capo.
+
+    Parametri:
+        workbook (DatiWorkbook): workbook aggiornato da carica_workbook_incrementale.
+        delta (Delta): differenze rispetto al workbook salvato in precedenza.
+        conn (sqlite3.Connection): connessione aperta con apri_database.
+    """
+    colonne = {riga[1] for riga in conn.execute('PRAGMA table_info(prenotazioni)')}
+    if delta.completo or 'chiave' not in colonne:
+        salva_workbook_su_db(workbook, conn)
+        return
+
+    impronte = workbook.impronte
+    righe = {
+        'prenotazioni': (delta.prenotazioni_rimosse, delta.prenotazioni_nuove,
+                         workbook.prenotazioni, impronte.chiavi_prenotazioni),
+        'spese': (delta.spese_rimosse, delta.spese_nuove, workbook.spese, impronte.chiavi_spese),
+    }
+    with conn:
+        for nome, (rimosse, nuove, frame, chiavi) in righe.items():
+            conn.executemany(f'DELETE FROM {nome} WHERE chiave = ?',
+                             [(int(chiave),) for chiave in rimosse.astype('uint64').view('int64')])
+            nuove_righe = _con_chiavi(frame, chiavi)[np.isin(chiavi, nuove)]
+            _date_iso(nuove_righe, COLONNE_DATA[nome]).to_sql(nome, conn, if_exists='append', index=False)
+        intervalli_disponibilita(workbook).to_sql('disponibilita', conn, if_exists='replace', index=False)
+        # Ricrea l'indice della tabella disponibilita appena sostituita
+        for indice in INDICI:
+            conn.execute(indice)
+
+
+def _elimina_database_meno_recenti(cartella, max_file, da_tenere=None):
+    """
+    Elimina i database usati meno di recente oltre max_file. Le connessioni già aperte su un
+    file eliminato continuano a leggerlo; su Windows i file aperti restano fino al prossimo giro.
+    """
+    database = sorted(cartella.glob('*.sqlite'), key=lambda percorso: percorso.stat().st_mtime, reverse=True)
+    for percorso in database[max_file:]:
+        if percorso != da_tenere:
+            try:
+                percorso.unlink()
+            except OSError:
+                pass
+
+
+def intervalli_disponibilita(workbook):
+    """
+    Tabella lunga della disponibilità (appartamento, data_inizio, data_fine) con le date in testo ISO.
+    """
+    return _date_iso(workbook.intervalli.tabella, ['data_inizio', 'data_fine'])
+
+
+def _con_chiavi(frame, chiavi):
+    """
+    Aggiunge al DataFrame la colonna chiave (impronte uint64 salvate come interi con segno di SQLite).
+    """
+    return frame.assign(chiave=np.asarray(chiavi, dtype='uint64').view('int64'))
+
+
+def _date_iso(frame, colonne):
+    """
+    Converte le colonne data in testo 'YYYY-MM-DD' (NULL per le date mancanti).
+    """
+    frame = frame.copy()
+    for col in colonne:
+        date = pd.to_datetime(frame[col], errors='coerce')
+        frame[col] = date.dt.strftime('%Y-%m-%d').where(date.notna(), None)
+    # Le colonne testo con tipi misti (es. coordinate) vengono salvate come stringa
+    for col in frame.columns[frame.dtypes == object]:
+        frame[col] = frame[col].map(lambda v: v if v is None or isinstance(v, (str, int, float)) else str(v))
+    return frame
@@ -0,0 +1,120 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# I moduli dell'applicazione sono nella cartella principale del repository
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from workbook_loader import carica_workbook  # noqa: E402
+
+APPARTAMENTI = 20
+ZONE = 5
+PRENOTAZIONI = 1500
+SPESE = 250
+SETTORI = ['PULIZIE', 'MANUTENZIONI', 'UTENZE', 'SCORTE']
+
+
+def _euro(valore):
+    """
+    Importo nel formato italiano dell'export ('1234,56'), vuoto se mancante.
+    """
+    return '' if valore is None else f"{valore:.2f}".replace('.', ',')
+
+
+def _data(giorno):
+    return '' if giorno is None else pd.Timestamp(giorno).strftime('%d/%m/%Y')
+
+
+def _scrivi(percorso, righe):
+    percorso.write_text('\n'.join(';'.join(map(str, riga)) for riga in righe), encoding='utf-8')
+
+
+def scrivi_export_csv(cartella, seme=0):
+    """
+    Scrive un export CSV sintetico (i quattro fogli) con le colonne nelle posizioni del workbook.
+
+    Contiene soggiorni a cavallo di mese, soggiorni senza notti, spese con nessuna, una o più
+    righe IVA, spese comuni (senza immobile) e righe IVA prima della prima spesa.
+    """
+    rng = np.random.default_rng(seme)
+    nomi = [f"Apt {i}" for i in range(APPARTAMENTI)]
+
+    # Foglio 1: prenotazioni (38 colonne, B..AL)
+    prenotazioni = [[f"H{i}" for i in range(1, 39)]]
+    inizio = pd.Timestamp('2023-01-01')
+    for _ in range(PRENOTAZIONI):
+        appartamento = int(rng.integers(APPARTAMENTI))
+        check_in = inizio + pd.Timedelta(days=int(rng.integers(0, 700)))
+        durata = int(rng.choice([0, 1, 2, 3, 5, 7, 10, 14]))
+        riga = [''] * 38
+        riga[1], riga[2], riga[3] = f"ID{appartamento:03d}", nomi[appartamento], f"Owner {appartamento % 4}"
+        riga[6], riga[7] = _data(check_in), _data(check_in + pd.Timedelta(days=durata))
+        riga[8], riga[9] = _euro(rng.uniform(50, 2000)), _euro(rng.uniform(0, 120))
+        riga[14] = _euro(rng.uniform(0, 20))
+        riga[15], riga[16] = rng.choice(['Booking', 'Airbnb', 'Diretto']), 'Lorda'
+        riga[17] = _euro(rng.uniform(0, 300))
+        riga[20], riga[21], riga[22], riga[23] = (_euro(rng.uniform(0, 150)) for _ in range(4))
+        riga[26], riga[27], riga[28] = (_euro(rng.uniform(0, 80)) for _ in range(3))
+        riga[35], riga[36], riga[37] = (_euro(rng.uniform(0, 400)) for _ in range(3))
+        prenotazioni.append(riga)
+
+    # Foglio 2: periodi di disponibilità
+    disponibilita = [['Appartamento', 'Inizio 1', 'Fine 1', 'Inizio 2', 'Fine 2']]
+    for nome in nomi:
+        disponibilita.append([nome, '01/01/2023', '31/12/2023', '01/02/2024', '31/12/2024'])
+
+    # Foglio 3: posizioni e costi per soggiorno
+    posizioni = [['Nome', 'ID', 'Zona', 'CoordZona', 'Indirizzo', 'CoordInd', 'Pulizie', 'Scorte', 'Manut']]
+    for i, nome in enumerate(nomi):
+        posizioni.append([nome, f"ID{i:03d}", f"Zona {i % ZONE}", '(45.0, 9.0)', f"Via {i}", '(45.0, 9.0)',
+                          30 + i % 7, 5, 10])
+
+    # Foglio 4: spese seguite dalle proprie righe IVA (11 colonne, B..K)
+    spese = [[f"S{i}" for i in range(1, 12)], ['', '59.01.01', '', 'IVA', '3,00', '', '', '', '', '', '']]
+    for i in range(SPESE):
+        importo = rng.uniform(10, 800)
+        giorno = inizio + pd.Timedelta(days=int(rng.integers(0, 700)))
+        immobile = '' if rng.random() < 0.3 else nomi[int(rng.integers(APPARTAMENTI))]
+        spese.append(['', '60.01.01', '', f"Spesa {i}", _euro(importo), _euro(importo), '', '',
+                      _data(giorno), rng.choice(SETTORI), immobile])
+        for _ in range(int(rng.choice([0, 1, 1, 2]))):
+            spese.append(['', '59.01.01', '', 'IVA', _euro(importo * 0.1), '', '', '', '', '', ''])
+
+    file = {
+        'prenotazioni': prenotazioni,
+        'disponibilita': disponibilita,
+        'posizioni': posizioni,
+        'spese': spese,
+    }
+    for nome, righe in file.items():
+        _scrivi(cartella / f"{nome}.csv", righe)
+    return [cartella / f"{nome}.csv" for nome in file]
+
+
+@pytest.fixture(scope='session')
+def export_csv(tmp_path_factory):
+    """
+    Percorsi dei quattro CSV dell'export sintetico, scritti una volta per tutti i test.
+    """
+    return scrivi_export_csv(tmp_path_factory.mktemp('export'))
+
+
+@pytest.fixture(scope='session')
+def workbook(export_csv):
+    """
+    DatiWorkbook dell'export sintetico, caricato una volta per tutti i test.
+    """
+    return carica_workbook(export_csv, formato='csv')
+
+
+@pytest.fixture(scope='session')
+def crea_workbook(tmp_path_factory):
+    """
+    Funzione che scrive e carica un altro export sintetico, generato con il seme indicato.
+    """
+    def crea(seme):
+        return carica_workbook(scrivi_export_csv(tmp_path_factory.mktemp(f'export-{seme}'), seme), formato='csv')
+    return crea
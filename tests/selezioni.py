@@ -0,0 +1,40 @@
+"""
+Selezioni e filtri della dashboard usati dai test di confronto tra i motori dei KPI.
+"""
+import numpy as np
+import pandas as pd
+
+from calculate_available_nights import calculate_available_nigths
+
+
+def selezioni_casuali(workbook, quante, seme=1):
+    """
+    Selezioni casuali come quelle della dashboard: intervallo di check-in, appartamenti e zone.
+    """
+    rng = np.random.default_rng(seme)
+    prenotazioni = workbook.prenotazioni
+    appartamenti = prenotazioni['Nome Appartamento'].astype(str).unique()
+    zone = prenotazioni['zona'].dropna().astype(str).unique()
+    primo, ultimo = prenotazioni['Data Check-In'].min(), prenotazioni['Data Check-In'].max()
+    giorni = (ultimo - primo).days
+
+    for _ in range(quante):
+        a, b = np.sort(rng.integers(-10, giorni + 10, size=2))
+        immobili = None if rng.random() < 0.5 else list(rng.choice(appartamenti, rng.integers(1, 4), replace=False))
+        scelte_zone = None if rng.random() < 0.6 else list(rng.choice(zone, rng.integers(1, 3), replace=False))
+        yield primo + pd.Timedelta(days=int(a)), primo + pd.Timedelta(days=int(b)), immobili, scelte_zone
+
+
+def filtra_come_dashboard(workbook, start_date, end_date, immobili, zone):
+    """
+    Filtri della dashboard (render_dashboard) applicati alle prenotazioni e alle notti disponibili.
+    """
+    data = workbook.prenotazioni
+    dati = data[(data['Data Check-In'] >= start_date) & (data['Data Check-In'] <= end_date)]
+    notti = calculate_available_nigths(workbook.disponibilita_giornaliera, start_date, end_date)
+    if immobili:
+        dati = dati[dati['Nome Appartamento'].isin(immobili)]
+        notti = notti[notti['Appartamento'].isin(immobili)]
+    if zone:
+        dati = dati[dati['zona'].isin(zone)]
+    return dati, notti
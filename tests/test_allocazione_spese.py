@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocazione_spese import COLONNE_CONTO_ECONOMICO, conto_economico_immobili
+from kpis import calculate_kpis, elabora_spese_ricavi, eleboratore_spese
+from selezioni import filtra_come_dashboard
+
+START_DATE, END_DATE = pd.Timestamp('2023-03-01'), pd.Timestamp('2024-02-29')
+AMMORTAMENTI = 12000
+
+
+def _periodo(workbook):
+    dati, notti = filtra_come_dashboard(workbook, START_DATE, END_DATE, None, None)
+    spese = workbook.spese_nette
+    return dati, notti, spese[spese['data'].between(START_DATE, END_DATE)]
+
+
+def _ripartizione_spesa_per_spesa(dati, spese, driver):
+    """
+    Riferimento: ogni spesa va al suo immobile o, se comune, agli immobili con prenotazioni
+    in proporzione al driver (notti occupate dalle date o quote uguali).
+    """
+    prenotazioni = dati.assign(**{'Nome Appartamento': dati['Nome Appartamento'].astype(str)})
+    if driver == 'notti':
+        notti = (prenotazioni['Data Check-Out'] - prenotazioni['Data Check-In']).dt.days.clip(lower=0)
+        pesi = notti.groupby(prenotazioni['Nome Appartamento']).sum().astype('float64')
+    else:
+        pesi = pd.Series(1.0, index=prenotazioni['Nome Appartamento'].unique())
+    pesi = pesi / pesi.sum()
+
+    attribuite = {}
+    for immobile, netto in zip(spese['Immobile associato alla spesa'].astype(object), spese['netto']):
+        if pd.isna(immobile):
+            for nome, peso in pesi.items():
+                attribuite[nome] = attribuite.get(nome, 0.0) + peso * netto
+        else:
+            attribuite[immobile] = attribuite.get(immobile, 0.0) + netto
+    return pd.Series(attribuite), pesi
+
+
+@pytest.mark.parametrize('driver', ['notti', 'quote_uguali'])
+def test_spese_attribuite_coincidono_con_la_ripartizione_spesa_per_spesa(workbook, driver):
+    dati, notti, spese = _periodo(workbook)
+
+    per_immobile, _, per_settore = conto_economico_immobili(dati, notti, spese, driver, AMMORTAMENTI)
+
+    attese, pesi = _ripartizione_spesa_per_spesa(dati, spese, driver)
+    per_immobile = per_immobile.set_index('Nome Appartamento')
+    assert per_immobile['costi_fissi'].to_dict() == pytest.approx(attese.to_dict())
+    assert per_settore.set_index('Nome Appartamento').sum(axis=1).to_dict() == pytest.approx(attese.to_dict())
+    assert per_immobile['ammortamenti'].to_dict() == pytest.approx(
+        (pesi * AMMORTAMENTI).reindex(per_immobile.index, fill_value=0).to_dict())
+
+
+@pytest.mark.parametrize('driver', ['notti', 'ricavi', 'quote_uguali'])
+def test_totali_coincidono_con_elabora_spese_ricavi(workbook, driver):
+    dati, notti, spese = _periodo(workbook)
+    _, totali_settore, totali = eleboratore_spese(spese)
+    atteso = elabora_spese_ricavi(spese, totali, totali_settore, calculate_kpis(dati, notti), AMMORTAMENTI)
+
+    per_immobile, per_proprietario, _ = conto_economico_immobili(dati, notti, spese, driver, AMMORTAMENTI)
+
+    for col in ['ricavi_totali', 'costi_variabili', 'costi_fissi', 'costi_totali', 'EBITDA', 'ammortamenti', 'MOL']:
+        assert per_immobile[col].sum() == pytest.approx(atteso[col].iloc[0]), col
+    np.testing.assert_allclose(per_proprietario[COLONNE_CONTO_ECONOMICO].sum(), per_immobile[COLONNE_CONTO_ECONOMICO].sum())
+
+
+def test_driver_non_valido(workbook):
+    dati, notti, spese = _periodo(workbook)
+    with pytest.raises(ValueError):
+        conto_economico_immobili(dati, notti, spese, 'metri_quadri')
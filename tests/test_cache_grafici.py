@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from cache_grafici import impronta, impronta_selezione, memorizza_grafico
+from notti_prenotazioni import costruisci_notti
+
+
+def _tabella():
+    return pd.DataFrame({
+        'Periodo': pd.date_range('2024-01-01', periods=4, freq='MS'),
+        'Appartamento': pd.Categorical(['A', 'B', 'A', 'C']),
+        'Note': ['x', 'y', 'z', 'w'],
+        'Ricavi': [10.0, 20.0, 30.0, 40.0],
+    })
+
+
+@pytest.mark.parametrize('modifica', [
+    lambda df: df.assign(Periodo=df['Periodo'] + pd.Timedelta(days=1)),
+    lambda df: df.assign(Appartamento=pd.Categorical(['A', 'B', 'C', 'C'])),
+    lambda df: df.assign(Note=['x', 'y', 'z', 'v']),
+    # Stesse somme per colonna, righe scambiate
+    lambda df: df.assign(Ricavi=[20.0, 10.0, 30.0, 40.0]),
+    lambda df: df.iloc[::-1].reset_index(drop=True),
+])
+def test_impronta_dataframe_vede_ogni_colonna_e_l_ordine(modifica):
+    assert impronta(modifica(_tabella())) != impronta(_tabella())
+
+
+def test_impronta_dataframe_stabile_a_parita_di_contenuto():
+    assert impronta(_tabella()) == impronta(_tabella().copy())
+    assert impronta(_tabella()['Ricavi']) == impronta(_tabella()['Ricavi'].copy())
+
+
+def test_impronta_oggetti_del_workbook_per_contenuto(workbook, crea_workbook):
+    notti = workbook.notti
+    # Stesso contenuto in un nuovo oggetto: stessa chiave; contenuto diverso: chiave diversa
+    assert impronta(costruisci_notti(workbook.prenotazioni)) == impronta(notti)
+    assert impronta(costruisci_notti(workbook.prenotazioni.iloc[1:])) != impronta(notti)
+
+    altro = crea_workbook(seme=1)
+    assert impronta(altro.notti) != impronta(notti)
+    assert impronta(altro.disponibilita_giornaliera) == impronta(workbook.disponibilita_giornaliera)
+
+
+def test_impronta_rifiuta_oggetti_senza_contenuto_confrontabile():
+    with pytest.raises(TypeError):
+        impronta(object())
+    assert impronta(np.arange(3)) == impronta(np.arange(3))
+
+
+def test_impronta_array_esatta():
+    # Stessa somma e stessi elementi campionati: l'impronta vede ogni byte
+    valori = np.zeros(2_000_000)
+    scambiati = valori.copy()
+    scambiati[[1, 2]] = [1.0, -1.0]
+    assert impronta(scambiati) != impronta(valori)
+    assert impronta(valori) == impronta(valori.copy())
+
+
+def test_impronta_selezione_per_righe(workbook):
+    prenotazioni = workbook.prenotazioni
+    assert impronta_selezione(prenotazioni.iloc[10:50]) == impronta_selezione(prenotazioni.iloc[10:50].copy())
+    assert impronta_selezione(prenotazioni.iloc[10:50]) != impronta_selezione(prenotazioni.iloc[10:51])
+    assert impronta_selezione(prenotazioni.iloc[[1, 3, 5]]) != impronta_selezione(prenotazioni.iloc[[1, 3, 6]])
+    assert impronta_selezione(prenotazioni.iloc[[1, 3, 5]]) == impronta_selezione(prenotazioni.iloc[[1, 3, 5]])
+
+
+def test_figura_restituita_in_copia():
+    chiamate = []
+
+    @memorizza_grafico
+    def grafico(valori, titolo="Ricavi"):
+        chiamate.append(titolo)
+        return go.Figure(go.Bar(y=valori), layout_title_text=titolo)
+
+    figura = grafico([1, 2, 3])
+    figura.update_layout(title_text="Modificato")
+    # Argomenti di default espliciti: stessa chiave, nessuna nuova costruzione
+    ripetuta = grafico([1, 2, 3], titolo="Ricavi")
+    assert chiamate == ["Ricavi"]
+    assert ripetuta is not figura
+    assert ripetuta.layout.title.text == "Ricavi"
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from campionamento import SOGLIA_WEBGL, campiona_serie, lttb, punti_per_larghezza
+from draw_charts import _linee_andamento
+
+
+def test_lttb_tiene_estremi_e_picchi():
+    x = np.arange(10_000, dtype='float64')
+    y = np.sin(x / 500)
+    y[4321] = 50.0
+
+    indici = lttb(x, y, 300)
+
+    assert len(indici) == 300
+    assert indici[0] == 0 and indici[-1] == len(x) - 1
+    assert np.all(np.diff(indici) > 0)
+    assert 4321 in indici
+
+
+def test_lttb_serie_corta_intera():
+    np.testing.assert_array_equal(lttb(np.arange(5), np.arange(5), 10), np.arange(5))
+
+
+def test_campiona_serie_con_date_e_valori_mancanti():
+    giorni = pd.date_range('2020-01-01', periods=3000, freq='D')
+    valori = np.random.default_rng(0).normal(size=3000)
+    valori[::7] = np.nan
+
+    ascisse, campione = campiona_serie(pd.Series(giorni), valori, 200)
+
+    assert len(ascisse) == len(campione) == 200
+    assert np.isfinite(campione).all()
+    assert np.issubdtype(ascisse.dtype, np.datetime64)
+    assert (np.diff(ascisse.astype('int64')) > 0).all()
+
+
+def _serie(giorni, colonne=3):
+    x = pd.Series(pd.date_range('2020-01-01', periods=giorni, freq='D'))
+    rng = np.random.default_rng(1)
+    return x, pd.DataFrame({f"serie {i}": rng.normal(size=giorni).cumsum() for i in range(colonne)})
+
+
+def test_linee_andamento_passa_a_webgl_sui_punti_dei_dati():
+    larghezza = 800
+    # Molti più punti della soglia, ma dopo LTTB le tre serie restano sotto SOGLIA_WEBGL
+    x, serie = _serie(SOGLIA_WEBGL)
+    assert 3 * punti_per_larghezza(larghezza) <= SOGLIA_WEBGL
+
+    tracce = _linee_andamento(x, serie, larghezza)
+
+    assert all(isinstance(traccia, go.Scattergl) for traccia in tracce)
+    assert all(len(traccia.x) <= punti_per_larghezza(larghezza) for traccia in tracce)
+
+
+def test_linee_andamento_spline_per_pochi_punti():
+    x, serie = _serie(60)
+
+    tracce = _linee_andamento(x, serie, 800)
+
+    assert all(isinstance(traccia, go.Scatter) for traccia in tracce)
+    assert all(traccia.line.shape == 'spline' and len(traccia.x) == 60 for traccia in tracce)
@@ -0,0 +1,88 @@
+from dataclasses import asdict
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pytest
+
+from centesimi import (
+    calculate_kpis_centesimi,
+    costruisci_centesimi,
+    dividi_arrotondando,
+    in_centesimi,
+    scorpora_iva,
+    totali_proprietari_centesimi,
+)
+from kpis import calculate_kpis
+from selezioni import filtra_come_dashboard, selezioni_casuali
+
+# KPI calcolati in centesimi; gli altri (notti, conteggi, medie) restano quelli di calculate_kpis
+IMPORTI_ESATTI = [
+    'totale_ricavi_locazione', 'totale_ricavi_pulizie', 'ricavi_totali', 'commissioni_ota', 'commissioni_itw',
+    'commissioni_proprietari', 'totale_commissioni', 'marginalità_locazioni', 'marginalità_pulizie',
+    'marginalità_totale', 'IVA_Totale_credito', 'IVA_Totale_Debito', 'Saldo_IVA', 'costo_pulizie_ps_totali',
+    'costo_scorte_ps_totali', 'costo_manutenzioni_ps_totali', 'altri_costi', 'marginalità_immobile',
+]
+
+
+def _arrotonda_commerciale(numeratore, denominatore):
+    return int((Decimal(numeratore) / Decimal(denominatore)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def test_dividi_arrotondando_coincide_con_decimal_round_half_up():
+    rng = np.random.default_rng(0)
+    numeratori = np.concatenate([rng.integers(-10**9, 10**9, 5000), np.arange(-50, 51) * 61])
+    denominatori = rng.choice([2, 100, 122, 7, 1_000_003], len(numeratori))
+
+    attesi = [_arrotonda_commerciale(n, d) for n, d in zip(numeratori.tolist(), denominatori.tolist())]
+
+    assert [dividi_arrotondando(n, d) for n, d in zip(numeratori.tolist(), denominatori.tolist())] == attesi
+    assert dividi_arrotondando(numeratori, denominatori).tolist() == attesi
+    # Interi Python oltre int64
+    assert dividi_arrotondando(10**30 + 61, 122) == _arrotonda_commerciale(10**30 + 61, 122)
+
+
+def test_scorporo_iva_al_centesimo():
+    lordi = np.arange(-2000, 20000, 7)
+
+    imponibili = scorpora_iva(lordi)
+
+    assert imponibili.tolist() == [_arrotonda_commerciale(lordo * 100, 122) for lordo in lordi.tolist()]
+    assert np.all(np.abs(imponibili * 1.22 - lordi) <= 0.61)
+
+
+def test_in_centesimi_somma_senza_errori_di_arrotondamento():
+    importi = np.full(1000, 0.1)
+
+    assert importi.sum() != 100.0
+    assert in_centesimi(importi).sum() == 10000
+    assert in_centesimi([1.005, 2.675, np.nan, -0.015]).tolist() == [100, 268, 0, -2]
+
+
+def test_kpi_in_centesimi_coincidono_con_calculate_kpis(workbook):
+    centesimi = costruisci_centesimi(workbook.prenotazioni)
+    for selezione in selezioni_casuali(workbook, 40, seme=5):
+        dati, notti = filtra_come_dashboard(workbook, *selezione)
+        atteso = asdict(calculate_kpis(dati, notti))
+        ottenuto = asdict(calculate_kpis_centesimi(centesimi, dati, notti))
+
+        # Gli scorpori IVA sono arrotondati per prenotazione: al più mezzo centesimo per riga e per scorporo
+        tolleranza = 0.02 * len(dati) + 0.01
+        for campo, valore in atteso.items():
+            if campo in IMPORTI_ESATTI and np.isnan(valore):
+                # Senza ricavi la quota OTA sulle locazioni è 0 invece di 0 / 0
+                assert ottenuto[campo] == 0, (campo, selezione)
+            elif campo in IMPORTI_ESATTI:
+                assert ottenuto[campo] == pytest.approx(valore, abs=tolleranza), (campo, selezione)
+                assert ottenuto[campo] * 100 == pytest.approx(round(ottenuto[campo] * 100), abs=1e-6), campo
+            else:
+                assert ottenuto[campo] == pytest.approx(valore, nan_ok=True), (campo, selezione)
+
+
+def test_totali_proprietari_coincidono_con_le_somme_in_euro(workbook):
+    dati = workbook.prenotazioni.iloc[::2]
+
+    estratto = totali_proprietari_centesimi(workbook.centesimi, dati).set_index('Nome Proprietario')
+
+    attesi = dati.groupby('Nome Proprietario', observed=True)['Commissioni Proprietari Lorde'].sum()
+    assert estratto['Commissioni Proprietari Lorde'].to_dict() == pytest.approx((attesi * 100).to_dict(), abs=1e-3 * len(dati))
+    assert estratto['Commissioni Proprietari Lorde'].dtype == 'int64'
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from data_processing import COLONNE_PRENOTAZIONI, preprocess_data
+
+
+def _foglio_prenotazioni():
+    """
+    Due prenotazioni come lette dal Foglio 1 (testo, intestazioni originali del file).
+    """
+    righe = []
+    for appartamento, check_in, check_out in [('ID1', '03/01/2024', '06/01/2024'), ('ID2', '30/01/2024', '02/02/2024')]:
+        riga = ['10,00'] * len(COLONNE_PRENOTAZIONI)
+        riga[:5] = [appartamento, f"Apt {appartamento}", 'Owner', check_in, check_out]
+        riga[8], riga[9] = 'Booking', 'Lorda'
+        righe.append(riga)
+    return pd.DataFrame(righe, columns=[f"Colonna {i}" for i in range(len(COLONNE_PRENOTAZIONI))], dtype=str)
+
+
+def test_preprocess_data_non_modifica_il_dataframe_letto():
+    letto = _foglio_prenotazioni()
+    originale = letto.copy()
+
+    prenotazioni = preprocess_data(letto)
+
+    pd.testing.assert_frame_equal(letto, originale)
+    assert list(prenotazioni.columns[:len(COLONNE_PRENOTAZIONI)]) == COLONNE_PRENOTAZIONI
+    assert prenotazioni['Durata Soggiorno'].tolist() == [3, 3]
@@ -0,0 +1,144 @@
+import shutil
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from incremental_ingestion import carica_workbook_incrementale
+from kpi_cube import DIMENSIONI_CUBO, costruisci_cubo
+from sql_queries import calculate_kpis_sql
+from sql_storage import database_workbook
+from workbook_loader import carica_workbook
+
+# Colonne del Foglio 1 (nei CSV dell'export sintetico) che formano la chiave della prenotazione
+CAMPI_CHIAVE = [1, 6, 7]
+
+
+def _righe(percorso):
+    return percorso.read_text(encoding='utf-8').split('\n')
+
+
+def _uniche(righe, campi):
+    """
+    Posizioni delle righe la cui chiave (campi indicati) compare una sola volta.
+    """
+    chiavi = [tuple(riga.split(';')[i] for i in campi) for riga in righe]
+    conteggi = Counter(chiavi)
+    return [i for i, chiave in enumerate(chiavi) if conteggi[chiave] == 1]
+
+
+def _export_modificato(export_csv, cartella):
+    """
+    Copia l'export sintetico applicando le modifiche di un export mensile:
+
+    - prenotazioni: una rimossa, una con importo modificato, una nuova e una ripetuta (chiave duplicata);
+    - spese: un gruppo rimosso, un gruppo con la riga IVA modificata, un gruppo nuovo e uno ripetuto.
+    """
+    cartella.mkdir()
+    percorsi = [cartella / percorso.name for percorso in export_csv]
+    for origine, destinazione in zip(export_csv, percorsi):
+        shutil.copyfile(origine, destinazione)
+    prenotazioni, spese = percorsi[0], percorsi[3]
+
+    righe = _righe(prenotazioni)
+    uniche = [i for i in _uniche(righe, CAMPI_CHIAVE) if i > 0]
+    rimossa, modificata, ripetuta = uniche[10], uniche[20], uniche[30]
+    campi = righe[modificata].split(';')
+    campi[8] = '9999,99'
+    righe[modificata] = ';'.join(campi)
+    nuova = righe[ripetuta].split(';')
+    nuova[6], nuova[7] = '01/06/2030', '05/06/2030'
+    righe += [righe[ripetuta], ';'.join(nuova)]
+    del righe[rimossa]
+    prenotazioni.write_text('\n'.join(righe), encoding='utf-8')
+
+    righe = _righe(spese)
+    # Gruppi: una spesa (con importo totale) seguita dalle sue righe IVA; identità = codice, data e immobile
+    inizi = [i for i, riga in enumerate(righe) if i > 1 and riga.split(';')[5]]
+    gruppi = [(inizio, fine) for inizio, fine in zip(inizi, inizi[1:] + [len(righe)])]
+    identita = Counter(tuple(righe[inizio].split(';')[i] for i in (1, 8, 10)) for inizio, _ in gruppi)
+    con_iva = [(inizio, fine) for inizio, fine in gruppi
+               if fine - inizio == 2 and identita[tuple(righe[inizio].split(';')[i] for i in (1, 8, 10))] == 1]
+    (inizio_modificato, _), (inizio_ripetuto, fine_ripetuto), (inizio_rimosso, fine_rimosso) = con_iva[3], con_iva[8], con_iva[15]
+
+    iva = righe[inizio_modificato + 1].split(';')
+    iva[4] = '77,70'
+    righe[inizio_modificato + 1] = ';'.join(iva)
+    nuovo = ['', '60.01.01', '', 'Spesa nuova', '120,00', '120,00', '', '', '15/01/2030', 'UTENZE', 'Apt 1']
+    righe += righe[inizio_ripetuto:fine_ripetuto] + [';'.join(nuovo), ';'.join(['', '59.01.01', '', 'IVA', '12,00'] + [''] * 6)]
+    del righe[inizio_rimosso:fine_rimosso]
+    spese.write_text('\n'.join(righe), encoding='utf-8')
+    return percorsi
+
+
+@pytest.fixture(scope='module')
+def aggiornamento(export_csv, tmp_path_factory):
+    """
+    Workbook precedente (con il cubo già calcolato), workbook incrementale, delta e caricamento completo.
+    """
+    precedente, _ = carica_workbook_incrementale(export_csv, formato='csv')
+    precedente.cubo
+    nuovo_export = _export_modificato(export_csv, tmp_path_factory.mktemp('mensile') / 'export')
+    aggiornato, delta = carica_workbook_incrementale(nuovo_export, precedente, formato='csv')
+    return precedente, aggiornato, delta, carica_workbook(nuovo_export, formato='csv')
+
+
+def test_primo_caricamento_coincide_con_carica_workbook(export_csv, workbook):
+    incrementale, delta = carica_workbook_incrementale(export_csv, formato='csv')
+
+    assert delta.completo
+    pd.testing.assert_frame_equal(incrementale.prenotazioni, workbook.prenotazioni)
+    pd.testing.assert_frame_equal(incrementale.spese, workbook.spese)
+
+
+def test_export_invariato_riusa_il_workbook_precedente(export_csv):
+    precedente, _ = carica_workbook_incrementale(export_csv, formato='csv')
+
+    aggiornato, delta = carica_workbook_incrementale(export_csv, precedente, formato='csv')
+
+    assert aggiornato.prenotazioni is precedente.prenotazioni
+    assert delta.riepilogo['Prenotazioni'] == {'inserite': 0, 'modificate': 0, 'rimosse': 0}
+    assert delta.riepilogo['Spese'] == {'inserite': 0, 'modificate': 0, 'rimosse': 0}
+
+
+def test_riepilogo_delle_differenze(aggiornamento):
+    _, _, delta, _ = aggiornamento
+
+    assert not delta.completo
+    assert delta.riepilogo['Prenotazioni'] == {'inserite': 2, 'modificate': 1, 'rimosse': 1}
+    assert delta.riepilogo['Spese'] == {'inserite': 2, 'modificate': 1, 'rimosse': 1}
+
+
+def test_fogli_aggiornati_coincidono_con_un_caricamento_completo(aggiornamento):
+    _, aggiornato, _, completo = aggiornamento
+
+    # Stesse righe nello stesso ordine del foglio
+    pd.testing.assert_frame_equal(aggiornato.prenotazioni, completo.prenotazioni)
+    pd.testing.assert_frame_equal(aggiornato.spese, completo.spese)
+    pd.testing.assert_frame_equal(aggiornato.spese_nette, completo.spese_nette)
+
+
+def test_cubo_aggiornato_coincide_con_il_cubo_ricostruito(aggiornamento):
+    precedente, aggiornato, _, completo = aggiornamento
+    assert 'cubo' in vars(aggiornato)
+
+    ottenuto = aggiornato.cubo.tabella.astype({col: 'object' for col in DIMENSIONI_CUBO[:-1]})
+    atteso = costruisci_cubo(completo.prenotazioni).tabella.astype({col: 'object' for col in DIMENSIONI_CUBO[:-1]})
+    pd.testing.assert_frame_equal(ottenuto, atteso, check_exact=False, rtol=1e-9, atol=1e-6)
+    assert (aggiornato.cubo.tabella['numero_prenotazioni'] > 0).all()
+    assert not aggiornato.cubo.tabella.equals(precedente.cubo.tabella)
+
+
+def test_database_aggiornato_con_le_sole_differenze(aggiornamento, tmp_path):
+    precedente, aggiornato, delta, completo = aggiornamento
+    database_workbook(precedente, cartella=tmp_path)
+
+    incrementale = database_workbook(aggiornato, precedente, delta, cartella=tmp_path)
+    da_capo = database_workbook(completo, cartella=tmp_path / 'completo')
+
+    for start_date, end_date in [('2023-01-01', '2030-12-31'), ('2023-03-01', '2023-08-31')]:
+        assert calculate_kpis_sql(incrementale, start_date, end_date) == pytest.approx(
+            calculate_kpis_sql(da_capo, start_date, end_date))
+    conta = 'SELECT COUNT(*) FROM {}'
+    for tabella in ('prenotazioni', 'spese'):
+        assert incrementale.execute(conta.format(tabella)).fetchone() == da_capo.execute(conta.format(tabella)).fetchone()
@@ -0,0 +1,21 @@
+import pandas as pd
+
+import ingestion_cache
+from ingestion_cache import carica_workbook_con_cache
+
+
+def test_cache_rilegge_lo_stesso_workbook(export_csv, tmp_path):
+    elaborato = carica_workbook_con_cache(export_csv, cache_dir=tmp_path)
+    dalla_cache = carica_workbook_con_cache(export_csv, cache_dir=tmp_path)
+
+    assert elaborato.motore == 'csv' and dalla_cache.motore == 'cache'
+    pd.testing.assert_frame_equal(dalla_cache.prenotazioni, elaborato.prenotazioni)
+    pd.testing.assert_frame_equal(dalla_cache.spese, elaborato.spese)
+
+
+def test_cache_di_un_altra_versione_non_viene_letta(export_csv, tmp_path, monkeypatch):
+    carica_workbook_con_cache(export_csv, cache_dir=tmp_path)
+    monkeypatch.setattr(ingestion_cache, 'VERSIONE_ELABORAZIONE', ingestion_cache.VERSIONE_ELABORAZIONE + 1)
+
+    assert carica_workbook_con_cache(export_csv, cache_dir=tmp_path).motore == 'csv'
+    assert carica_workbook_con_cache(export_csv, cache_dir=tmp_path).motore == 'cache'
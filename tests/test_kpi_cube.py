@@ -0,0 +1,64 @@
+from dataclasses import fields
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indice_date import costruisci_indice, righe_intervallo, somme_intervallo
+from kpi_cube import kpi_da_cubo
+from kpis import COLONNE_BLOCCO, COLONNE_KPI, KPI, calculate_kpis
+from selezioni import filtra_come_dashboard, selezioni_casuali
+
+SELEZIONI = 300
+
+
+def _al_centesimo(dati):
+    """
+    Importi riportati al centesimo dell'export (float32 -> float64 arrotondato), come li somma il cubo.
+    """
+    return dati.assign(**{col: dati[col].astype('float64').round(2) for col in COLONNE_KPI})
+
+
+def test_kpi_da_cubo_coincide_con_calculate_kpis(workbook):
+    campi = [campo.name for campo in fields(KPI)]
+    for start_date, end_date, immobili, zone in selezioni_casuali(workbook, SELEZIONI):
+        dati, notti = filtra_come_dashboard(workbook, start_date, end_date, immobili, zone)
+        atteso = calculate_kpis(_al_centesimo(dati), notti)
+        ottenuto = kpi_da_cubo(workbook.cubo, workbook.indice_date, notti, start_date, end_date, immobili, zone)
+        for campo in campi:
+            assert getattr(ottenuto, campo) == pytest.approx(getattr(atteso, campo), rel=1e-9, abs=1e-6, nan_ok=True), (
+                campo, start_date, end_date, immobili, zone
+            )
+
+
+def test_kpi_da_cubo_su_mesi_interi_e_parziali(workbook):
+    # Intervallo di mesi interi, mesi parziali agli estremi e intervallo dentro un solo mese
+    for start_date, end_date in [('2023-02-01', '2023-11-30'), ('2023-02-14', '2024-03-09'), ('2023-05-03', '2023-05-20')]:
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        dati, notti = filtra_come_dashboard(workbook, start_date, end_date, None, None)
+        atteso = calculate_kpis(dati, notti)
+        ottenuto = kpi_da_cubo(workbook.cubo, workbook.indice_date, notti, start_date, end_date)
+        assert ottenuto.ricavi_totali == pytest.approx(atteso.ricavi_totali)
+        assert ottenuto.notti_occupate == atteso.notti_occupate
+        assert ottenuto.numero_prenotazioni == atteso.numero_prenotazioni
+
+
+def test_somme_cumulate_esatte_al_centesimo(workbook):
+    # Importi grandi alternati a un centesimo: le somme cumulate in float64 perderebbero i centesimi
+    prenotazioni = workbook.prenotazioni.iloc[:400].astype({'Ricavi Locazione': 'float64'})
+    prenotazioni['Ricavi Locazione'] = np.where(np.arange(400) % 2, 0.01, 9_876_543_210.99)
+    indice = costruisci_indice(prenotazioni)
+
+    for start_date, end_date in [('2023-03-01', '2023-09-30'), ('2023-06-10', '2024-01-20')]:
+        dati = prenotazioni[prenotazioni['Data Check-In'].between(start_date, end_date)]
+        centesimi = somme_intervallo(indice, start_date, end_date)[COLONNE_BLOCCO.index('Ricavi Locazione')]
+        attesi = sum(round(valore * 100) for valore in dati['Ricavi Locazione'])
+        assert int(centesimi) == attesi
+
+
+def test_righe_intervallo_coincide_con_il_filtro_delle_date(workbook):
+    prenotazioni = workbook.prenotazioni
+    for start_date, end_date, _, _ in selezioni_casuali(workbook, 50, seme=4):
+        righe = righe_intervallo(workbook.indice_date, start_date, end_date)
+        atteso = prenotazioni[(prenotazioni['Data Check-In'] >= start_date) & (prenotazioni['Data Check-In'] <= end_date)]
+        pd.testing.assert_frame_equal(prenotazioni.iloc[righe], atteso)
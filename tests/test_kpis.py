@@ -0,0 +1,132 @@
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpis import COLONNE_KPI, KPI, calculate_kpis, calculate_kpis_grouped
+from selezioni import filtra_come_dashboard, selezioni_casuali
+
+SELEZIONI = 60
+
+
+def _kpi_originali(data, notti_disponibili_filtrate):
+    """
+    Formule originali di calculate_kpis (somme pandas colonna per colonna), su una copia in float64.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _formule_originali(data, notti_disponibili_filtrate)
+
+
+def _formule_originali(data, notti_disponibili_filtrate):
+    data = data.astype({col: 'float64' for col in COLONNE_KPI})
+    locazione, pulizie, ota = data['Ricavi Locazione'].sum(), data['Ricavi Pulizie'].sum(), data['Commissioni OTA'].sum()
+    proprietari = data['Commissioni Proprietari Lorde'].sum()
+
+    totale_ricavi_locazione = locazione - data['IVA Provvigioni PM'].sum()
+    totale_ricavi_pulizie = pulizie / 1.22
+    commissioni_ota_locazioni = ota / 1.22 * (locazione / (locazione + pulizie))
+    marginalità_locazioni = totale_ricavi_locazione - commissioni_ota_locazioni - proprietari
+    marginalità_pulizie = totale_ricavi_pulizie - (ota / 1.22 - commissioni_ota_locazioni)
+    marginalità_totale = marginalità_locazioni + marginalità_pulizie
+    IVA_Totale_credito = data['IVA Commissioni ITW'].sum() + ota * 0.22
+    IVA_Totale_Debito = data['IVA Provvigioni PM'].sum()
+    altri_costi = data['costo_scorte_ps'].sum() + data['costo_manutenzioni_ps'].sum()
+
+    notti = (data['Data Check-Out'] - data['Data Check-In']).dt.days.apply(lambda x: max(x, 0))
+    numero_prenotazioni = len(data)
+    notti_occupate = notti.sum()
+    notti_disponibili = notti_disponibili_filtrate['Notti Disponibili'].sum()
+    return {
+        'totale_ricavi_locazione': totale_ricavi_locazione,
+        'totale_ricavi_pulizie': totale_ricavi_pulizie,
+        'ricavi_totali': totale_ricavi_locazione + totale_ricavi_pulizie,
+        'commissioni_ota': ota / 1.22,
+        'commissioni_itw': data['Commissioni ITW Nette'].sum(),
+        'commissioni_proprietari': proprietari,
+        'totale_commissioni': ota / 1.22 + data['Commissioni ITW Nette'].sum() + proprietari,
+        'marginalità_locazioni': marginalità_locazioni,
+        'marginalità_pulizie': marginalità_pulizie,
+        'marginalità_totale': marginalità_totale,
+        'IVA_Totale_credito': IVA_Totale_credito,
+        'IVA_Totale_Debito': IVA_Totale_Debito,
+        'Saldo_IVA': IVA_Totale_Debito - IVA_Totale_credito,
+        'valore_medio_prenotazione': totale_ricavi_locazione / numero_prenotazioni,
+        'prezzo_medio_notte': totale_ricavi_locazione / notti_occupate,
+        'soggiorno_medio': notti_occupate / numero_prenotazioni,
+        'margine_medio_prenotazione': marginalità_totale / numero_prenotazioni,
+        'margine_medio_notte': marginalità_locazioni / notti_occupate,
+        'margine_medio_pulizie': marginalità_pulizie / numero_prenotazioni,
+        'prezzo_pulizie': totale_ricavi_pulizie / numero_prenotazioni,
+        'notti_occupate': notti_occupate,
+        'tasso_di_occupazione': notti_occupate / notti_disponibili * 100,
+        'notti_disponibili': notti_disponibili,
+        'notti_libere': notti_disponibili - notti_occupate,
+        'numero_prenotazioni': numero_prenotazioni,
+        'costo_pulizie_ps': data['costo_pulizie_ps'].mean(),
+        'costo_scorte_ps': data['costo_scorte_ps'].mean(),
+        'costo_manutenzioni_ps': data['costo_manutenzioni_ps'].mean(),
+        'costo_pulizie_ps_totali': data['costo_pulizie_ps'].sum(),
+        'costo_scorte_ps_totali': data['costo_scorte_ps'].sum(),
+        'costo_manutenzioni_ps_totali': data['costo_manutenzioni_ps'].sum(),
+        'altri_costi': altri_costi,
+        'marginalità_immobile': marginalità_totale - data['costo_pulizie_ps'].sum() - altri_costi,
+    }
+
+
+def _confronta(ottenuto, atteso, contesto=None):
+    for campo, valore in atteso.items():
+        assert ottenuto[campo] == pytest.approx(valore, rel=1e-9, abs=1e-6, nan_ok=True), (campo, contesto)
+
+
+def test_calculate_kpis_coincide_con_le_formule_originali(workbook):
+    for selezione in selezioni_casuali(workbook, SELEZIONI, seme=3):
+        dati, notti = filtra_come_dashboard(workbook, *selezione)
+        originale = dati.copy()
+
+        kpi = calculate_kpis(dati, notti)
+
+        assert isinstance(kpi, KPI)
+        _confronta(asdict(kpi), _kpi_originali(dati, notti), selezione)
+        # A differenza della versione originale, il DataFrame filtrato non riceve la colonna 'Notti Occupate'
+        pd.testing.assert_frame_equal(dati, originale)
+
+
+def test_calculate_kpis_con_valori_mancanti_e_soggiorni_invertiti(workbook):
+    dati = workbook.prenotazioni.iloc[:200].copy()
+    dati.loc[dati.index[::7], 'costo_pulizie_ps'] = np.nan
+    dati.loc[dati.index[::11], 'Ricavi Pulizie'] = np.nan
+    dati.loc[dati.index[::13], 'Data Check-Out'] = dati['Data Check-In'] - pd.Timedelta(days=2)
+    notti = pd.DataFrame({'Appartamento': ['Apt 0'], 'Notti Disponibili': [365]})
+
+    _confronta(asdict(calculate_kpis(dati, notti)), _kpi_originali(dati, notti))
+
+
+def test_calculate_kpis_senza_prenotazioni(workbook):
+    notti = pd.DataFrame({'Appartamento': ['Apt 0'], 'Notti Disponibili': [0]})
+
+    kpi = calculate_kpis(workbook.prenotazioni.iloc[:0], notti)
+
+    _confronta(asdict(kpi), _kpi_originali(workbook.prenotazioni.iloc[:0], notti))
+    assert kpi.numero_prenotazioni == 0 and np.isnan(kpi.prezzo_medio_notte)
+
+
+@pytest.mark.parametrize('by', ['Nome Appartamento', ['zona', 'Nome Proprietario'], 'OTA'])
+def test_calculate_kpis_grouped_coincide_con_calculate_kpis_per_gruppo(workbook, by):
+    dati, notti = filtra_come_dashboard(workbook, pd.Timestamp('2023-02-10'), pd.Timestamp('2024-06-30'), None, None)
+
+    gruppi = calculate_kpis_grouped(dati, notti, by)
+
+    chiavi = [by] if isinstance(by, str) else by
+    attesi = dati.groupby(chiavi, observed=True, sort=True)
+    assert len(gruppi) == attesi.ngroups
+    for riga, (chiave, gruppo) in zip(gruppi.to_dict('records'), attesi):
+        assert tuple(riga[col] for col in chiavi) == (chiave if isinstance(chiave, tuple) else (chiave,))
+        notti_gruppo = notti[notti['Appartamento'].isin(gruppo['Nome Appartamento'])]
+        atteso = asdict(calculate_kpis(gruppo, notti_gruppo))
+        if by == 'OTA':
+            # Chiavi che non dipendono dall'appartamento: nessuna notte disponibile
+            for campo in ('notti_disponibili', 'notti_libere', 'tasso_di_occupazione'):
+                assert np.isnan(riga.pop(campo))
+                del atteso[campo]
+        _confronta(riga, atteso, chiave)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from locale_parsing import parse_date, parse_numeri
+
+
+def _numeri_originali(valori):
+    """
+    Conversione originale di preprocess_data: virgola sostituita dal punto, poi pd.to_numeric.
+    """
+    return pd.to_numeric(valori.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def _importi_casuali(quanti, seme=0):
+    rng = np.random.default_rng(seme)
+    importi = rng.uniform(-500, 5000, quanti).round(2)
+    testo = pd.Series([f"{importo:.2f}" for importo in importi])
+    # Metà delle celle con la virgola decimale, come nell'export italiano
+    virgola = rng.random(quanti) < 0.5
+    testo[virgola] = testo[virgola].str.replace('.', ',', regex=False)
+    testo[rng.random(quanti) < 0.05] = None
+    return testo
+
+
+def test_parse_numeri_coincide_con_la_conversione_originale():
+    testo = _importi_casuali(5000)
+
+    numeri, non_validi = parse_numeri(testo)
+
+    pd.testing.assert_series_equal(numeri, _numeri_originali(testo).astype('float64'))
+    assert len(non_validi) == 0
+
+
+@pytest.mark.parametrize('testo, atteso', [
+    ('1.234,56', 1234.56),
+    ('€ 12,50', 12.5),
+    ('1.234.567', 1234567.0),
+    ('1234.5', 1234.5),
+    ('-3,10', -3.1),
+])
+def test_parse_numeri_formati_italiani(testo, atteso):
+    numeri, _ = parse_numeri(pd.Series(['1,00', testo]))
+    assert numeri.iloc[1] == pytest.approx(atteso)
+
+
+def test_parse_numeri_segnala_le_celle_non_convertibili():
+    numeri, non_validi = parse_numeri(pd.Series(['1,00', 'abc', None, ' ', '2,50']))
+
+    assert numeri.isna().tolist() == [False, True, True, True, False]
+    assert non_validi.tolist() == [1]
+
+
+def test_parse_date_coincide_con_to_datetime_dayfirst():
+    giorni = pd.Series(pd.date_range('2022-12-25', periods=400, freq='D')).dt.strftime('%d/%m/%Y')
+    giorni = giorni.mask(np.arange(len(giorni)) % 37 == 0)
+
+    date, non_valide = parse_date(giorni)
+
+    pd.testing.assert_series_equal(date, pd.to_datetime(giorni, errors='coerce', dayfirst=True), check_dtype=False)
+    assert len(non_valide) == 0
+
+
+def test_parse_date_mantiene_le_date_e_segnala_il_testo_errato():
+    valori = pd.Series([pd.Timestamp('2024-03-01'), '02/03/2024', '31/02/2024', None], dtype=object)
+
+    date, non_valide = parse_date(valori)
+
+    assert date.tolist()[:2] == [pd.Timestamp('2024-03-01'), pd.Timestamp('2024-03-02')]
+    assert date.iloc[2:].isna().all()
+    assert non_valide.tolist() == [2]
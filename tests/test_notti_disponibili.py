@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculate_available_nights import (
+    calculate_available_nigths,
+    costruisci_disponibilita_giornaliera,
+    costruisci_intervalli,
+    notti_per_periodo,
+)
+
+INTERVALLI = [
+    ('2023-01-01', '2024-12-31'),
+    ('2023-03-15', '2023-04-02'),
+    ('2023-12-20', '2024-02-10'),
+    ('2022-06-01', '2022-06-30'),
+    ('2024-05-10', '2024-05-10'),
+    ('2024-05-10', '2024-05-01'),
+]
+
+
+def _notti_originali(disponibilita, start_date, end_date):
+    """
+    Ciclo originale di calculate_available_nigths (iterrows sulle coppie Data inizio/Data fine).
+    """
+    notti_disponibili = []
+    for _, row in disponibilita.iterrows():
+        totale_notti = 0
+        for i in range(1, len(row), 2):
+            data_inizio = row.iloc[i]
+            data_fine = row.iloc[i + 1] if i + 1 < len(row) else None
+            if pd.notnull(data_inizio) and pd.notnull(data_fine):
+                intervallo_inizio = max(pd.to_datetime(data_inizio), pd.Timestamp(start_date))
+                intervallo_fine = min(pd.to_datetime(data_fine), pd.Timestamp(end_date))
+                totale_notti += max((intervallo_fine - intervallo_inizio).days + 1, 0)
+        notti_disponibili.append({"Appartamento": row.iloc[0], "Notti Disponibili": totale_notti})
+    return pd.DataFrame(notti_disponibili)
+
+
+def _foglio_disponibilita(righe=60, coppie=4, seme=0):
+    """
+    Foglio 2 casuale: periodi mancanti, invertiti o sovrapposti e ultima coppia senza data di fine.
+    """
+    rng = np.random.default_rng(seme)
+    foglio = {'Appartamento': [f"Apt {i}" for i in range(righe)]}
+    for coppia in range(coppie):
+        inizio = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 600, righe), unit='D')
+        fine = inizio + pd.to_timedelta(rng.integers(-20, 200, righe), unit='D')
+        foglio[f"Inizio {coppia}"] = pd.Series(inizio).mask(rng.random(righe) < 0.15)
+        foglio[f"Fine {coppia}"] = pd.Series(fine).mask(rng.random(righe) < 0.15)
+    foglio['Inizio extra'] = pd.Timestamp('2023-06-01')
+    return pd.DataFrame(foglio)
+
+
+@pytest.mark.parametrize('start_date, end_date', INTERVALLI)
+def test_notti_disponibili_dagli_intervalli_coincidono_con_il_ciclo_originale(start_date, end_date):
+    foglio = _foglio_disponibilita()
+
+    atteso = _notti_originali(foglio, start_date, end_date)
+
+    pd.testing.assert_frame_equal(calculate_available_nigths(foglio, start_date, end_date), atteso)
+    pd.testing.assert_frame_equal(
+        calculate_available_nigths(costruisci_intervalli(foglio), start_date, end_date), atteso)
+
+
+@pytest.mark.parametrize('start_date, end_date', INTERVALLI)
+def test_notti_disponibili_dalle_somme_cumulate_coincidono_con_il_ciclo_originale(start_date, end_date):
+    foglio = _foglio_disponibilita()
+    giornaliera = costruisci_disponibilita_giornaliera(costruisci_intervalli(foglio))
+
+    pd.testing.assert_frame_equal(calculate_available_nigths(giornaliera, start_date, end_date),
+                                  _notti_originali(foglio, start_date, end_date))
+
+
+def test_notti_per_periodo_coincidono_con_il_ciclo_originale():
+    foglio = _foglio_disponibilita()
+    giornaliera = costruisci_disponibilita_giornaliera(costruisci_intervalli(foglio))
+    inizi = pd.date_range('2022-11-01', '2025-02-01', freq='MS')
+    fini = inizi + pd.offsets.MonthEnd(0)
+    appartamenti = ['Apt 3', 'Apt 17', 'Apt 42']
+
+    for selezione in (None, appartamenti):
+        righe = foglio if selezione is None else foglio[foglio['Appartamento'].isin(selezione)]
+        attese = [_notti_originali(righe, inizio, fine)['Notti Disponibili'].sum() for inizio, fine in zip(inizi, fini)]
+        assert notti_per_periodo(giornaliera, inizi, fini, selezione).tolist() == attese
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from notti_prenotazioni import somma_notti_per_periodo
+from periodi import GRANULARITA
+
+INTERVALLI = [
+    (None, None),
+    (pd.Timestamp('2023-03-05'), pd.Timestamp('2023-09-17')),
+    (pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-12')),
+]
+
+
+def _somma_con_to_period(notti, dati_filtrati, freq, colonne, start_date, end_date):
+    """
+    Calcolo di riferimento con pandas to_period sui giorni delle notti selezionate, senza codici precalcolati.
+    """
+    tabella = notti.tabella
+    selezionate = tabella['prenotazione'].isin(notti.indice.get_indexer(dati_filtrati.index))
+    giorni = pd.to_datetime(tabella['giorno'], unit='D')
+    if start_date is not None:
+        selezionate &= giorni >= start_date
+    if end_date is not None:
+        selezionate &= giorni <= end_date
+    periodi = giorni[selezionate].dt.to_period(freq)
+
+    righe = tabella[selezionate].assign(Periodo=periodi.dt.start_time, **{'Fine Periodo': periodi.dt.end_time.dt.normalize()})
+    risultato = righe.groupby('Periodo').agg(
+        **{'Fine Periodo': ('Fine Periodo', 'max'), 'Notti Occupate': ('Notti Occupate', 'sum')},
+        **{col: (col, lambda valori: valori.astype('float64').sum()) for col in colonne},
+    ).reset_index()
+    return risultato.astype({'Notti Occupate': 'int64'})
+
+
+@pytest.mark.parametrize('freq', list(GRANULARITA))
+@pytest.mark.parametrize('start_date, end_date', INTERVALLI)
+def test_somma_notti_per_periodo_coincide_con_to_period(workbook, freq, start_date, end_date):
+    colonne = ['ricavi_totali', 'marginalità_totale']
+    for dati in (workbook.prenotazioni, workbook.prenotazioni.iloc[::3]):
+        atteso = _somma_con_to_period(workbook.notti, dati, freq, colonne, start_date, end_date)
+        ottenuto = somma_notti_per_periodo(workbook.notti, dati, freq, colonne, start_date, end_date)
+        pd.testing.assert_frame_equal(ottenuto, atteso, check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+def test_notti_e_importi_ripartiti_sommano_ai_totali(workbook):
+    prenotazioni = workbook.prenotazioni
+    risultato = somma_notti_per_periodo(workbook.notti, prenotazioni, 'M', ['ricavi_totali'])
+
+    assert risultato['Notti Occupate'].sum() == prenotazioni['Durata Soggiorno'].sum()
+    assert risultato['ricavi_totali'].sum() == pytest.approx(prenotazioni['ricavi_totali'].sum(), rel=1e-6)
+    # Almeno un soggiorno a cavallo di due mesi viene diviso tra i due
+    check_out = prenotazioni['Data Check-In'] + pd.to_timedelta(prenotazioni['Durata Soggiorno'] - 1, unit='D')
+    assert (prenotazioni['Data Check-In'].dt.month != check_out.dt.month).any()
+
+
+def test_granularita_non_supportata(workbook):
+    with pytest.raises(ValueError):
+        somma_notti_per_periodo(workbook.notti, workbook.prenotazioni, 'W')
+
+
+def test_calendario_copre_i_giorni_delle_notti(workbook):
+    giorni = workbook.notti.tabella['giorno'].to_numpy()
+    calendario = workbook.notti.calendario
+    for freq in GRANULARITA:
+        periodi = calendario.periodi(freq)
+        codici = calendario.codici(freq, giorni)
+        inizi = periodi.inizi[codici].astype('datetime64[D]').astype('int64')
+        fini = periodi.fini[codici].astype('datetime64[D]').astype('int64')
+        assert np.all((inizi <= giorni) & (giorni <= fini))
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpis import COLONNE_BLOCCO, calculate_kpis, deriva_kpi
+from scenari import parametri_storici, tabella_pareggio, valuta_scenari
+from selezioni import filtra_come_dashboard
+
+OCCUPAZIONE = [0, 35, 60, 85, 100]
+PREZZO_NOTTE = [40, 85, 150]
+PREZZO_PULIZIE = [0, 45, 80]
+COMMISSIONE_OTA = [0, 15, 18]
+COSTI_FISSI = [0, 4000, 12000, 40000]
+
+
+def _margine_da_deriva_kpi(occupazione, prezzo_notte, prezzo_pulizie, commissione_ota, costi_fissi,
+                           notti_disponibili, soggiorno_medio, quota_proprietari):
+    """
+    Riferimento: somme di un anno di prenotazioni dello scenario passate alle formule dei KPI.
+    """
+    notti = occupazione / 100 * notti_disponibili
+    soggiorni = notti / soggiorno_medio
+    somme = dict.fromkeys(COLONNE_BLOCCO, 0.0)
+    somme.update({
+        'Ricavi Locazione': notti * prezzo_notte,
+        'Ricavi Pulizie': soggiorni * prezzo_pulizie,
+        'Commissioni OTA': commissione_ota / 100 * (notti * prezzo_notte + soggiorni * prezzo_pulizie),
+        'Commissioni Proprietari Lorde': quota_proprietari * notti * prezzo_notte,
+        'Notti Occupate': notti,
+        'numero_prenotazioni': 1,
+    })
+    somme = {col: np.float64(valore) for col, valore in somme.items()}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        marginalità = deriva_kpi(somme, notti_disponibili)['marginalità_totale']
+    # Senza ricavi la quota delle commissioni OTA sulle locazioni è 0 / 0: nessun margine
+    return (0.0 if np.isnan(marginalità) else marginalità) - costi_fissi
+
+
+def test_margine_della_griglia_coincide_con_le_formule_dei_kpi():
+    griglia = valuta_scenari(OCCUPAZIONE, PREZZO_NOTTE, PREZZO_PULIZIE, COMMISSIONE_OTA, COSTI_FISSI,
+                             notti_disponibili=330, soggiorno_medio=3.5, quota_proprietari=0.2)
+
+    assert griglia.margine.shape == (5, 3, 3, 3, 4)
+    for indici in np.ndindex(griglia.margine.shape):
+        valori = [asse[i] for asse, i in zip(
+            (OCCUPAZIONE, PREZZO_NOTTE, PREZZO_PULIZIE, COMMISSIONE_OTA, COSTI_FISSI), indici)]
+        assert griglia.margine[indici] == pytest.approx(_margine_da_deriva_kpi(*valori, 330, 3.5, 0.2)), indici
+
+
+def test_occupazione_di_pareggio_annulla_il_margine():
+    griglia = valuta_scenari(OCCUPAZIONE, PREZZO_NOTTE, PREZZO_PULIZIE, COMMISSIONE_OTA, COSTI_FISSI,
+                             notti_disponibili=330, soggiorno_medio=3.5, quota_proprietari=0.2)
+
+    for indici in np.ndindex(griglia.pareggio.shape):
+        valori = [asse[i] for asse, i in zip((PREZZO_NOTTE, PREZZO_PULIZIE, COMMISSIONE_OTA, COSTI_FISSI), indici)]
+        pareggio = griglia.pareggio[indici]
+        if np.isnan(pareggio):
+            # Pareggio non raggiungibile: nessun margine positivo neanche al 100% di occupazione
+            assert _margine_da_deriva_kpi(100, *valori, 330, 3.5, 0.2) <= 1e-9
+        else:
+            assert 0 <= pareggio <= 100
+            assert _margine_da_deriva_kpi(pareggio, *valori, 330, 3.5, 0.2) == pytest.approx(0, abs=1e-6)
+
+    tabella = tabella_pareggio(griglia, 1, 2)
+    assert tabella.shape == (len(PREZZO_NOTTE), len(COSTI_FISSI))
+    np.testing.assert_array_equal(tabella.to_numpy(), griglia.pareggio[:, 1, 2, :])
+
+
+def test_parametri_storici_riproducono_la_marginalita_dei_kpi(workbook):
+    dati, notti = filtra_come_dashboard(workbook, pd.Timestamp('2023-01-01'), pd.Timestamp('2023-12-31'), None, None)
+    kpis = calculate_kpis(dati, notti)
+    parametri = parametri_storici(kpis)
+
+    griglia = valuta_scenari(
+        [parametri['occupazione']], [parametri['prezzo_notte']], [parametri['prezzo_pulizie']],
+        [parametri['commissione_ota']], [0], notti_disponibili=kpis.notti_disponibili,
+        soggiorno_medio=parametri['soggiorno_medio'], quota_proprietari=parametri['quota_proprietari'],
+    )
+
+    assert griglia.margine.item() == pytest.approx(kpis.marginalità_totale)
@@ -0,0 +1,92 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import simulazione
+from kpis import calculate_kpis
+from scenari import valuta_scenari
+from selezioni import filtra_come_dashboard
+from simulazione import ParametriSimulazione, simula_margine, stima_parametri
+
+# Distribuzioni concentrate su un solo scenario: occupazione 60%, 90 €/notte, pulizie 50 €,
+# OTA 15%, soggiorno di 3 notti, proprietari 20%, costi fissi 6000 €
+SCENARIO = ParametriSimulazione(
+    occupazione_alfa=6e9, occupazione_beta=4e9, prezzo_mu=np.log(90), prezzo_sigma=0.0,
+    soggiorno_media=3.0, soggiorno_dev=0.0, pulizie_media=50.0, pulizie_dev=0.0, ota_media=15.0, ota_dev=0.0,
+    proprietari_media=0.2, proprietari_dev=0.0, costi_fissi_media=6000.0, costi_fissi_dev=0.0, notti_anno=330,
+)
+
+PARAMETRI = ParametriSimulazione(
+    occupazione_alfa=6.0, occupazione_beta=4.0, prezzo_mu=np.log(90), prezzo_sigma=0.25,
+    soggiorno_media=3.0, soggiorno_dev=0.8, pulizie_media=50.0, pulizie_dev=10.0, ota_media=15.0, ota_dev=3.0,
+    proprietari_media=0.2, proprietari_dev=0.05, costi_fissi_media=6000.0, costi_fissi_dev=500.0,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_vuota():
+    simula_margine.cache_clear()
+    yield
+    simula_margine.cache_clear()
+
+
+def test_scenario_senza_dispersione_coincide_con_la_griglia_degli_scenari():
+    atteso = valuta_scenari([60], [90], [50], [15], [6000], notti_disponibili=330,
+                            soggiorno_medio=3.0, quota_proprietari=0.2).margine.item()
+
+    risultato = simula_margine(SCENARIO, prove=2000)
+
+    np.testing.assert_allclose(risultato.percentili.to_numpy(), atteso, rtol=1e-3)
+    assert risultato.media == pytest.approx(atteso, rel=1e-3)
+    assert risultato.probabilita_perdita == (1.0 if atteso < 0 else 0.0)
+
+
+def test_simulazione_riproducibile_con_lo_stesso_seme():
+    primo = simula_margine(PARAMETRI, prove=20_000, seme=7)
+    simula_margine.cache_clear()
+    secondo = simula_margine(PARAMETRI, prove=20_000, seme=7)
+
+    assert primo is not secondo
+    pd.testing.assert_series_equal(primo.percentili, secondo.percentili)
+    np.testing.assert_array_equal(primo.conteggi, secondo.conteggi)
+    assert simula_margine(PARAMETRI, prove=20_000, seme=7) is secondo
+    assert not simula_margine(PARAMETRI, prove=20_000, seme=8).percentili.equals(primo.percentili)
+    assert list(primo.percentili) == sorted(primo.percentili)
+
+
+class _EsecutoreInterrotto:
+    def map(self, *argomenti):
+        raise BrokenProcessPool('processo terminato')
+
+
+def test_processi_interrotti_proseguono_nel_processo_corrente(monkeypatch):
+    monkeypatch.setattr(simulazione, 'PROVE_PER_BLOCCO', 5000)
+    # Riferimento: gli stessi blocchi con gli stessi semi, simulati uno alla volta
+    semi = np.random.SeedSequence(3).spawn(4)
+    margini = np.concatenate([simulazione._simula_blocco(PARAMETRI, 5000, seme) for seme in semi])
+
+    scartati = []
+    monkeypatch.setattr(simulazione, '_esecutore', _EsecutoreInterrotto)
+    monkeypatch.setattr(simulazione, '_scarta_esecutore', lambda: scartati.append(True))
+    risultato = simula_margine(PARAMETRI, prove=20_000, seme=3)
+
+    assert scartati == [True]
+    np.testing.assert_allclose(risultato.percentili.to_numpy(), np.percentile(margini, simulazione.PERCENTILI))
+    assert risultato.media == pytest.approx(margini.mean())
+    assert risultato.probabilita_perdita == (margini < 0).mean()
+
+
+def test_stima_parametri_dagli_appartamenti_della_zona(workbook):
+    dati, notti = filtra_come_dashboard(workbook, pd.Timestamp('2023-01-01'), pd.Timestamp('2023-12-31'), None, None)
+
+    parametri = stima_parametri(dati, notti, 'Zona 1', costi_fissi=5000)
+
+    comparabili = dati[dati['zona'] == 'Zona 1']
+    soggiorni = [calculate_kpis(gruppo, notti[notti['Appartamento'] == nome]).soggiorno_medio
+                 for nome, gruppo in comparabili.groupby('Nome Appartamento', observed=True)]
+    assert parametri.comparabili == len(soggiorni)
+    assert parametri.soggiorno_media == pytest.approx(np.mean(soggiorni))
+    assert parametri.soggiorno_dev == pytest.approx(np.std(soggiorni, ddof=1))
+    assert parametri.costi_fissi_media == 5000 and parametri.notti_anno == 365
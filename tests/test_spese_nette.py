@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from spese_nette import CODICE_IVA, normalizza_spese, totali_per_settore
+
+
+def _spese_nette_riga_per_riga(spese):
+    """
+    Abbinamento di riferimento, una riga alla volta: ogni spesa somma l'importo delle righe IVA
+    che la seguono fino alla spesa successiva; le righe IVA prima della prima spesa sono ignorate.
+    """
+    voci = []
+    for posizione, (codice, importo, totale, settore) in enumerate(
+            spese[['Codice', 'Importo', 'Importo Totale', 'Settore di spesa']].itertuples(index=False)):
+        if codice != CODICE_IVA:
+            voci.append({'riga': posizione, 'Settore di spesa': settore, 'lordo': totale, 'iva': 0.0, 'righe_iva': 0})
+        elif voci:
+            voci[-1]['iva'] += 0.0 if pd.isna(importo) else importo
+            voci[-1]['righe_iva'] += 1
+    tabella = pd.DataFrame(voci)
+    tabella['netto'] = tabella['lordo'] - tabella['iva']
+    return tabella
+
+
+def test_normalizza_spese_coincide_con_abbinamento_riga_per_riga(workbook):
+    atteso = _spese_nette_riga_per_riga(workbook.spese)
+    ottenuto = normalizza_spese(workbook.spese)
+
+    assert len(ottenuto) == len(atteso)
+    np.testing.assert_array_equal(ottenuto['riga'], atteso['riga'])
+    np.testing.assert_array_equal(ottenuto['righe_iva'], atteso['righe_iva'])
+    for colonna in ['lordo', 'iva', 'netto']:
+        np.testing.assert_allclose(ottenuto[colonna], atteso[colonna])
+    # Le spese con più righe IVA sono presenti nell'export di prova
+    assert (ottenuto['righe_iva'] > 1).any()
+
+
+def test_totali_per_settore(workbook):
+    atteso = _spese_nette_riga_per_riga(workbook.spese).groupby('Settore di spesa')[['lordo', 'iva', 'netto']].sum()
+    ottenuto = totali_per_settore(workbook.spese_nette).set_index('Settore di spesa')
+
+    assert set(ottenuto.index) == set(atteso.index)
+    for settore in atteso.index:
+        assert ottenuto.loc[settore, 'Totale Spese'] == pytest.approx(atteso.loc[settore, 'lordo'])
+        assert ottenuto.loc[settore, 'Totale IVA'] == pytest.approx(atteso.loc[settore, 'iva'])
+        assert ottenuto.loc[settore, 'totale_netto'] == pytest.approx(atteso.loc[settore, 'netto'])
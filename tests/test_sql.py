@@ -0,0 +1,72 @@
+from dataclasses import fields
+
+import pytest
+
+from kpis import KPI, calculate_kpis
+from selezioni import filtra_come_dashboard, selezioni_casuali
+from sql_queries import calculate_kpis_sql
+from sql_storage import database_workbook
+
+SELEZIONI = 150
+
+
+def test_calculate_kpis_sql_coincide_con_calculate_kpis(workbook, tmp_path):
+    conn = database_workbook(workbook, cartella=tmp_path)
+    campi = [campo.name for campo in fields(KPI)]
+    # Le selezioni includono filtri di zona, con e senza appartamenti
+    for start_date, end_date, immobili, zone in selezioni_casuali(workbook, SELEZIONI, seme=2):
+        dati, notti = filtra_come_dashboard(workbook, start_date, end_date, immobili, zone)
+        atteso = calculate_kpis(dati, notti)
+        ottenuto = calculate_kpis_sql(conn, start_date, end_date, immobili, zone)
+        for campo in campi:
+            assert getattr(ottenuto, campo) == pytest.approx(getattr(atteso, campo), rel=1e-9, abs=1e-6, nan_ok=True), (
+                campo, start_date, end_date, immobili, zone
+            )
+
+
+def test_workbook_diversi_non_condividono_il_database(workbook, crea_workbook, tmp_path):
+    start_date, end_date = workbook.prenotazioni['Data Check-In'].agg(['min', 'max'])
+    primo = database_workbook(workbook, cartella=tmp_path)
+    atteso = calculate_kpis_sql(primo, start_date, end_date)
+
+    # Un'altra sessione carica un workbook diverso dopo la prima
+    altro = crea_workbook(seme=1)
+    secondo = database_workbook(altro, cartella=tmp_path)
+
+    assert calculate_kpis_sql(primo, start_date, end_date) == atteso
+    assert calculate_kpis_sql(secondo, start_date, end_date).numero_prenotazioni == len(
+        altro.prenotazioni[altro.prenotazioni['Data Check-In'].between(start_date, end_date)]
+    )
+    chiavi = {riga[0] for riga in primo.execute('SELECT "ID Appartamento" || "Data Check-In" FROM prenotazioni')}
+    chiavi_altro = {riga[0] for riga in secondo.execute('SELECT "ID Appartamento" || "Data Check-In" FROM prenotazioni')}
+    assert chiavi != chiavi_altro
+    assert len(list(tmp_path.glob('*.sqlite'))) == 2
+
+
+def test_stesso_workbook_stesso_database_in_sola_lettura(workbook, tmp_path):
+    database_workbook(workbook, cartella=tmp_path)
+    conn = database_workbook(workbook, cartella=tmp_path)
+
+    assert len(list(tmp_path.glob('*.sqlite'))) == 1
+    with pytest.raises(Exception, match='readonly'):
+        conn.execute('DELETE FROM prenotazioni')
+
+
+@pytest.mark.parametrize('filtro, indice', [
+    ({'appartamenti': ['Apt 3']}, 'idx_prenotazioni_appartamento_check_in'),
+    ({'zone': ['Zona 2']}, 'idx_prenotazioni_zona_check_in'),
+])
+def test_filtri_usano_gli_indici(workbook, tmp_path, filtro, indice):
+    conn = database_workbook(workbook, cartella=tmp_path)
+    piani = []
+
+    class Spia:
+        def execute(self, query, parametri):
+            piani.extend(riga[-1] for riga in conn.execute('EXPLAIN QUERY PLAN ' + query, parametri))
+            return conn.execute(query, parametri)
+
+        def create_function(self, *args, **kwargs):
+            conn.create_function(*args, **kwargs)
+
+    calculate_kpis_sql(Spia(), '2023-01-01', '2023-06-30', **filtro)
+    assert any(f'USING INDEX {indice}' in piano for piano in piani)
@@ -0,0 +1,281 @@
+import hashlib
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import pandas as pd
+
+from calculate_available_nights import costruisci_disponibilita_giornaliera, costruisci_intervalli, \
+    elabora_disponibilita
+from centesimi import costruisci_centesimi
+from data_processing import COLONNE_DATA, COLONNE_NUMERICHE, COLONNE_PRENOTAZIONI, calcola_colonne_derivate, \
+    converti_colonne_prenotazioni, elabora_posizioni, elabora_spese, preprocess_data, unisci_posizioni
+from indice_date import costruisci_indice
+from kpi_cube import costruisci_cubo
+from motori_lettura import apri_fogli, indici_colonne
+from spese_nette import normalizza_spese
+from notti_prenotazioni import costruisci_notti
+from schema import applica_schema
+
+# Colonne lette da ogni foglio (stesse lettere usate da load_and_preprocess_data e carica_elaboara_spese)
+LETTERE_PRENOTAZIONI = "B,C,D,G,H,I,J,O,P,Q,R,U,V,W,X,AA,AB,AC,AJ,AK,AL"
+LETTERE_SPESE = "B,D,E,F,I,J,K"
+
+# Righe del Foglio 1 convertite per volta in modalità streaming
+DIMENSIONE_BLOCCO = 5000
+
+
+@dataclass
+class DatiWorkbook:
+    """
+    Contenuto del workbook caricato, già elaborato foglio per foglio.
+    """
+    prenotazioni: pd.DataFrame   # Foglio 1, già unito alle posizioni (localizzatore)
+    disponibilita: pd.DataFrame  # Foglio 2, periodi di disponibilità per appartamento
+    posizioni: pd.DataFrame      # Foglio 3, posizione e costi per soggiorno
+    spese: pd.DataFrame          # Foglio 4, spese con righe IVA
+    # Righe Excel con valori non convertibili, per foglio e colonna (non salvate in cache)
+    righe_non_valide: dict = field(default_factory=dict)
+    # Memoria delle prenotazioni prima e dopo applica_schema, in byte (non salvata in cache)
+    memoria: dict = field(default_factory=dict)
+    # Motore usato per la lettura ('calamine', 'openpyxl', 'pyxlsb', 'csv' o 'cache') e secondi impiegati
+    motore: str = ''
+    tempo_lettura: float = 0.0
+    # Impronte delle righe per l'aggiornamento incrementale (incremental_ingestion.Impronte, non salvate in cache)
+    impronte: object = None
+
+    @cached_property
+    def intervalli(self):
+        """
+        Periodi di disponibilità in formato lungo, calcolati una sola volta per workbook
+        (vedi calculate_available_nights.costruisci_intervalli).
+        """
+        return costruisci_intervalli(self.disponibilita)
+
+    @cached_property
+    def disponibilita_giornaliera(self):
+        """
+        Matrice appartamenti × giorni della disponibilità con le somme cumulate, calcolata una sola
+        volta per workbook (vedi calculate_available_nights.costruisci_disponibilita_giornaliera).
+        """
+        return costruisci_disponibilita_giornaliera(self.intervalli)
+
+    @cached_property
+    def notti(self):
+        """
+        Notti occupate delle prenotazioni con gli importi ripartiti per notte, calcolate una sola
+        volta per workbook (vedi notti_prenotazioni.costruisci_notti).
+        """
+        return costruisci_notti(self.prenotazioni)
+
+    @cached_property
+    def cubo(self):
+        """
+        Cubo dei KPI per appartamento, zona, proprietario, OTA e mese, calcolato una sola
+        volta per workbook (vedi kpi_cube.costruisci_cubo).
+        """
+        return costruisci_cubo(self.prenotazioni)
+
+    @cached_property
+    def indice_date(self):
+        """
+        Prenotazioni ordinate per check-in con le somme cumulate dei KPI, calcolate una sola
+        volta per workbook (vedi indice_date.costruisci_indice).
+        """
+        return costruisci_indice(self.prenotazioni)
+
+    @cached_property
+    def spese_nette(self):
+        """
+        Spese con lordo, IVA e netto (una riga per spesa), calcolate una sola volta per
+        workbook (vedi spese_nette.normalizza_spese).
+        """
+        return normalizza_spese(self.spese)
+
+    @cached_property
+    def centesimi(self):
+        """
+        Importi delle prenotazioni in centesimi int64 con gli scorpori IVA per riga, calcolati
+        una sola volta per workbook e solo se richiesti (vedi centesimi.costruisci_centesimi).
+        """
+        return costruisci_centesimi(self.prenotazioni)
+
+    @cached_property
+    def impronta(self):
+        """
+        SHA-256 del contenuto dei quattro fogli (colonne, indice e valori), calcolato una sola volta
+        per workbook: identifica il database SQL del workbook (vedi sql_storage.database_workbook).
+        """
+        impronta = hashlib.sha256()
+        for frame in (self.prenotazioni, self.disponibilita, self.posizioni, self.spese):
+            impronta.update(repr(list(frame.columns)).encode())
+            impronta.update(pd.util.hash_pandas_object(frame).to_numpy().tobytes())
+        return impronta.hexdigest()
+
+
+def carica_workbook(uploaded_file, streaming=False, dimensione_blocco=DIMENSIONE_BLOCCO, formato=None, motore=None):
+    """
+    Apre il file una sola volta e legge i quattro fogli in un'unica passata.
+
+    Sostituisce le letture separate di load_and_preprocess_data, calculate_available_nigths,
+    localizzatore e carica_elaboara_spese, applicando le stesse elaborazioni.
+    Il motore di lettura è scelto da motori_lettura.apri_fogli: calamine se installato,
+    pyxlsb per i file xlsb, openpyxl altrimenti; gli export CSV sono un file per foglio.
+
+    Parametri:
+        uploaded_file: percorso o file caricato (st.file_uploader) in formato xlsx, xlsm o xlsb,
+                       oppure lista di file CSV (uno per foglio).
+        streaming (bool): legge il Foglio 1 a blocchi di dimensione_blocco righe, convertendo
+                          ogni blocco direttamente in colonne numeriche e data. La memoria usata
+                          resta limitata anche per export con centinaia di migliaia di prenotazioni.
+        dimensione_blocco (int): righe convertite per volta in modalità streaming.
+        formato (str): formato del file, se None ricavato dal nome (vedi motori_lettura.formato_file).
+        motore (str): motore preferito (vedi motori_lettura.scegli_motore).
+
+    Ritorna:
+        DatiWorkbook con i DataFrame dei quattro fogli, il motore usato e il tempo di lettura.
+    """
+    inizio = time.perf_counter()
+    anomalie = {'Prenotazioni': {}, 'Spese': {}}
+    with apri_fogli(uploaded_file, formato, motore) as (motore, fogli):
+        if streaming:
+            grezzi = fogli_grezzi(fogli, prenotazioni=False)
+            prenotazioni = _leggi_prenotazioni_a_blocchi(fogli[0], dimensione_blocco, anomalie['Prenotazioni'])
+        else:
+            grezzi = fogli_grezzi(fogli)
+            prenotazioni = preprocess_data(grezzi['prenotazioni'], anomalie['Prenotazioni'])
+
+    posizioni = elabora_posizioni(grezzi['posizioni'])
+    prenotazioni, memoria = applica_schema(unisci_posizioni(prenotazioni, posizioni))
+
+    return DatiWorkbook(
+        prenotazioni=prenotazioni,
+        disponibilita=elabora_disponibilita(grezzi['disponibilita']),
+        posizioni=posizioni,
+        spese=elabora_spese(grezzi['spese'], anomalie['Spese']).reset_index(drop=True),
+        righe_non_valide={foglio: righe for foglio, righe in anomalie.items() if righe},
+        memoria=memoria,
+        motore=motore,
+        tempo_lettura=time.perf_counter() - inizio,
+    )
+
+
+def fogli_grezzi(fogli, prenotazioni=True):
+    """
+    Legge i fogli aperti con motori_lettura.apri_fogli come DataFrame non ancora elaborati.
+
+    Prenotazioni e spese contengono solo le colonne usate (LETTERE_PRENOTAZIONI, LETTERE_SPESE)
+    come testo; disponibilità e posizioni mantengono i valori delle celle.
+
+    Parametri:
+        fogli (list): righe dei fogli, come fornite da apri_fogli.
+        prenotazioni (bool): se False il Foglio 1 non viene letto (lettura a blocchi).
+
+    Ritorna:
+        dict con i DataFrame 'prenotazioni' (se letto), 'disponibilita', 'posizioni', 'spese'.
+    """
+    if len(fogli) < 4:
+        raise ValueError(f"Il file contiene {len(fogli)} fogli, ne servono 4.")
+
+    grezzi = {
+        'disponibilita': _righe_to_frame(_leggi_righe(fogli[1])),
+        'posizioni': _righe_to_frame(_leggi_righe(fogli[2])),
+        'spese': _righe_to_frame(_leggi_righe(fogli[3]), LETTERE_SPESE, come_testo=True),
+    }
+    if prenotazioni:
+        grezzi['prenotazioni'] = _righe_to_frame(_leggi_righe(fogli[0]), LETTERE_PRENOTAZIONI, come_testo=True)
+    return grezzi
+
+
+def _leggi_prenotazioni_a_blocchi(righe, dimensione_blocco, anomalie=None):
+    """
+    Legge il Foglio 1 riga per riga e converte ogni blocco di righe in colonne tipizzate.
+
+    Le righe non vengono mai accumulate come testo: in memoria restano solo il blocco
+    corrente e i blocchi già convertiti (numeri float64 e date datetime64).
+    """
+    indici = indici_colonne(LETTERE_PRENOTAZIONI)
+
+    # La prima riga è l'intestazione
+    righe = iter(righe)
+    next(righe, None)
+    blocchi = []
+    blocco = []
+    inizio = 0
+    for riga in righe:
+        blocco.append(tuple(riga[i] if i < len(riga) else None for i in indici))
+        if len(blocco) == dimensione_blocco:
+            blocchi.append(_converti_blocco_prenotazioni(blocco, inizio, anomalie))
+            inizio += len(blocco)
+            blocco = []
+    if blocco or not blocchi:
+        blocchi.append(_converti_blocco_prenotazioni(blocco, inizio, anomalie))
+
+    return calcola_colonne_derivate(pd.concat(blocchi, ignore_index=True), anomalie)
+
+
+def _converti_blocco_prenotazioni(blocco, inizio, anomalie=None):
+    """
+    Converte un blocco di righe del Foglio 1 in un DataFrame con date e importi già tipizzati.
+
+    L'indice parte da `inizio`, così le righe non convertibili sono riportate con il numero
+    di riga del foglio.
+    """
+    data = pd.DataFrame(blocco, columns=COLONNE_PRENOTAZIONI, dtype=object,
+                        index=pd.RangeIndex(inizio, inizio + len(blocco)))
+    data = data.dropna(subset=['ID Appartamento'])
+    data = converti_colonne_prenotazioni(data, anomalie)
+
+    # Le celle di testo restano stringhe, come nella lettura con dtype=str
+    for col in data.columns.difference(COLONNE_DATA + COLONNE_NUMERICHE):
+        data[col] = data[col].map(lambda v: str(v) if v is not None else None)
+    return data
+
+
+def _leggi_righe(foglio):
+    """
+    Legge tutte le righe di un foglio (vedi motori_lettura.apri_fogli), eliminando le righe vuote finali.
+    """
+    righe = list(foglio)
+    while righe and all(valore is None for valore in righe[-1]):
+        righe.pop()
+    return righe
+
+
+def _righe_to_frame(righe, usecols=None, come_testo=False):
+    """
+    Costruisce un DataFrame dalle righe di un foglio, usando la prima riga come intestazione.
+
+    Parametri:
+        righe (list): righe del foglio come restituite da _leggi_righe.
+        usecols (str): lettere delle colonne da tenere (es. "B,D,E"), come in pd.read_excel.
+        come_testo (bool): converte i valori in stringa, come dtype=str in pd.read_excel.
+    """
+    if not righe:
+        return pd.DataFrame()
+
+    larghezza = max(len(riga) for riga in righe)
+    righe = [tuple(riga) + (None,) * (larghezza - len(riga)) for riga in righe]
+    intestazione, corpo = righe[0], righe[1:]
+
+    if usecols is not None:
+        indici = indici_colonne(usecols)
+        corpo = [tuple(riga[i] if i < larghezza else None for i in indici) for riga in corpo]
+        intestazione = [intestazione[i] if i < larghezza else None for i in indici]
+
+    # Intestazioni come in pd.read_excel: stringhe, "Unnamed: i" se vuote, duplicati numerati (".1", ".2")
+    colonne = []
+    for i, nome in enumerate(intestazione):
+        nome = str(nome) if nome is not None else f"Unnamed: {i}"
+        base, k = nome, 0
+        while nome in colonne:
+            k += 1
+            nome = f"{base}.{k}"
+        colonne.append(nome)
+    frame = pd.DataFrame(corpo, columns=colonne, dtype=object)
+
+    if come_testo:
+        frame = frame.apply(lambda col: col.map(lambda v: str(v) if v is not None else None))
+    else:
+        frame = frame.infer_objects()
+    return frame